@@ -1,20 +1,78 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import time
+_T0 = time.perf_counter()
+
 import subprocess
 import sys
 import os
-import psutil
-import requests
-import time
 import threading
 import socket
 from typing import Optional, List
 from datetime import datetime
 import pty
-import glob
 import shutil
 import re
+import json
+import hashlib
+import importlib
+import importlib.util
+import codecs
+import gzip
+import zlib
+import mmap
+import fcntl
+import multiprocessing
+import zipfile
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JarIndex lee mods.toml con `_mods_toml`
+    tomllib = None
+import queue
+import select
+import signal
+import termios
+import struct
+from collections import deque
+import argparse
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+class LazyModule:
+    """Importa el módulo real la primera vez que se usa uno de sus atributos.
+
+    Mantiene fuera del camino de arranque las dependencias pesadas (requests,
+    psutil, inquirer...). Si el import falla se reinstalan las dependencias
+    una vez y se reintenta.
+    """
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+    
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            name = self.__dict__["_name"]
+            start = time.perf_counter()
+            try:
+                module = importlib.import_module(name)
+            except ImportError:
+                ensure_dependencies(force=True)
+                module = importlib.import_module(name)
+            Startup.record(f"import {name}", time.perf_counter() - start)
+            self.__dict__["_module"] = module
+        return module
+    
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+psutil = LazyModule("psutil")
+requests = LazyModule("requests")
+asyncio = LazyModule("asyncio")
+ET = LazyModule("xml.etree.ElementTree")
+inquirer = LazyModule("inquirer")
 
 # =====================================================
 # CONFIGURACIÓN Y CONSTANTES
@@ -37,7 +95,8 @@ C = Colors()
 
 class Config:
     BASE_DIR = os.path.abspath("Minecraft-servers")
-    MC_PORT = 9005  # Cambiado de 25565 a 9005
+    CACHE_DIR = os.path.join(BASE_DIR, ".cache")  # Datos internos (no es un servidor)
+    MC_PORT = 9005  # Primer puerto que se asigna; cada servidor tiene el suyo en server.properties
     VERSION = "2.3"
     
     SERVER_TYPES = {
@@ -49,7 +108,28 @@ class Config:
         "Mohist": {"desc": "Mods+Plugins", "icon": "🔥", "color": C.RED},
     }
 
-os.makedirs(Config.BASE_DIR, exist_ok=True)
+class Startup:
+    """Tiempos de cada fase del arranque, para `--profile-startup`."""
+    BUDGET_MS = 400  # Presupuesto de tiempo hasta el primer menú
+    
+    phases = []
+    
+    @classmethod
+    def record(cls, name: str, seconds: float):
+        cls.phases.append((name, seconds * 1000))
+    
+    @classmethod
+    @contextmanager
+    def phase(cls, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.record(name, time.perf_counter() - start)
+    
+    @classmethod
+    def elapsed_ms(cls) -> float:
+        return (time.perf_counter() - _T0) * 1000
 
 # =====================================================
 # UI COMPONENTS
@@ -70,7 +150,10 @@ class UI:
     
     @staticmethod
     def clear():
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            print("\033[2J\033[H", end="", flush=True)  # Sin lanzar un proceso `clear`
     
     @staticmethod
     def banner():
@@ -191,7 +274,7 @@ class Spinner:
 
 class Progress:
     @staticmethod
-    def bar(current: int, total: int, width: int = 32):
+    def bar(current: int, total: int, width: int = 32, rate: float = 0.0):
         if not total:
             return
         pct = min(current / total, 1.0)
@@ -199,27 +282,58 @@ class Progress:
         bar = "█" * filled + "░" * (width - filled)
         mb = current / 1048576
         total_mb = total / 1048576
-        print(f"\r  {C.CYAN}│{bar}│{C.RESET} {pct*100:5.1f}% {C.DIM}({mb:.1f}/{total_mb:.1f} MB){C.RESET}", end="", flush=True)
+        speed = f" {rate / 1048576:5.1f} MB/s" if rate else ""
+        print(f"\r  {C.CYAN}│{bar}│{C.RESET} {pct*100:5.1f}% {C.DIM}({mb:.1f}/{total_mb:.1f} MB){speed}{C.RESET}", end="", flush=True)
 
 # =====================================================
 # DEPENDENCIAS
 # =====================================================
 
-def ensure_dependencies():
-    pkgs = {"python-dotenv": "dotenv", "pytz": "pytz", "inquirer": "inquirer", "pyngrok": "pyngrok"}
-    for pkg, module in pkgs.items():
-        try:
-            __import__(module)
-        except ImportError:
-            subprocess.run([sys.executable, "-m", "pip", "install", pkg, "-q"],
-                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+def ensure_dependencies(force: bool = False):
+    """Instala los paquetes que falten.
 
-ensure_dependencies()
+    Tras una verificación completa deja una marca en la caché; mientras
+    coincidan intérprete y lista de paquetes, los siguientes arranques no
+    comprueban nada. `force` ignora la marca.
+    """
+    pkgs = {"python-dotenv": "dotenv", "pytz": "pytz", "inquirer": "inquirer", "pyngrok": "pyngrok",
+            "requests": "requests", "psutil": "psutil", "pyyaml": "yaml"}
+    stamp = f"{sys.executable} {sys.version.split()[0]} {','.join(sorted(pkgs))}"
+    marker = os.path.join(Config.CACHE_DIR, "deps-verified")
+    
+    if not force:
+        try:
+            with open(marker, encoding="utf-8") as f:
+                if f.read() == stamp:
+                    return
+        except OSError:
+            pass
+    
+    missing = [pkg for pkg, module in pkgs.items() if importlib.util.find_spec(module) is None]
+    if missing:
+        subprocess.run([sys.executable, "-m", "pip", "install", *missing, "-q"],
+                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        importlib.invalidate_caches()
+        if any(importlib.util.find_spec(pkgs[pkg]) is None for pkg in missing):
+            return  # Sin marca: se volverá a intentar en el próximo arranque
+    
+    try:
+        os.makedirs(Config.CACHE_DIR, exist_ok=True)
+        with open(marker, "w", encoding="utf-8") as f:
+            f.write(stamp)
+    except OSError:
+        pass
 
-import inquirer
-from pyngrok import ngrok, conf
-from dotenv import load_dotenv
-load_dotenv()
+def startup():
+    """Inicialización previa al primer menú."""
+    with Startup.phase("dependencias"):
+        ensure_dependencies()
+    with Startup.phase("dotenv"):
+        if importlib.util.find_spec("dotenv"):
+            from dotenv import load_dotenv
+            load_dotenv()
+    with Startup.phase("directorios"):
+        os.makedirs(Config.BASE_DIR, exist_ok=True)
 
 # ===================== Keep-Alive opcional =====================
 # Esta rutina está desactivada por defecto. Para activarla, exporta
@@ -250,8 +364,28 @@ def keep_codespace_alive(interval_minutes: int = 4, url: str = "https://www.gsta
 # UTILIDADES DE RED
 # =====================================================
 
+class HttpPool:
+    """Una sesión HTTP por host: las conexiones keep-alive se reutilizan entre peticiones."""
+    POOL_SIZE = 8
+    
+    _sessions = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def session(cls, url: str):
+        host = urlsplit(url).netloc
+        with cls._lock:
+            sess = cls._sessions.get(host)
+            if sess is None:
+                sess = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_SIZE)
+                sess.mount("http://", adapter)
+                sess.mount("https://", adapter)
+                cls._sessions[host] = sess
+            return sess
+
 class Network:
-    _port_released = False
+    _ports_released = set()
     
     @classmethod
     def is_port_busy(cls, port: int = Config.MC_PORT) -> bool:
@@ -260,43 +394,812 @@ class Network:
     
     @classmethod
     def release_port(cls, port: int = Config.MC_PORT):
-        if cls._port_released:
+        if port in cls._ports_released:
             return
         if cls.is_port_busy(port):
             subprocess.run(f"fuser -k {port}/tcp", shell=True,
                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             Log.info(f"Puerto {port} liberado")
-        cls._port_released = True
+        cls._ports_released.add(port)
     
     @staticmethod
-    def download(url: str, path: str) -> bool:
+    def status_ping(host: str, port: int = 25565, timeout: float = 5) -> Optional[float]:
+        """Ping de estado de Minecraft. Devuelve la latencia en ms o None si no responde."""
+        status = ServerListPing.status(host, port, timeout)
+        return status["latency_ms"] if status else None
+    
+    @staticmethod
+    def split_address(address: str, default_port: int = 25565) -> tuple:
+        host, _, port = address.rpartition(":")
+        if host and port.isdigit():
+            return host, int(port)
+        return address, default_port
+    
+    @staticmethod
+    def download(url: str, path: str, checksum: Optional[str] = None, quiet: bool = False) -> bool:
         try:
-            r = requests.get(url, stream=True, timeout=120)
-            r.raise_for_status()
-            total = int(r.headers.get('content-length', 0))
-            current = 0
-            
-            with open(path, 'wb') as f:
-                for chunk in r.iter_content(8192):
-                    current += len(chunk)
-                    f.write(chunk)
-                    Progress.bar(current, total)
-            print()
+            Downloader(url, path, checksum, quiet=quiet).run()
             return True
         except Exception as e:
             Log.error(f"Descarga fallida: {e}")
             return False
 
+class ServerListPing:
+    """Cliente del protocolo Server List Ping (handshake → estado → ping).
+
+    `query` es una corrutina para poder sondear muchos servidores a la vez
+    con `poll`; `status` es el atajo síncrono para un solo servidor. Las
+    peticiones se arman en un único buffer y la respuesta se lee de una vez
+    con `readexactly`, sin copias intermedias.
+    """
+    PROTOCOL = -1  # "Cualquiera": el servidor contesta con su propia versión
+    FORMAT_CODES = re.compile(r"§.")
+    
+    @staticmethod
+    def _varint(value: int, out: bytearray):
+        value &= 0xFFFFFFFF
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            out.append(byte | (0x80 if value else 0))
+            if not value:
+                return
+    
+    @staticmethod
+    def _decode_varint(buf, pos: int = 0) -> tuple:
+        value = 0
+        for i in range(5):
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7F) << (7 * i)
+            if not byte & 0x80:
+                return value, pos
+        raise ValueError("VarInt demasiado largo")
+    
+    @staticmethod
+    async def _read_varint(reader) -> int:
+        value = 0
+        for i in range(5):
+            byte = (await reader.readexactly(1))[0]
+            value |= (byte & 0x7F) << (7 * i)
+            if not byte & 0x80:
+                return value
+        raise ValueError("VarInt demasiado largo")
+    
+    @staticmethod
+    def request(host: str, port: int) -> bytes:
+        """Handshake (estado siguiente: 1) seguido de la petición de estado."""
+        addr = host.encode()
+        body = bytearray(b"\x00")
+        ServerListPing._varint(ServerListPing.PROTOCOL, body)
+        ServerListPing._varint(len(addr), body)
+        body += addr
+        body += struct.pack(">H", port)
+        body.append(1)
+        out = bytearray()
+        ServerListPing._varint(len(body), out)
+        out += body
+        out += b"\x01\x00"  # Petición de estado: longitud 1, id 0
+        return bytes(out)
+    
+    @staticmethod
+    def motd_text(description) -> str:
+        """Aplana un componente de chat (texto, dict con `extra` o lista) a texto plano."""
+        if isinstance(description, str):
+            text = description
+        elif isinstance(description, list):
+            text = "".join(ServerListPing.motd_text(d) for d in description)
+        elif isinstance(description, dict):
+            text = description.get("text", "") + "".join(
+                ServerListPing.motd_text(d) for d in description.get("extra", []))
+        else:
+            text = ""
+        return ServerListPing.FORMAT_CODES.sub("", text)
+    
+    @staticmethod
+    def _parse(payload: bytes) -> dict:
+        view = memoryview(payload)
+        packet_id, pos = ServerListPing._decode_varint(view)
+        if packet_id != 0x00:
+            raise ValueError(f"paquete inesperado {packet_id:#x}")
+        length, pos = ServerListPing._decode_varint(view, pos)
+        data = json.loads(bytes(view[pos:pos + length]))
+        players = data.get("players") or {}
+        version = data.get("version") or {}
+        return {
+            "online": players.get("online", 0),
+            "max": players.get("max", 0),
+            "players": [p.get("name", "") for p in players.get("sample") or []],
+            "version": version.get("name", ""),
+            "protocol": version.get("protocol"),
+            "motd": ServerListPing.motd_text(data.get("description", "")),
+        }
+    
+    @staticmethod
+    async def _query(host: str, port: int) -> dict:
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(ServerListPing.request(host, port))
+            await writer.drain()
+            length = await ServerListPing._read_varint(reader)
+            result = ServerListPing._parse(await reader.readexactly(length))
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            
+            # Ping/pong: mide solo el viaje de ida y vuelta. Algunos servidores
+            # cierran tras el estado; entonces vale la latencia del intercambio.
+            try:
+                start = time.perf_counter()
+                writer.write(b"\x09\x01" + struct.pack(">q", int(start * 1000)))
+                await writer.drain()
+                pong = await reader.readexactly(10)
+                if pong[1] == 0x01:
+                    result["latency_ms"] = (time.perf_counter() - start) * 1000
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            return result
+        finally:
+            writer.close()
+    
+    @staticmethod
+    async def query(host: str, port: int = 25565, timeout: float = 5) -> Optional[dict]:
+        """Estado del servidor (jugadores, versión, MOTD, latency_ms) o None si no responde."""
+        try:
+            return await asyncio.wait_for(ServerListPing._query(host, port), timeout)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None
+    
+    @staticmethod
+    async def poll_many(targets: List[tuple], timeout: float = 5) -> dict:
+        results = await asyncio.gather(*(ServerListPing.query(h, p, timeout) for h, p in targets))
+        return dict(zip(targets, results))
+    
+    @staticmethod
+    def status(host: str, port: int = 25565, timeout: float = 5) -> Optional[dict]:
+        return asyncio.run(ServerListPing.query(host, port, timeout))
+    
+    @staticmethod
+    def poll(targets: List[tuple], timeout: float = 5) -> dict:
+        """Sondea a la vez todos los (host, puerto) dados."""
+        return asyncio.run(ServerListPing.poll_many(list(targets), timeout))
+
+class DownloadError(Exception):
+    pass
+
+class Downloader:
+    """Descarga por rangos en paralelo, reanudable y con verificación de hash.
+
+    El contenido se escribe en `<destino>.part` (preasignado al tamaño final)
+    y el progreso de cada segmento se guarda en `<destino>.part.json`, de
+    modo que una conexión caída continúa donde se quedó. `checksum` tiene
+    la forma "sha1:<hex>", "sha256:<hex>", etc.
+    """
+    SEGMENTS = 4
+    MIN_SEGMENT = 4 * 1048576   # No trocear ficheros pequeños
+    BUFFER = 256 * 1024
+    RETRIES = 3
+    FPS = 10                    # Redibujados de la barra por segundo
+    TIMEOUT = 30
+    
+    def __init__(self, url: str, path: str, checksum: Optional[str] = None,
+                 segments: Optional[int] = None, quiet: bool = False, session=None):
+        self.url = url
+        self.path = path
+        self.part = f"{path}.part"
+        self.state_path = f"{path}.part.json"
+        self.checksum = checksum
+        self.segments = segments or self.SEGMENTS
+        self.quiet = quiet
+        self.session = session or HttpPool.session(url)
+        self.total = 0
+        self.done = 0
+        self.ranges = []        # [inicio, fin_inclusivo, siguiente_byte]
+        self.validator = None
+        self._lock = threading.Lock()
+        self._errors = []
+    
+    # ---------- estado ----------
+    
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (state.get("url") != self.url or state.get("size") != self.total
+                or state.get("validator") != self.validator
+                or not os.path.exists(self.part) or os.path.getsize(self.part) != self.total):
+            return False
+        self.ranges = state["ranges"]
+        return True
+    
+    def _save_state(self):
+        with self._lock:
+            state = {"url": self.url, "size": self.total, "validator": self.validator,
+                     "ranges": [list(r) for r in self.ranges]}
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+    
+    def _cleanup(self):
+        for p in (self.part, self.state_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+    
+    # ---------- red ----------
+    
+    def _get(self, start: Optional[int] = None, end: Optional[int] = None):
+        headers = {"Accept-Encoding": "identity"}
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        r = self.session.get(self.url, headers=headers, stream=True, timeout=self.TIMEOUT)
+        try:
+            r.raise_for_status()
+        except Exception:
+            r.close()
+            raise
+        return r
+    
+    def _probe(self):
+        """Pide el primer byte para saber tamaño, soporte de Range y validador."""
+        r = self._get(0, 0)
+        try:
+            self.validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if r.status_code == 206:
+                m = re.search(r"/(\d+)$", r.headers.get("Content-Range", ""))
+                if m:
+                    self.total = int(m.group(1))
+                    return True
+            self.total = int(r.headers.get("Content-Length", 0))
+            return False
+        finally:
+            r.close()
+    
+    def _plan(self):
+        parts = max(1, min(self.segments, self.total // self.MIN_SEGMENT))
+        size = -(-self.total // parts)
+        self.ranges = [[i, min(i + size, self.total) - 1, i] for i in range(0, self.total, size)]
+    
+    def _preallocate(self):
+        with open(self.part, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, self.total)
+                    return
+                except OSError:
+                    pass
+            f.truncate(self.total)
+    
+    def _fetch_range(self, rng: list, stop: Optional[int] = None, cancel: Optional[threading.Event] = None):
+        end = rng[1] if stop is None else min(stop, rng[1])
+        buf = bytearray(self.BUFFER)
+        view = memoryview(buf)
+        attempts = 0
+        with open(self.part, "r+b") as f:
+            while rng[2] <= end:
+                try:
+                    # `with`: la conexión vuelve al pool (o se cierra) también al reintentar
+                    with self._get(rng[2], end) as r:
+                        if r.status_code != 206:
+                            raise DownloadError("el servidor ignoró la petición por rangos")
+                        f.seek(rng[2])
+                        raw = r.raw
+                        while rng[2] <= end:
+                            if cancel and cancel.is_set():
+                                return
+                            n = raw.readinto(view)
+                            if not n:
+                                break
+                            n = min(n, end - rng[2] + 1)
+                            f.write(view[:n])
+                            with self._lock:
+                                rng[2] += n
+                                self.done += n
+                    if rng[2] <= end:
+                        raise DownloadError("conexión cerrada antes de tiempo")
+                except Exception as e:
+                    attempts += 1
+                    if attempts > self.RETRIES or self._errors:
+                        self._errors.append(e)
+                        return
+                    time.sleep(min(2 ** attempts, 8))
+    
+    def _fetch_single(self):
+        """Servidor sin Range: un solo flujo, sin posibilidad de reanudar."""
+        buf = bytearray(self.BUFFER)
+        view = memoryview(buf)
+        try:
+            with self._get() as r, open(self.part, "wb") as f:
+                raw = r.raw
+                while True:
+                    n = raw.readinto(view)
+                    if not n:
+                        break
+                    f.write(view[:n])
+                    with self._lock:
+                        self.done += n
+        except Exception as e:
+            self._errors.append(e)
+    
+    # ---------- progreso y verificación ----------
+    
+    def _wait(self, threads: List[threading.Thread]):
+        frame = 1.0 / self.FPS
+        started = time.monotonic()
+        base = self.done
+        last_save = started
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(frame / len(threads))
+            now = time.monotonic()
+            if not self.quiet:
+                rate = (self.done - base) / max(now - started, 1e-6)
+                Progress.bar(self.done, self.total, rate=rate)
+            if self.ranges and now - last_save >= 1:
+                self._save_state()
+                last_save = now
+        if not self.quiet:
+            Progress.bar(self.done, self.total)
+            print()
+    
+    @staticmethod
+    def file_hash(path: str, algo: str = "sha256") -> str:
+        h = hashlib.new(algo)
+        buf = bytearray(Downloader.BUFFER)
+        view = memoryview(buf)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(view)
+                if not n:
+                    break
+                h.update(view[:n])
+        return h.hexdigest()
+    
+    def _verify(self):
+        if not self.checksum:
+            return
+        algo, _, expected = self.checksum.partition(":")
+        actual = self.file_hash(self.part, algo)
+        if actual.lower() != expected.lower():
+            self._cleanup()
+            raise DownloadError(f"{algo} no coincide (esperado {expected[:12]}…, obtenido {actual[:12]}…)")
+    
+    def warm(self, limit: int, cancel: Optional[threading.Event] = None) -> int:
+        """Descarga solo los primeros `limit` bytes al .part para que `run` los reanude."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if not self._probe() or not self.total:
+            return 0
+        if not self._load_state():
+            self._plan()
+            self._preallocate()
+        rng = self.ranges[0]
+        try:
+            self._fetch_range(rng, limit - 1, cancel)
+        finally:
+            self._save_state()
+        return rng[2] - rng[0]
+    
+    def run(self) -> str:
+        """Descarga y verifica; devuelve la ruta final o lanza DownloadError."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        ranged = self._probe() and self.total > 0
+        
+        if ranged:
+            if self._load_state():
+                self.done = sum(r[2] - r[0] for r in self.ranges)
+                if self.done and not self.quiet:
+                    Log.info(f"Reanudando descarga ({self.done / 1048576:.1f} MB ya descargados)")
+            else:
+                self._plan()
+                self._preallocate()
+                self._save_state()
+            threads = [threading.Thread(target=self._fetch_range, args=(rng,), daemon=True)
+                       for rng in self.ranges if rng[2] <= rng[1]]
+        else:
+            self.ranges = []
+            threads = [threading.Thread(target=self._fetch_single, daemon=True)]
+        
+        for t in threads:
+            t.start()
+        try:
+            self._wait(threads)
+        finally:
+            if self.ranges:
+                self._save_state()
+        
+        if self._errors:
+            raise DownloadError(str(self._errors[0]))
+        if self.total and self.done < self.total:
+            raise DownloadError("descarga incompleta")
+        
+        self._verify()
+        os.replace(self.part, self.path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+        return self.path
+
+# =====================================================
+# ALMACÉN COMPARTIDO DE JARS
+# =====================================================
+
+class Store:
+    """Almacén direccionado por contenido (sha256) compartido por todos los servidores.
+
+    Cada fichero se guarda una sola vez en `.store/objects/<ab>/<sha256>` y
+    los servidores lo enlazan (reflink si el sistema de ficheros lo permite,
+    si no hardlink). El índice asocia URLs y hashes publicados al objeto,
+    así que un jar ya descargado no vuelve a tocar la red.
+    
+    Un hardlink se ve en el contador de enlaces del objeto, pero un reflink
+    o una copia no: esos destinos se apuntan en `refs.json` para que `gc`
+    no borre objetos que siguen en uso.
+    """
+    DIR = os.path.join(Config.BASE_DIR, ".store")
+    OBJECTS = os.path.join(DIR, "objects")
+    TMP = os.path.join(DIR, "tmp")
+    INDEX = os.path.join(DIR, "index.json")
+    REFS = os.path.join(DIR, "refs.json")  # {sha256: [rutas enlazadas por reflink o copia]}
+    FICLONE = 0x40049409  # ioctl de Linux para reflinks (btrfs, xfs...)
+    
+    _lock = threading.Lock()
+    _url_locks = {}
+    
+    @classmethod
+    def object_path(cls, digest: str) -> str:
+        return os.path.join(cls.OBJECTS, digest[:2], digest)
+    
+    @classmethod
+    def _read_index(cls) -> dict:
+        try:
+            with open(cls.INDEX, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @classmethod
+    def _write(cls, path: str, data: dict):
+        os.makedirs(cls.DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    
+    @classmethod
+    def _remember(cls, digest: str, keys: List[str]):
+        with cls._lock:
+            index = cls._read_index()
+            for key in keys:
+                index[key] = digest
+            cls._write(cls.INDEX, index)
+    
+    @classmethod
+    def _read_refs(cls) -> dict:
+        try:
+            with open(cls.REFS, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @classmethod
+    def _add_ref(cls, digest: str, dest: str):
+        with cls._lock:
+            refs = cls._read_refs()
+            paths = refs.setdefault(digest, [])
+            if dest not in paths:
+                paths.append(dest)
+                cls._write(cls.REFS, refs)
+    
+    @staticmethod
+    def _keys(url: Optional[str], checksum: Optional[str]) -> List[str]:
+        keys = []
+        if checksum:
+            keys.append(checksum.lower())
+        if url:
+            keys.append(f"url:{url}")
+        return keys
+    
+    @classmethod
+    def lookup(cls, url: Optional[str] = None, checksum: Optional[str] = None) -> Optional[str]:
+        """sha256 del objeto que corresponde a la URL o al hash publicado, si está en el almacén."""
+        keys = cls._keys(url, checksum)
+        if checksum and checksum.lower().startswith("sha256:"):
+            digest = checksum.split(":", 1)[1].lower()
+            if os.path.exists(cls.object_path(digest)):
+                return digest
+        index = cls._read_index()
+        for key in keys:
+            digest = index.get(key)
+            if digest and os.path.exists(cls.object_path(digest)):
+                return digest
+        return None
+    
+    @classmethod
+    def add(cls, path: str, url: Optional[str] = None, checksum: Optional[str] = None) -> str:
+        """Mueve `path` al almacén y devuelve su sha256."""
+        digest = Downloader.file_hash(path, "sha256")
+        dest = cls.object_path(digest)
+        if os.path.exists(dest):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.chmod(path, 0o444)  # Los enlaces comparten datos: nadie debe escribir encima
+            os.replace(path, dest)
+        cls._remember(digest, cls._keys(url, checksum) + [f"sha256:{digest}"])
+        return digest
+    
+    @classmethod
+    def link(cls, digest: str, dest: str) -> str:
+        """Materializa el objeto en `dest`. Devuelve el método usado."""
+        src = cls.object_path(digest)
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        
+        try:
+            with open(src, "rb") as s, open(dest, "wb") as d:
+                fcntl.ioctl(d.fileno(), cls.FICLONE, s.fileno())
+            cls._add_ref(digest, os.path.abspath(dest))
+            return "reflink"
+        except OSError:
+            if os.path.exists(dest):
+                os.remove(dest)
+        
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError:
+            shutil.copyfile(src, dest)
+            cls._add_ref(digest, os.path.abspath(dest))
+            return "copia"
+    
+    @classmethod
+    def rename(cls, src: str, dest: str):
+        """os.replace que mantiene al día los destinos apuntados en `refs.json`."""
+        os.replace(src, dest)
+        src, dest = os.path.abspath(src), os.path.abspath(dest)
+        with cls._lock:
+            refs = cls._read_refs()
+            changed = False
+            for paths in refs.values():
+                if src in paths:
+                    paths[paths.index(src)] = dest
+                    changed = True
+            if changed:
+                cls._write(cls.REFS, refs)
+    
+    @classmethod
+    def staging_path(cls, url: str) -> str:
+        return os.path.join(cls.TMP, hashlib.sha1(url.encode()).hexdigest())
+    
+    @classmethod
+    def url_lock(cls, url: str) -> threading.Lock:
+        """Lock de quien escribe el `.part` de `url` (descarga o precarga)."""
+        with cls._lock:
+            return cls._url_locks.setdefault(url, threading.Lock())
+    
+    @classmethod
+    def fetch(cls, url: str, dest: str, checksum: Optional[str] = None, quiet: bool = False) -> bool:
+        """Coloca el fichero de `url` en `dest`, descargándolo solo si no está en el almacén.
+
+        Si otro hilo ya está bajando la misma URL, se espera a que termine y
+        se enlaza su resultado en vez de descargarla dos veces.
+        """
+        with cls.url_lock(url):
+            digest = cls.lookup(url, checksum)
+            if digest:
+                method = cls.link(digest, dest)
+                if not quiet:
+                    Log.success(f"Reutilizado del almacén local ({method})")
+                return True
+            
+            # La descarga parcial vive en el almacén: sobrevive aunque se borre el servidor
+            staging = cls.staging_path(url)
+            if not Network.download(url, staging, checksum, quiet):
+                return False
+            digest = cls.add(staging, url, checksum)
+            cls.link(digest, dest)
+            return True
+    
+    @classmethod
+    def gc(cls) -> int:
+        """Elimina objetos que ya no enlaza ningún servidor. Devuelve bytes liberados.
+
+        Un objeto sigue en uso si tiene hardlinks o si alguno de sus destinos
+        apuntados en `refs.json` existe todavía con su tamaño. Ante la duda
+        (un destino sustituido por otro fichero del mismo tamaño) se conserva.
+        """
+        freed = 0
+        if not os.path.isdir(cls.OBJECTS):
+            return 0
+        with cls._lock:
+            refs = cls._read_refs()
+            live = {}
+            for shard in os.scandir(cls.OBJECTS):
+                if not shard.is_dir():
+                    continue
+                for obj in os.scandir(shard.path):
+                    st = obj.stat()
+                    paths = [p for p in refs.get(obj.name, [])
+                             if os.path.isfile(p) and os.path.getsize(p) == st.st_size]
+                    if paths:
+                        live[obj.name] = paths
+                    elif st.st_nlink <= 1:
+                        os.remove(obj.path)
+                        freed += st.st_size
+            if live != refs:
+                cls._write(cls.REFS, live)
+        return freed
+
+class ForgeLibraries:
+    """Caché compartida de `libraries/` de Forge, con el layout de Maven.
+
+    Antes de ejecutar el instalador se enlazan en la carpeta del servidor
+    las librerías que ya están en la caché: el instalador comprueba su SHA-1
+    y no las descarga, y si las salidas de sus procesadores ya están (misma
+    versión de Forge) tampoco los ejecuta. Al terminar, lo nuevo entra en la
+    caché y lo del servidor se sustituye por hardlinks.
+    """
+    DIR = os.path.join(Store.DIR, "maven")
+    INDEX = os.path.join(Store.DIR, "maven.json")  # {"files": {ruta: [tamaño, mtime, sha1]}, "versions": {...}}
+    _lock = threading.RLock()  # Protege el índice
+    _versions = {}  # versión de Forge -> Lock: dos instalaciones iguales van una tras otra
+    
+    @classmethod
+    @contextmanager
+    def exclusive(cls, installer: str):
+        """Serializa las instalaciones de la misma versión: la segunda encuentra todo en caché."""
+        version = cls.profile(installer)["version"] or os.path.basename(installer)
+        with cls._lock:
+            lock = cls._versions.setdefault(version, threading.Lock())
+        with lock:
+            yield
+    
+    @classmethod
+    def _load(cls) -> dict:
+        try:
+            with open(cls.INDEX, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("files", {})
+        index.setdefault("versions", {})
+        return index
+    
+    @classmethod
+    def _save(cls, index: dict):
+        os.makedirs(Store.DIR, exist_ok=True)
+        tmp = f"{cls.INDEX}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, cls.INDEX)
+    
+    @staticmethod
+    def profile(installer: str) -> dict:
+        """Versión y librerías (ruta Maven -> sha1) que declara el instalador."""
+        result = {"version": None, "libraries": {}}
+        try:
+            with zipfile.ZipFile(installer) as z:
+                names = set(z.namelist())
+                for member in ("install_profile.json", "version.json"):
+                    if member not in names:
+                        continue
+                    data = json.loads(z.read(member).decode("utf-8", "replace"))
+                    result["version"] = result["version"] or data.get("version") or data.get("id")
+                    for lib in data.get("libraries", []):
+                        artifact = lib.get("downloads", {}).get("artifact") or {}
+                        if artifact.get("path"):
+                            result["libraries"][artifact["path"]] = artifact.get("sha1")
+        except (OSError, zipfile.BadZipFile, ValueError):
+            pass
+        return result
+    
+    @classmethod
+    def _verified(cls, index: dict, rel: str, expected: Optional[str]) -> bool:
+        """La copia en caché existe y su SHA-1 es el esperado (se recalcula si el fichero cambió)."""
+        path = os.path.join(cls.DIR, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            index["files"].pop(rel, None)
+            return False
+        known = index["files"].get(rel)
+        if not known or known[:2] != [st.st_size, st.st_mtime_ns]:
+            known = [st.st_size, st.st_mtime_ns, Downloader.file_hash(path, "sha1")]
+            index["files"][rel] = known
+        if expected and known[2] != expected.lower():
+            os.remove(path)  # Corrupta o sustituida: mejor que el instalador la vuelva a bajar
+            index["files"].pop(rel, None)
+            return False
+        return True
+    
+    @staticmethod
+    def _link(src: str, dest: str):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+    
+    @classmethod
+    def seed(cls, server_dir: str, installer: str) -> int:
+        """Enlaza en `libraries/` lo que ya hay en caché para este instalador. Devuelve ficheros enlazados."""
+        profile = cls.profile(installer)
+        linked = 0
+        # El índice se lee y se guarda sin soltar el lock: un `collect` de otra
+        # versión que se colara en medio se perdería al guardar esta copia
+        with cls._lock:
+            index = cls._load()
+            wanted = dict(profile["libraries"])
+            # Lo que dejó una instalación anterior de la misma versión (salidas de procesadores incluidas)
+            for rel in index["versions"].get(profile["version"] or "", []):
+                wanted.setdefault(rel, None)
+            
+            for rel, sha1 in wanted.items():
+                if cls._verified(index, rel, sha1):
+                    cls._link(os.path.join(cls.DIR, rel), os.path.join(server_dir, "libraries", rel))
+                    linked += 1
+            cls._save(index)
+        return linked
+    
+    @classmethod
+    def collect(cls, server_dir: str, installer: str) -> int:
+        """Mete en la caché lo que generó el instalador y lo sustituye por hardlinks. Devuelve ficheros nuevos."""
+        with cls._lock:
+            return cls._collect(server_dir, installer)
+    
+    @classmethod
+    def _collect(cls, server_dir: str, installer: str) -> int:
+        libraries = os.path.join(server_dir, "libraries")
+        profile = cls.profile(installer)
+        index = cls._load()
+        added = 0
+        produced = []
+        for root, _, files in os.walk(libraries):
+            for f in files:
+                path = os.path.join(root, f)
+                rel = os.path.relpath(path, libraries)
+                produced.append(rel)
+                cached = os.path.join(cls.DIR, rel)
+                st = os.stat(path)
+                if os.path.exists(cached):
+                    if os.path.samefile(path, cached):
+                        continue
+                    if cls._verified(index, rel, None) and \
+                            index["files"][rel][2] == Downloader.file_hash(path, "sha1"):
+                        cls._link(cached, path)
+                    continue
+                os.makedirs(os.path.dirname(cached), exist_ok=True)
+                try:
+                    os.link(path, cached)
+                except OSError:
+                    shutil.copy2(path, cached)
+                os.chmod(cached, 0o444)  # Compartida: nadie debe escribir encima
+                index["files"][rel] = [st.st_size, os.stat(cached).st_mtime_ns, Downloader.file_hash(cached, "sha1")]
+                added += 1
+        if profile["version"]:
+            index["versions"][profile["version"]] = sorted(produced)
+        cls._save(index)
+        return added
+
 # =====================================================
 # TÚNELES
 # =====================================================
 
 class Tunnel:
+    _paths = {}  # Caché de shutil.which: evita lanzar `which` en cada menú
+    
     @staticmethod
-    def _check_cmd(cmd: str) -> bool:
-        return subprocess.run(["which", cmd], 
-                             stdout=subprocess.DEVNULL, 
-                             stderr=subprocess.DEVNULL).returncode == 0
+    def _check_cmd(cmd: str, refresh: bool = False) -> bool:
+        if refresh or cmd not in Tunnel._paths:
+            Tunnel._paths[cmd] = shutil.which(cmd)
+        return Tunnel._paths[cmd] is not None
     
     @staticmethod
     def _kill_existing_tunnels():
@@ -316,14 +1219,20 @@ class Tunnel:
                 killed = True
         
         if killed:
-            time.sleep(1)  # Esperar a que se cierren los procesos
+            # Esperar a que desaparezcan (SIGKILL es casi inmediato; máximo 1s)
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline and any(
+                    subprocess.run(["pgrep", "-f", p], stdout=subprocess.DEVNULL).returncode == 0
+                    for p in tunnel_processes):
+                time.sleep(0.05)
             Log.info("Túneles anteriores cerrados")
         
-        # También cerrar túneles de ngrok via API
-        try:
-            ngrok.kill()
-        except:
-            pass
+        # También cerrar túneles de ngrok via API (solo si ya se cargó pyngrok)
+        if "pyngrok.ngrok" in sys.modules:
+            try:
+                sys.modules["pyngrok.ngrok"].kill()
+            except:
+                pass
     
     @staticmethod
     def get_available() -> List[str]:
@@ -332,6 +1241,8 @@ class Tunnel:
         # Cloudflare (mejor opción)
         if Tunnel._check_cmd("cloudflared"):
             tunnels.append("☁️   Cloudflare Tunnel (Mejor)")
+        elif Provisioner.installing("cloudflared"):
+            tunnels.append("☁️   Cloudflare Tunnel (instalando…)")
         else:
             tunnels.append("☁️   Instalar Cloudflare (Mejor)")
         
@@ -339,255 +1250,718 @@ class Tunnel:
         if os.getenv("NGROK_AUTH_TOKEN"):
             tunnels.append("🌐  Ngrok (Estable)")
         
-        # Playit
+        # Playit (se instala en segundo plano desde el arranque)
         if Tunnel._check_cmd("playit"):
             tunnels.append("🎮  Playit.gg")
-        else:
-            Tunnel._install_playit()
-            if Tunnel._check_cmd("playit"):
-                tunnels.append("🎮  Playit.gg")
+        elif Provisioner.installing("playit"):
+            tunnels.append("🎮  Playit.gg (instalando…)")
+        
+        # Túnel propio definido por TUNNEL_CMD (ssh -R, bore...)
+        if os.getenv("TUNNEL_CMD"):
+            tunnels.append("🧩  Túnel propio (TUNNEL_CMD)")
+        
+        if len(TunnelSupervisor.available()) > 1:
+            tunnels.append("🏁  Varios a la vez (el más rápido)")
         
         tunnels.append("🔌  Sin túnel (Local)")
         return tunnels
     
+    @staticmethod
+    def _run_install(cmds: List[str]) -> bool:
+        try:
+            for cmd in cmds:
+                # stdin cerrado: nunca competir con los menús por el teclado
+                subprocess.run(cmd, shell=True, check=True, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return True
+        except:
+            return False
+    
     @staticmethod
     def _install_playit():
         if Tunnel._check_cmd("playit"):
             return True
         
-        with Spinner("Instalando Playit.gg"):
-            try:
-                cmds = [
-                    "curl -SsL https://playit-cloud.github.io/ppa/key.gpg -o /tmp/key.gpg",
-                    "sudo apt-key add /tmp/key.gpg 2>/dev/null",
-                    "echo 'deb https://playit-cloud.github.io/ppa/data ./' | sudo tee /etc/apt/sources.list.d/playit-cloud.list >/dev/null",
-                    "sudo apt update -qq",
-                    "sudo apt install -y playit -qq"
-                ]
-                for cmd in cmds:
-                    subprocess.run(cmd, shell=True, check=True,
-                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                return True
-            except:
-                return False
+        Tunnel._run_install([
+            "curl -SsL https://playit-cloud.github.io/ppa/key.gpg -o /tmp/key.gpg",
+            "sudo apt-key add /tmp/key.gpg 2>/dev/null",
+            "echo 'deb https://playit-cloud.github.io/ppa/data ./' | sudo tee /etc/apt/sources.list.d/playit-cloud.list >/dev/null",
+            "sudo apt update -qq",
+            "sudo apt install -y playit -qq"
+        ])
+        return Tunnel._check_cmd("playit", refresh=True)
     
     @staticmethod
     def _install_cloudflare():
         if Tunnel._check_cmd("cloudflared"):
             return True
         
-        with Spinner("Instalando Cloudflare Tunnel"):
-            try:
-                cmds = [
-                    "curl -L --output /tmp/cloudflared.deb https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64.deb",
-                    "sudo dpkg -i /tmp/cloudflared.deb"
-                ]
-                for cmd in cmds:
-                    subprocess.run(cmd, shell=True, check=True,
-                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                return True
-            except:
-                return False
+        Tunnel._run_install([
+            "curl -L --output /tmp/cloudflared.deb https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64.deb",
+            "sudo dpkg -i /tmp/cloudflared.deb"
+        ])
+        return Tunnel._check_cmd("cloudflared", refresh=True)
     
     @staticmethod
-    def start(choice: str):
-        # Primero cerrar cualquier túnel existente para evitar duplicados
-        Tunnel._kill_existing_tunnels()
+    def start(choice: str, port: int = Config.MC_PORT, shared: bool = False) -> Optional["TunnelSupervisor"]:
+        """Lanza el túnel elegido hacia `port` y vuelve enseguida; la dirección llega por eventos.
+
+        Con `shared` (hay otras instancias en marcha) no se tocan los túneles existentes.
+        """
+        if "Varios" in choice:
+            names = TunnelSupervisor.available()
+        else:
+            names = [n for key, n in (("Cloudflare", "Cloudflare"), ("Ngrok", "Ngrok"), ("Playit", "Playit"),
+                                      ("propio", "Personalizado")) if key in choice]
+        if not names:
+            return None
         
-        Network.release_port()
+        # Si el cliente elegido aún se está instalando, esperar solo a ese
+        for key, cmd, label in (("Cloudflare", "cloudflared", "Cloudflare Tunnel"), ("Playit", "playit", "Playit.gg")):
+            if key in names and Provisioner.installing(cmd):
+                with Spinner(f"Terminando instalación de {label}"):
+                    Provisioner.wait(cmd)
         
-        if "Cloudflare" in choice:
-            return Tunnel._start_cloudflare()
-        elif "Ngrok" in choice:
-            return Tunnel._start_ngrok()
-        elif "Playit" in choice:
-            return Tunnel._start_playit()
-        return None
-    
-    @staticmethod
-    def _start_cloudflare():
-        # Instalar si no existe
-        if not Tunnel._check_cmd("cloudflared"):
-            if not Tunnel._install_cloudflare():
+        if "Cloudflare" in names and not Tunnel._check_cmd("cloudflared"):
+            with Spinner("Instalando Cloudflare Tunnel"):
+                installed = Tunnel._install_cloudflare()
+            if not installed:
                 Log.error("No se pudo instalar Cloudflare")
                 return None
         
-        try:
-            # Para TCP, cloudflared usa stderr para los logs
-            proc = subprocess.Popen(
-                ["cloudflared", "tunnel", "--url", f"tcp://localhost:{Config.MC_PORT}"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            print()
-            Log.info("Iniciando Cloudflare Tunnel...")
-            Log.info("Buscando dirección del túnel...")
-            print()
-            
-            url_found = [False]  # Usar lista para modificar en closure
-            tunnel_url = [None]
-            
-            def read_stderr():
-                for line in proc.stderr:
-                    # Cloudflare muestra la URL en stderr
-                    if "trycloudflare.com" in line or "cfargotunnel.com" in line:
-                        match = re.search(r'https?://([a-z0-9-]+\.trycloudflare\.com)', line)
-                        if match:
-                            tunnel_url[0] = match.group(1)
-                            url_found[0] = True
-                    # También buscar en formato TCP
-                    if "tcp://" in line.lower() and "trycloudflare" in line:
-                        match = re.search(r'([a-z0-9-]+\.trycloudflare\.com:\d+)', line)
-                        if match:
-                            tunnel_url[0] = match.group(1)
-                            url_found[0] = True
-                    # Imprimir logs relevantes
-                    if "registered" in line.lower() or "connection" in line.lower():
-                        print(f"  {C.DIM}{line.strip()}{C.RESET}")
-            
-            def read_stdout():
-                for line in proc.stdout:
-                    if "trycloudflare.com" in line:
-                        match = re.search(r'([a-z0-9-]+\.trycloudflare\.com)', line)
-                        if match:
-                            tunnel_url[0] = match.group(1)
-                            url_found[0] = True
-            
-            # Leer ambos streams
-            t1 = threading.Thread(target=read_stderr, daemon=True)
-            t2 = threading.Thread(target=read_stdout, daemon=True)
-            t1.start()
-            t2.start()
-            
-            # Esperar hasta 15 segundos por la URL
-            for i in range(30):
-                if url_found[0]:
-                    break
-                time.sleep(0.5)
-                if i % 4 == 0:
-                    print(f"\r  {C.YELLOW}{'.' * ((i//4) % 4 + 1):<4}{C.RESET} Conectando...", end="", flush=True)
-            
-            print("\r" + " " * 30 + "\r", end="")  # Limpiar línea
-            
-            if url_found[0] and tunnel_url[0]:
-                UI.box([
-                    f"{C.BOLD}☁️  Cloudflare Tunnel Activo{C.RESET}",
-                    f"",
-                    f"  Dirección: {C.GREEN}{C.BOLD}{tunnel_url[0]}{C.RESET}",
-                    f"",
-                    f"{C.DIM}  Copia esta dirección en Minecraft{C.RESET}",
-                    f"{C.DIM}  (Añadir servidor → pegar dirección){C.RESET}",
-                ], C.GREEN, 50)
-            else:
-                # Si no encontró URL automáticamente, mostrar alternativa
-                Log.warn("No se detectó la URL automáticamente")
-                print()
-                UI.box([
-                    f"{C.BOLD}☁️  Cloudflare Tunnel Iniciado{C.RESET}",
-                    f"",
-                    f"  {C.YELLOW}Busca la URL en los logs de arriba{C.RESET}",
-                    f"  {C.DIM}Formato: xxx-xxx.trycloudflare.com{C.RESET}",
-                    f"",
-                    f"  {C.DIM}O ejecuta en otra terminal:{C.RESET}",
-                    f"  {C.CYAN}cloudflared tunnel --url tcp://localhost:25565{C.RESET}",
-                ], C.YELLOW, 55)
-            
-            return proc
-            
-        except Exception as e:
-            Log.error(f"Error Cloudflare: {e}")
-            return None
+        # Primero cerrar cualquier túnel existente para evitar duplicados (salvo los de otras instancias)
+        if not shared:
+            Tunnel._kill_existing_tunnels()
+        return TunnelSupervisor(names, port, on_change=Tunnel._announce_change,
+                                on_restart=Tunnel._announce_restart).start()
     
     @staticmethod
-    def _start_playit():
-        try:
-            proc = subprocess.Popen(
-                ["playit", "run"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True
-            )
-            print()
-            UI.box([
-                f"{C.BOLD}🎮  Playit.gg Activo{C.RESET}",
-                f"",
-                f"{C.DIM}  Ejecuta 'playit' en otra terminal{C.RESET}",
-                f"{C.DIM}  para ver tu dirección IP{C.RESET}",
-            ], C.CYAN, 42)
-            return proc
-        except Exception as e:
-            Log.error(f"Error Playit: {e}")
-            return None
+    def _announce_change(handle: Optional["TunnelHandle"]):
+        if handle:
+            Log.info(f"Túnel activo: {handle.name} → {C.GREEN}{handle.address}{C.RESET} ({handle.rtt_ms:.0f}ms)")
+        else:
+            Log.warn("Ningún túnel responde ahora mismo")
     
     @staticmethod
-    def _start_ngrok():
-        try:
-            token = os.getenv("NGROK_AUTH_TOKEN")
-            region = os.getenv("NGROK_REGION", "us")
-            
-            ngrok.set_auth_token(token)
-            conf.get_default().region = region
-            tunnel = ngrok.connect(Config.MC_PORT, "tcp")
-            
-            url = str(tunnel).split('"')[1].replace('tcp://', '')
+    def _announce_restart(handle: "TunnelHandle"):
+        Log.warn(f"Túnel {handle.name} reiniciado → nueva dirección: {C.GREEN}{handle.address}{C.RESET}")
+    
+    @staticmethod
+    def publish_when_ready(supervisor: "TunnelSupervisor", ready: threading.Event, proc: subprocess.Popen):
+        """Muestra la dirección solo cuando el servidor está listo (sin bloquear)."""
+        async def _wait():
+            while not ready.is_set():
+                if proc.poll() is not None:
+                    return
+                await asyncio.sleep(0.2)
+            handles = await supervisor.wait_addresses_async()
+            if len(supervisor.names) > 1:
+                await supervisor.check_all_async()  # Con el servidor ya arriba, los pings eligen el activo
+            Tunnel.publish(supervisor, handles)
+        EventLoop.submit(_wait())
+    
+    @staticmethod
+    def publish(supervisor: "TunnelSupervisor", handles: List["TunnelHandle"]):
+        print()
+        if len(supervisor.names) > 1:
+            if not handles:
+                Log.error("Ningún túnel obtuvo dirección")
+                return
+            lines = [f"{C.BOLD}🏁  Túneles en carrera{C.RESET}", ""]
+            for handle in handles:
+                mark = f"{C.GREEN}●{C.RESET}" if handle is supervisor.active else " "
+                rtt = f"{C.DIM}{handle.rtt_ms:.0f}ms{C.RESET}" if handle.rtt_ms is not None else ""
+                lines.append(f" {mark} {handle.name:<14} {C.GREEN}{handle.address}{C.RESET} {rtt}")
+            lines += ["", f"{C.DIM}  ● = el de menor latencia ahora mismo{C.RESET}"]
+            UI.box(lines, C.GREEN, 60)
+            return
+        
+        name = supervisor.names[0]
+        address = handles[0].address if handles else None
+        if name == "Playit" and not address:
+            UI.box([
+                f"{C.BOLD}🎮  Playit.gg Activo{C.RESET}",
+                f"",
+                f"{C.DIM}  Ejecuta 'playit' en otra terminal{C.RESET}",
+                f"{C.DIM}  para ver tu dirección IP{C.RESET}",
+            ], C.CYAN, 42)
+        elif name == "Cloudflare" and not address:
+            # Si no encontró URL automáticamente, mostrar alternativa
+            Log.warn("No se detectó la URL automáticamente")
             print()
             UI.box([
-                f"{C.BOLD}🌐  Ngrok Activo{C.RESET}",
+                f"{C.BOLD}☁️  Cloudflare Tunnel Iniciado{C.RESET}",
                 f"",
-                f"  Dirección: {C.GREEN}{C.BOLD}{url}{C.RESET}",
+                f"  {C.YELLOW}Busca la URL en los logs de arriba{C.RESET}",
+                f"  {C.DIM}Formato: xxx-xxx.trycloudflare.com{C.RESET}",
                 f"",
-                f"{C.DIM}  Copia la dirección en Minecraft{C.RESET}",
-            ], C.GREEN, 48)
-            return tunnel
-        except Exception as e:
-            Log.error(f"Error Ngrok: {e}")
+                f"  {C.DIM}O ejecuta en otra terminal:{C.RESET}",
+                f"  {C.CYAN}cloudflared tunnel --url tcp://localhost:{supervisor.port}{C.RESET}",
+            ], C.YELLOW, 55)
+        elif not address:
+            Log.error(f"Error {name}: el túnel no obtuvo dirección")
+        else:
+            title = {"Cloudflare": "☁️  Cloudflare Tunnel Activo", "Ngrok": "🌐  Ngrok Activo",
+                     "Playit": "🎮  Playit.gg Activo"}.get(name, "🧩  Túnel propio Activo")
+            UI.box([
+                f"{C.BOLD}{title}{C.RESET}",
+                f"",
+                f"  Dirección: {C.GREEN}{C.BOLD}{address}{C.RESET}",
+                f"",
+                f"{C.DIM}  Copia esta dirección en Minecraft{C.RESET}",
+                f"{C.DIM}  (Añadir servidor → pegar dirección){C.RESET}",
+            ], C.GREEN, 50)
+
+class EventLoop:
+    """Bucle asyncio compartido, en un único hilo.
+
+    Los flujos de los procesos hijos (pty del servidor, salida de los
+    túneles, teclado) se atienden aquí con `add_reader` en lugar de con un
+    hilo por flujo. Los menús siguen en el hilo principal.
+    """
+    _loop = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, daemon=True).start()
+            return cls._loop
+    
+    @classmethod
+    def call(cls, fn, *args):
+        cls.get().call_soon_threadsafe(fn, *args)
+    
+    @classmethod
+    def submit(cls, coro):
+        """Programa una corrutina en el bucle; devuelve un concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, cls.get())
+
+class TunnelHandle:
+    """Un túnel en marcha: su proceso, la dirección pública y la salud medida."""
+    LOG_LINES = 50
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.proc = None
+        self.closer = None           # Cierre alternativo (ngrok no tiene proceso propio)
+        self.agent = None            # Proceso que se vigila sin ser suyo (el agente compartido de ngrok)
+        self.failed = False          # No llegó a arrancar
+        self.retry_at = 0            # No reiniciarlo antes de este instante (monotonic)
+        self.address = None
+        self.ready = threading.Event()  # Se activa al conocer la dirección
+        self.rtt_ms = None           # Media móvil de los pings correctos
+        self.failures = 0            # Pings fallidos seguidos
+        self.verified = False        # Al menos un ping correcto
+        self.restarts = 0
+        self.started = time.monotonic()
+        self.lines = deque(maxlen=self.LOG_LINES)
+        self._partial = b""
+    
+    def alive(self) -> bool:
+        if self.failed:
+            return False
+        proc = self.proc or self.agent
+        return proc is None or proc.poll() is None  # Sin proceso todavía: arrancando
+    
+    def healthy(self) -> bool:
+        return self.alive() and self.verified and self.failures == 0
+    
+    def feed(self, data: bytes, pattern):
+        """Trocea la salida del proceso en líneas y busca la dirección pública."""
+        chunks = (self._partial + data).split(b"\n")
+        self._partial = chunks.pop()
+        for raw in chunks:
+            line = raw.decode(errors="replace").rstrip("\r")
+            self.lines.append(line)
+            if not self.ready.is_set():
+                m = pattern.search(line)
+                if m:
+                    self.address = m.group(1)
+                    self.ready.set()
+    
+    def stop(self):
+        try:
+            if self.closer:
+                self.closer()
+            if self.proc and self.proc.poll() is None:
+                self.proc.terminate()
+                try:
+                    self.proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+        except Exception:
+            pass
+
+class TunnelSupervisor:
+    """Mantiene varios túneles a la vez y publica el de menor latencia sano.
+
+    Cada CHECK_INTERVAL segundos hace un ping de estado de Minecraft a través
+    de la dirección pública de cada túnel. Un túnel cuyo proceso muere, o que
+    tras haber funcionado falla MAX_FAILURES pings seguidos, se reinicia; si
+    era el activo se promociona el siguiente más rápido. Como el servidor,
+    cada reinicio espera BACKOFF_BASE·2ⁿ segundos (hasta BACKOFF_MAX) y con
+    RESTART_LIMIT reinicios dentro de RESTART_WINDOW se deja caído.
+
+    Los proveedores por comando viven en PROVIDERS: `cmd` recibe el puerto
+    local y `address` es la regex que extrae la dirección de su salida.
+    TUNNEL_CMD/TUNNEL_ADDRESS_RE añaden uno propio (ssh -R, bore, un túnel
+    falso para pruebas...).
+    """
+    CHECK_INTERVAL = 10
+    PING_TIMEOUT = 5
+    MAX_FAILURES = 3
+    START_TIMEOUT = 30
+    RTT_SMOOTHING = 0.3
+    BACKOFF_BASE = 10
+    BACKOFF_MAX = 300
+    RESTART_LIMIT = 5
+    RESTART_WINDOW = 900
+    
+    PROVIDERS = {
+        "Cloudflare": {
+            "cmd": lambda port: ["cloudflared", "tunnel", "--url", f"tcp://localhost:{port}"],
+            "address": r"([a-z0-9-]+\.trycloudflare\.com(?::\d+)?)",
+        },
+        "Playit": {
+            "cmd": lambda port: ["playit", "run"],
+            "address": r"([a-z0-9.-]+\.(?:joinmc\.link|ply\.gg)(?::\d+)?)",
+        },
+    }
+    
+    @classmethod
+    def custom_provider(cls) -> Optional[dict]:
+        cmd = os.getenv("TUNNEL_CMD")
+        if not cmd:
+            return None
+        return {
+            "cmd": lambda port: ["sh", "-c", cmd.replace("{port}", str(port))],
+            "address": os.getenv("TUNNEL_ADDRESS_RE", r"([\w.-]+:\d+)"),
+        }
+    
+    @classmethod
+    def available(cls) -> List[str]:
+        names = [n for n, cmd in (("Cloudflare", "cloudflared"), ("Playit", "playit")) if Tunnel._check_cmd(cmd)]
+        if os.getenv("NGROK_AUTH_TOKEN"):
+            names.append("Ngrok")
+        if cls.custom_provider():
+            names.append("Personalizado")
+        return names
+    
+    def __init__(self, names: List[str], port: int = Config.MC_PORT, on_change=None, on_restart=None):
+        self.names = names
+        self.port = port
+        self.on_change = on_change
+        self.on_restart = on_restart
+        self.handles = {}
+        self.active = None
+        self.given_up = set()
+        self._restarts = {}          # nombre -> deque de instantes de reinicio
+        self._monitor_future = None
+    
+    def _launch(self, name: str) -> TunnelHandle:
+        handle = TunnelHandle(name)
+        if name == "Ngrok":
+            # pyngrok es bloqueante: va al pool de hilos del bucle
+            def _connect():
+                try:
+                    from pyngrok import ngrok, conf
+                    ngrok.set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
+                    conf.get_default().region = os.getenv("NGROK_REGION", "us")
+                    tunnel = ngrok.connect(self.port, "tcp")
+                    handle.closer = lambda: ngrok.disconnect(tunnel.public_url)
+                    handle.agent = ngrok.get_ngrok_process().proc
+                    handle.address = tunnel.public_url.replace("tcp://", "")
+                    handle.ready.set()
+                except Exception:
+                    handle.failed = True
+            EventLoop.get().run_in_executor(None, _connect)
+            return handle
+        
+        spec = self.custom_provider() if name == "Personalizado" else self.PROVIDERS[name]
+        pattern = re.compile(spec["address"])
+        try:
+            handle.proc = subprocess.Popen(spec["cmd"](self.port), stdin=subprocess.DEVNULL,
+                                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError:
+            handle.failed = True
+            return handle
+        EventLoop.call(self._watch, handle, pattern)
+        return handle
+    
+    @staticmethod
+    def _watch(handle: TunnelHandle, pattern):
+        """Atiende la salida del túnel desde el bucle (se ejecuta en su hilo)."""
+        loop = asyncio.get_running_loop()
+        fd = handle.proc.stdout.fileno()
+        os.set_blocking(fd, False)
+        
+        def _readable():
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""
+            if data:
+                handle.feed(data, pattern)
+            else:
+                loop.remove_reader(fd)
+                handle.proc.stdout.close()
+        loop.add_reader(fd, _readable)
+    
+    def start(self) -> "TunnelSupervisor":
+        for name in self.names:
+            self.handles[name] = self._launch(name)
+        self._monitor_future = EventLoop.submit(self._monitor())
+        return self
+    
+    async def wait_addresses_async(self, timeout: float = START_TIMEOUT) -> List[TunnelHandle]:
+        """Espera a que cada túnel anuncie su dirección (o a agotar el tiempo)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not all(h.ready.is_set() for h in self.handles.values()):
+            await asyncio.sleep(0.1)
+        return [h for h in self.handles.values() if h.address]
+    
+    def wait_addresses(self, timeout: float = START_TIMEOUT) -> List[TunnelHandle]:
+        return EventLoop.submit(self.wait_addresses_async(timeout)).result()
+    
+    async def check(self, handle: TunnelHandle) -> Optional[float]:
+        if not handle.address or not handle.alive():
             return None
+        host, port = Network.split_address(handle.address)
+        status = await ServerListPing.query(host, port, self.PING_TIMEOUT)
+        rtt = status["latency_ms"] if status else None
+        if rtt is None:
+            handle.failures += 1
+        else:
+            handle.failures = 0
+            handle.verified = True
+            a = self.RTT_SMOOTHING
+            handle.rtt_ms = rtt if handle.rtt_ms is None else (1 - a) * handle.rtt_ms + a * rtt
+        return rtt
+    
+    def check_all(self) -> Optional[TunnelHandle]:
+        return EventLoop.submit(self.check_all_async()).result()
+    
+    async def check_all_async(self) -> Optional[TunnelHandle]:
+        """Mide todos los túneles a la vez, reinicia los atascados y elige el activo."""
+        handles = list(self.handles.values())
+        await asyncio.gather(*(self.check(h) for h in handles))
+        
+        for handle in handles:
+            stalled = handle.verified and handle.failures >= self.MAX_FAILURES
+            if (not handle.alive() or stalled) and handle.name not in self.given_up:
+                if time.monotonic() >= handle.retry_at:
+                    self.restart(handle.name)
+        
+        healthy = [h for h in self.handles.values() if h.healthy()]
+        best = min(healthy, key=lambda h: h.rtt_ms) if healthy else None
+        current = self.active
+        # Sin ningún túnel verificado, mantener el actual mientras siga vivo
+        if best is None and current and current.alive() and current is self.handles.get(current.name):
+            return current
+        self.active = best
+        if best is not current and self.on_change:
+            self.on_change(best)
+        return best
+    
+    def restart(self, name: str):
+        now = time.monotonic()
+        recent = self._restarts.setdefault(name, deque())
+        while recent and now - recent[0] > self.RESTART_WINDOW:
+            recent.popleft()
+        old = self.handles[name]
+        EventLoop.get().run_in_executor(None, old.stop)  # Puede tardar hasta 5s: fuera del bucle
+        if len(recent) >= self.RESTART_LIMIT:
+            self.given_up.add(name)
+            Log.warn(f"Túnel {name}: {len(recent)} reinicios en {self.RESTART_WINDOW // 60} minutos; "
+                     f"no se reinicia más")
+            return
+        recent.append(now)
+        handle = self._launch(name)
+        handle.restarts = old.restarts + 1
+        # Si vuelve a caer, el siguiente reinicio espera el doble
+        handle.retry_at = now + min(self.BACKOFF_BASE * 2 ** (len(recent) - 1), self.BACKOFF_MAX)
+        self.handles[name] = handle
+        if self.on_restart:
+            async def _notify():
+                deadline = time.monotonic() + self.START_TIMEOUT
+                while not handle.ready.is_set() and time.monotonic() < deadline:
+                    await asyncio.sleep(0.2)
+                if handle.ready.is_set():
+                    self.on_restart(handle)
+            EventLoop.submit(_notify())
+    
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            try:
+                await self.check_all_async()
+            except Exception:
+                pass
+    
+    def stop(self):
+        if self._monitor_future:
+            self._monitor_future.cancel()
+        for handle in self.handles.values():
+            handle.stop()
+    
+    def terminate(self):
+        """Alias para tratarlo igual que el proceso de un túnel suelto."""
+        self.stop()
+
+class Provisioner:
+    """Instala en segundo plano, desde el arranque, los clientes de túnel que falten.
+
+    Las instalaciones van una detrás de otra en un hilo daemon (apt y dpkg
+    no admiten ejecuciones simultáneas); los menús consultan su estado sin
+    esperar.
+    """
+    _pending = {}  # comando -> threading.Event (se activa al terminar)
+    _thread = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def start(cls):
+        jobs = [(cmd, fn) for cmd, fn in (("cloudflared", Tunnel._install_cloudflare),
+                                         ("playit", Tunnel._install_playit))
+                if not Tunnel._check_cmd(cmd)]
+        with cls._lock:
+            if cls._thread or not jobs:
+                return
+            for cmd, _ in jobs:
+                cls._pending[cmd] = threading.Event()
+            cls._thread = threading.Thread(target=cls._run, args=(jobs,), daemon=True)
+            cls._thread.start()
+    
+    @classmethod
+    def _run(cls, jobs: List[tuple]):
+        for cmd, install in jobs:
+            try:
+                install()
+            finally:
+                cls._pending[cmd].set()
+    
+    @classmethod
+    def installing(cls, cmd: str) -> bool:
+        event = cls._pending.get(cmd)
+        return event is not None and not event.is_set()
+    
+    @classmethod
+    def wait(cls, cmd: str, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la instalación de `cmd`; True si quedó disponible."""
+        event = cls._pending.get(cmd)
+        if event:
+            event.wait(timeout)
+        return Tunnel._check_cmd(cmd)
 
 # =====================================================
 # SERVIDOR
 # =====================================================
 
+def format_size(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def format_ago(ts: Optional[float]) -> str:
+    if not ts:
+        return "nunca"
+    secs = max(0, time.time() - ts)
+    for unit, size in (("d", 86400), ("h", 3600), ("min", 60)):
+        if secs >= size:
+            return f"hace {int(secs // size)} {unit}"
+    return "ahora"
+
 class Server:
+    META_DIR = ".mcsm"  # Datos del gestor dentro de cada servidor
+    
+    @staticmethod
+    def path(name: str) -> str:
+        return os.path.join(Config.BASE_DIR, name)
+    
+    @staticmethod
+    def meta_path(name: str) -> str:
+        return os.path.join(Config.BASE_DIR, name, Server.META_DIR, "meta.json")
+    
+    @staticmethod
+    def load_meta(name: str) -> dict:
+        try:
+            with open(Server.meta_path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @staticmethod
+    def save_meta(name: str, **fields) -> dict:
+        meta = Server.load_meta(name)
+        meta.update(fields)
+        path = Server.meta_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, path)
+        return meta
+    
+    @staticmethod
+    def pid_path(name: str) -> str:
+        """PID del gestor que tiene el servidor en marcha (lo escribe `serve`)."""
+        return os.path.join(Config.BASE_DIR, name, Server.META_DIR, "manager.pid")
+    
+    @staticmethod
+    def running_pid(name: str) -> Optional[int]:
+        try:
+            with open(Server.pid_path(name), encoding="utf-8") as f:
+                pid = int(f.read().strip())
+            os.kill(pid, 0)
+            return pid
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def control_path(name: str) -> str:
+        """Socket por el que el gestor en marcha acepta órdenes "!" de otros procesos."""
+        return os.path.join(Config.BASE_DIR, name, Server.META_DIR, "control.sock")
+    
+    @staticmethod
+    def control(name: str, order: str, timeout: float = 30) -> Optional[dict]:
+        """Envía una orden del gestor (sin "!") y devuelve su respuesta, o None si no hay gestor escuchando."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(timeout)
+                s.connect(Server.control_path(name))
+                s.sendall(f"{order}\n".encode())
+                with s.makefile("rb") as f:
+                    return json.loads(f.readline() or b"null")
+        except (OSError, ValueError):
+            return None
+    
     @staticmethod
     def get_all() -> List[str]:
         if not os.path.exists(Config.BASE_DIR):
             return []
-        return [d for d in os.listdir(Config.BASE_DIR) 
-                if os.path.isdir(os.path.join(Config.BASE_DIR, d))]
+        with os.scandir(Config.BASE_DIR) as it:
+            return sorted(e.name for e in it if not e.name.startswith(".") and e.is_dir())
+    
+    @staticmethod
+    def properties(name: str) -> dict:
+        return Server.read_properties(Server.path(name))
+    
+    @staticmethod
+    def set_property(name: str, key: str, value):
+        """Cambia una clave de server.properties respetando el resto del fichero."""
+        path = os.path.join(Server.path(name), "server.properties")
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            lines = []
+        entry = f"{key}={value}"
+        for i, line in enumerate(lines):
+            if line.split("=", 1)[0].strip() == key:
+                lines[i] = entry
+                break
+        else:
+            lines.append(entry)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    
+    @staticmethod
+    def read_properties(server_dir: str) -> dict:
+        props = {}
+        try:
+            with open(os.path.join(server_dir, "server.properties"), encoding="utf-8") as f:
+                for line in f:
+                    if "=" in line and not line.lstrip().startswith("#"):
+                        key, _, value = line.partition("=")
+                        props[key.strip()] = value.strip()
+        except OSError:
+            pass
+        return props
+    
+    @staticmethod
+    def port(name: str) -> int:
+        value = Server.properties(name).get("server-port", "")
+        return int(value) if value.isdigit() else 25565
+    
+    @staticmethod
+    def live_status(names: List[str]) -> dict:
+        """Estado SLP de los servidores que están escuchando ahora mismo.
+
+        Solo se sondea con asyncio si algún puerto está abierto (lo normal es
+        que no, y así el menú no paga el arranque del bucle). Como varios
+        servidores pueden compartir puerto, la respuesta se atribuye al que
+        aparece en el MOTD o al único que usa ese puerto.
+        """
+        ports = {name: Server.port(name) for name in names}
+        busy = {p for p in set(ports.values()) if Network.is_port_busy(p)}
+        if not busy:
+            return {}
+        results = ServerListPing.poll([("127.0.0.1", p) for p in busy], timeout=1)
+        live = {}
+        for name, port in ports.items():
+            status = results.get(("127.0.0.1", port))
+            shared = sum(1 for p in ports.values() if p == port) > 1
+            if status and (not shared or name in status["motd"]):
+                live[name] = status
+        return live
+    
+    @staticmethod
+    def _count_jars(path: str) -> int:
+        try:
+            with os.scandir(path) as it:
+                return sum(1 for e in it if e.name.endswith(".jar"))
+        except OSError:
+            return 0
+    
+    @staticmethod
+    def dir_size(path: str) -> int:
+        total = 0
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        total += Server.dir_size(e.path)
+                    else:
+                        total += e.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+        return total
     
     @staticmethod
     def get_info(name: str) -> dict:
-        path = os.path.join(Config.BASE_DIR, name)
+        path = Server.path(name)
         info = {"type": "Vanilla", "mods": 0, "plugins": 0, "world": False}
         
-        if os.path.exists(os.path.join(path, "run.sh")):
+        with os.scandir(path) as it:
+            files = {e.name for e in it}
+        
+        meta_type = Server.load_meta(name).get("type")
+        if meta_type:
+            info["type"] = meta_type
+        elif "run.sh" in files:
             info["type"] = "Forge"
         else:
-            for f in os.listdir(path):
-                if f.endswith(".jar") and "installer" not in f.lower():
-                    fl = f.lower()
-                    for t in Config.SERVER_TYPES:
-                        if t.lower() in fl:
-                            info["type"] = t
-                            break
-                    break
-        
-        mods_path = os.path.join(path, "mods")
-        plugins_path = os.path.join(path, "plugins")
+            jar = JarIndex.server_jar(path)
+            info["type"] = (jar and JarIndex.read(os.path.join(path, jar))["type"]) or "Vanilla"
         
-        if os.path.exists(mods_path):
-            info["mods"] = len([f for f in os.listdir(mods_path) if f.endswith(".jar")])
-        if os.path.exists(plugins_path):
-            info["plugins"] = len([f for f in os.listdir(plugins_path) if f.endswith(".jar")])
+        if "mods" in files:
+            info["mods"] = Server._count_jars(os.path.join(path, "mods"))
+        if "plugins" in files:
+            info["plugins"] = Server._count_jars(os.path.join(path, "plugins"))
         
-        info["world"] = os.path.exists(os.path.join(path, "world"))
+        info["world"] = "world" in files
         return info
     
     @staticmethod
     def display_list() -> List[str]:
-        servers = Server.get_all()
+        entries = ServerIndex.entries()
+        servers = [e["name"] for e in entries]
         if not servers:
             return servers
         
@@ -595,8 +1969,9 @@ class Server:
         
         print(f"  {C.DIM}{'─' * 50}{C.RESET}")
         
-        for name in servers:
-            info = Server.get_info(name)
+        live = Server.live_status(servers)
+        for info in entries:
+            name = info["name"]
             type_cfg = Config.SERVER_TYPES.get(info["type"], {"icon": "📦", "color": C.GRAY})
             
             # Iconos
@@ -608,6 +1983,13 @@ class Server:
                 extras.append(f"{info['mods']} mods")
             if info["plugins"]: 
                 extras.append(f"{info['plugins']} plugins")
+            if info.get("world_size"):
+                extras.append(format_size(info["world_size"]))
+            status = live.get(name)
+            if status:
+                extras.append(f"{C.GREEN}en línea {status['online']}/{status['max']}{C.DIM}")
+            elif info.get("last_played"):
+                extras.append(format_ago(info["last_played"]))
             extra_str = f"{C.DIM}({', '.join(extras)}){C.RESET}" if extras else ""
             
             # Formato de tipo
@@ -619,138 +2001,3484 @@ class Server:
         print()
         return servers
 
+class ServerIndex:
+    """Índice global con los datos que muestra el menú principal.
+
+    Cada entrada guarda los mtimes de la carpeta del servidor, `mods/`,
+    `plugins/`, `world/` y su `meta.json`; solo se vuelve a analizar un
+    servidor cuando alguno cambia.
+    """
+    PATH = os.path.join(Config.CACHE_DIR, "servers.json")
+    WATCHED = ("", "mods", "plugins", "world", os.path.join(Server.META_DIR, "meta.json"))
+    
+    @classmethod
+    def _signature(cls, name: str) -> List[int]:
+        path = Server.path(name)
+        sig = []
+        for rel in cls.WATCHED:
+            try:
+                sig.append(os.stat(os.path.join(path, rel)).st_mtime_ns)
+            except OSError:
+                sig.append(0)
+        return sig
+    
+    @classmethod
+    def _load(cls) -> dict:
+        try:
+            with open(cls.PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @classmethod
+    def _build(cls, name: str) -> dict:
+        info = Server.get_info(name)
+        meta = Server.load_meta(name)
+        if info["world"] and "world_size" not in meta:
+            # Primera vez: medir el mundo y dejarlo en meta.json
+            meta = Server.save_meta(name, world_size=Server.dir_size(os.path.join(Server.path(name), "world")))
+        info.update(
+            loader=info["type"],
+            version=meta.get("version"),
+            world_size=meta.get("world_size", 0) if info["world"] else 0,
+            last_played=meta.get("last_played"),
+            sig=cls._signature(name),  # Tras escribir meta.json
+        )
+        return info
+    
+    @classmethod
+    def entries(cls) -> List[dict]:
+        index = cls._load()
+        names = Server.get_all()
+        changed = False
+        result = []
+        
+        for name in names:
+            entry = index.get(name)
+            if not entry or entry.get("sig") != cls._signature(name):
+                try:
+                    entry = cls._build(name)
+                except OSError:
+                    continue
+                index[name] = entry
+                changed = True
+            result.append(dict(entry, name=name))
+        
+        for name in set(index) - set(names):
+            del index[name]
+            changed = True
+        
+        if changed:
+            try:
+                os.makedirs(Config.CACHE_DIR, exist_ok=True)
+                tmp = f"{cls.PATH}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(index, f)
+                os.replace(tmp, cls.PATH)
+            except OSError:
+                pass
+        return result
+
+class JarIndex:
+    """Metadatos de jars leídos del directorio central del zip, sin extraer nada.
+
+    De cada jar se lee el manifiesto y, si están, `fabric.mod.json`,
+    `quilt.mod.json`, `mods.toml` o `plugin.yml`. El resultado se guarda por
+    SHA-1 del contenido, y cada ruta recuerda su tamaño, mtime y SHA-1: un
+    jar sin tocar no se vuelve a abrir, y uno copiado o renombrado no se
+    vuelve a analizar.
+    """
+    PATH = os.path.join(Config.CACHE_DIR, "jars.json")
+    PLATFORM = {"minecraft", "java", "forge", "neoforge", "fabricloader", "fabric-loader", "quilt_loader"}
+    # Main-Class -> tipo de servidor (por prefijo)
+    MAIN_CLASSES = [
+        ("com.mohistmc.", "Mohist"),
+        ("io.papermc.paperclip.", "Paper"),
+        ("net.fabricmc.", "Fabric"),
+        ("net.minecraftforge.fml.relauncher.", "Forge"),   # 1.12 y anteriores
+        ("net.minecraftforge.server.ServerMain", "Forge"),  # 1.13–1.16 (después, run.sh)
+        ("net.minecraft.bundler.", "Vanilla"),
+        ("net.minecraft.server.", "Vanilla"),
+    ]
+    INSTALLERS = ("net.minecraftforge.installer.", "net.neoforged.installer.")
+    SCHEMA = 2  # Se sube al cambiar lo que extrae `_parse`: invalida lo ya analizado
+    _data = None
+    _dirty = False
+    _lock = threading.Lock()
+    
+    @classmethod
+    def _load(cls) -> dict:
+        if cls._data is None:
+            try:
+                with open(cls.PATH, encoding="utf-8") as f:
+                    cls._data = json.load(f)
+            except (OSError, ValueError):
+                cls._data = {}
+            if cls._data.get("schema") != cls.SCHEMA:
+                cls._data = {"schema": cls.SCHEMA}
+            cls._data.setdefault("files", {})
+            cls._data.setdefault("jars", {})
+        return cls._data
+    
+    @classmethod
+    def save(cls):
+        with cls._lock:
+            if not cls._dirty:
+                return
+            data = cls._load()
+            data["files"] = {p: v for p, v in data["files"].items() if os.path.exists(p)}
+            used = {v[2] for v in data["files"].values()}
+            data["jars"] = {h: v for h, v in data["jars"].items() if h in used}
+            try:
+                os.makedirs(Config.CACHE_DIR, exist_ok=True)
+                tmp = f"{cls.PATH}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, cls.PATH)
+                cls._dirty = False
+            except OSError:
+                pass
+    
+    @classmethod
+    def _lookup(cls, path: str) -> Optional[dict]:
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        data = cls._load()
+        known = data["files"].get(path)
+        if known and known[:2] == [st.st_size, st.st_mtime_ns] and known[2] in data["jars"]:
+            return data["jars"][known[2]]
+        
+        digest = Downloader.file_hash(path, "sha1")
+        info = data["jars"].get(digest)
+        if info is None:
+            info = dict(cls._parse(path), sha1=digest)
+        with cls._lock:
+            data["jars"][digest] = info
+            data["files"][path] = [st.st_size, st.st_mtime_ns, digest]
+            cls._dirty = True
+        return info
+    
+    @classmethod
+    def read(cls, path: str) -> Optional[dict]:
+        """Metadatos de un jar (None si no existe)."""
+        info = cls._lookup(path)
+        cls.save()
+        return info
+    
+    @classmethod
+    def read_many(cls, paths: List[str]) -> dict:
+        """{ruta: metadatos} guardando el índice una sola vez."""
+        result = {p: cls._lookup(p) for p in paths}
+        cls.save()
+        return {p: info for p, info in result.items() if info is not None}
+    
+    @classmethod
+    def folder(cls, folder: str) -> dict:
+        """{nombre de fichero: metadatos} de los jars de una carpeta."""
+        try:
+            names = sorted(f for f in os.listdir(folder) if f.endswith(".jar"))
+        except OSError:
+            return {}
+        found = cls.read_many([os.path.join(folder, f) for f in names])
+        return {os.path.basename(p): info for p, info in found.items()}
+    
+    @staticmethod
+    def _manifest(text: str) -> dict:
+        fields = {}
+        key = None
+        for line in text.splitlines():
+            if line.startswith(" ") and key:
+                fields[key] += line[1:]  # Continuación de la línea anterior
+            elif ":" in line:
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+        return fields
+    
+    @staticmethod
+    def _plugin_yml(text: str) -> dict:
+        """Los campos de plugin.yml que interesan, sin depender de un parser de YAML."""
+        fields = {}
+        current = None
+        for line in text.splitlines():
+            m = re.match(r"^([A-Za-z-]+):\s*(.*?)\s*$", line)
+            if m:
+                current, value = m.group(1), m.group(2).strip("'\"")
+                if value.startswith("["):
+                    fields[current] = [v.strip(" '\"") for v in value.strip("[]").split(",") if v.strip()]
+                else:
+                    fields[current] = value if value else []
+            elif current and isinstance(fields.get(current), list):
+                item = re.match(r"^\s+-\s*(.+?)\s*$", line)
+                if item:
+                    fields[current].append(item.group(1).strip("'\""))
+        return fields
+    
+    @staticmethod
+    def _mods_toml(text: str) -> dict:
+        """Las tablas [[mods]] y [[dependencies.x]] de mods.toml, sin tomllib (Python < 3.11).
+
+        Solo claves simples con cadenas, booleanos o números; los textos de
+        varias líneas (la descripción) se saltan.
+        """
+        data = {"mods": [], "dependencies": {}}
+        table = None
+        multiline = None
+        for line in text.splitlines():
+            if multiline:
+                if multiline in line:
+                    multiline = None
+                continue
+            line = line.strip()
+            header = re.match(r"^\[\[\s*([\w.-]+)\s*\]\]", line)
+            if header:
+                key = header.group(1)
+                if key == "mods":
+                    table = {}
+                    data["mods"].append(table)
+                elif key.startswith("dependencies."):
+                    table = {}
+                    data["dependencies"].setdefault(key.split(".", 1)[1], []).append(table)
+                else:
+                    table = None
+                continue
+            if line.startswith("["):
+                table = None
+                continue
+            m = re.match(r"^([\w-]+)\s*=\s*(.*)$", line)
+            if not m or table is None:
+                continue
+            key, value = m.group(1), m.group(2).strip()
+            for quote in ('"""', "'''"):
+                if value.startswith(quote) and value.count(quote) == 1:
+                    multiline = quote
+            if multiline:
+                continue
+            string = re.match(r"^(\"(?:[^\"\\]|\\.)*\"|'[^']*')", value)
+            raw = value.split("#")[0].strip()
+            if string:
+                table[key] = string.group(1)[1:-1]
+            else:
+                table[key] = raw == "true" if raw in ("true", "false") else raw
+        return data
+    
+    @classmethod
+    def _parse(cls, path: str) -> dict:
+        info = {"kind": "library", "type": None, "loader": None, "ids": [], "name": None,
+                "version": None, "depends": [], "main": None}
+        try:
+            with zipfile.ZipFile(path) as z:
+                names = set(z.namelist())
+                
+                def _text(member):
+                    return z.read(member).decode("utf-8", "replace")
+                
+                manifest = cls._manifest(_text("META-INF/MANIFEST.MF")) if "META-INF/MANIFEST.MF" in names else {}
+                info["main"] = manifest.get("Main-Class")
+                
+                if "fabric.mod.json" in names:
+                    data = json.loads(_text("fabric.mod.json"), strict=False)
+                    info.update(kind="mod", loader="fabric", name=data.get("name"), version=data.get("version"),
+                                ids=[data["id"]] + list(data.get("provides", [])),
+                                depends=list(data.get("depends", {})))
+                elif "quilt.mod.json" in names:
+                    data = json.loads(_text("quilt.mod.json"), strict=False)["quilt_loader"]
+                    info.update(kind="mod", loader="quilt", ids=[data["id"]], version=data.get("version"),
+                                name=data.get("metadata", {}).get("name"),
+                                depends=[d if isinstance(d, str) else d.get("id") for d in data.get("depends", [])])
+                elif "META-INF/neoforge.mods.toml" in names or "META-INF/mods.toml" in names:
+                    neo = "META-INF/neoforge.mods.toml" in names
+                    text = _text("META-INF/neoforge.mods.toml" if neo else "META-INF/mods.toml")
+                    data = tomllib.loads(text) if tomllib else cls._mods_toml(text)
+                    mods = [m for m in data.get("mods", []) if "modId" in m]
+                    info.update(kind="mod", loader="neoforge" if neo else "forge", ids=[m["modId"] for m in mods])
+                    if mods:
+                        version = str(mods[0].get("version", ""))
+                        if "${file.jarVersion}" in version:
+                            version = manifest.get("Implementation-Version", version)
+                        info.update(name=mods[0].get("displayName"), version=version)
+                    for deps in data.get("dependencies", {}).values():
+                        for d in deps if isinstance(deps, list) else []:
+                            if d.get("mandatory") or str(d.get("type", "")).lower() == "required":
+                                info["depends"].append(d.get("modId"))
+                elif "paper-plugin.yml" in names or "plugin.yml" in names:
+                    paper = "paper-plugin.yml" in names
+                    data = cls._plugin_yml(_text("paper-plugin.yml" if paper else "plugin.yml"))
+                    name = data.get("name") or None
+                    info.update(kind="plugin", loader="paper" if paper else "bukkit", name=name,
+                                ids=[name] if name else [], version=data.get("version") or None,
+                                depends=data.get("depend") if isinstance(data.get("depend"), list) else [])
+                elif info["main"]:
+                    main = info["main"]
+                    if main.startswith(cls.INSTALLERS):
+                        info.update(kind="installer", type="Forge")
+                    else:
+                        server_type = next((t for prefix, t in cls.MAIN_CLASSES if main.startswith(prefix)), None)
+                        if server_type:
+                            info.update(kind="server", type=server_type)
+                    if info["kind"] == "server":
+                        info["version"] = cls._server_version(z, names, manifest)
+                        if info["type"] == "Paper" and "purpur" in info["version"].lower():
+                            info["type"] = "Purpur"  # Purpur usa el mismo paperclip
+                        info["version"] = re.sub(r"^[a-z]+-", "", info["version"], flags=re.I)
+        except (OSError, zipfile.BadZipFile, ValueError, KeyError, TypeError):  # TOMLDecodeError es un ValueError
+            pass
+        info["depends"] = [d for d in info["depends"] if d and d not in cls.PLATFORM and d not in info["ids"]]
+        return info
+    
+    @staticmethod
+    def _server_version(z: zipfile.ZipFile, names: set, manifest: dict) -> str:
+        """Versión del juego según el jar: versions.list (bundler/paperclip), version.json o install.properties."""
+        if "META-INF/versions.list" in names:
+            line = z.read("META-INF/versions.list").decode("utf-8", "replace").split("\n")[0]
+            parts = line.split("\t")
+            if len(parts) >= 2:
+                return parts[1]
+        if "version.json" in names:
+            data = json.loads(z.read("version.json").decode("utf-8", "replace"))
+            return str(data.get("id") or data.get("name") or "")
+        if "install.properties" in names:
+            for line in z.read("install.properties").decode("utf-8", "replace").splitlines():
+                if line.startswith("game-version="):
+                    return line.split("=", 1)[1].strip()
+        return manifest.get("Implementation-Version", "")
+    
+    @classmethod
+    def server_jar(cls, server_dir: str) -> Optional[str]:
+        """El jar del servidor según su contenido (el resto de jars de la carpeta se descartan).
+
+        Forge 1.13–1.16 y Fabric dejan junto a su jar el vanilla que cargan
+        (`minecraft_server.X.jar`, `server.jar`): un loader gana a Vanilla.
+        """
+        jars = cls.folder(server_dir)
+        servers = sorted((f for f, info in jars.items() if info["kind"] == "server"),
+                         key=lambda f: jars[f]["type"] == "Vanilla")
+        return next(iter(servers), next((f for f, info in jars.items() if info["kind"] == "library"), None))
+
 # =====================================================
 # VERSIONES Y DESCARGAS
 # =====================================================
 
-class Versions:
-    CACHE = {}
+def version_key(version: str) -> List[int]:
+    """Clave de orden numérico para versiones tipo '1.20.4'."""
+    return [int(n) if n.isdigit() else 0 for n in re.split(r"[.\-]", version)]
+
+class MetaCache:
+    """Caché persistente de metadatos remotos (manifest de Mojang, Forge, Mohist...).
+
+    Cada respuesta se guarda en disco con su ETag/Last-Modified. Mientras no
+    caduque el TTL de su fuente se sirve sin tocar la red; después se
+    revalida con una petición condicional (304 = sin cambios) y, si no hay
+    red, se sirve la copia caducada.
+    """
+    DIR = os.path.join(Config.CACHE_DIR, "meta")
+    DEFAULT_TTL = 3600
+    TTL = {
+        "mojang": 3600,
+        "mojang-version": 30 * 86400,  # El JSON de una versión no cambia
+        "forge": 6 * 3600,
+        "forge-maven": 6 * 3600,
+        "forge-sha1": 30 * 86400,
+        "mohist": 6 * 3600,
+        "paper": 600,
+        "purpur": 600,
+        "fabric": 3600,
+    }
+    
+    _mem = {}
+    _parsed = {}
+    _lock = threading.Lock()
+    _inflight = {}
+    _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="meta")
+    
+    @classmethod
+    def _path(cls, source: str, url: str) -> str:
+        return os.path.join(cls.DIR, f"{source}-{hashlib.sha1(url.encode()).hexdigest()[:16]}.json")
+    
+    @classmethod
+    def _load(cls, path: str) -> Optional[dict]:
+        with cls._lock:
+            if path in cls._mem:
+                return cls._mem[path]
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            cls._mem[path] = entry
+            return entry
+    
+    @classmethod
+    def _save(cls, path: str, entry: dict):
+        with cls._lock:
+            cls._mem[path] = entry
+            try:
+                os.makedirs(cls.DIR, exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+    
+    @classmethod
+    def _decode(cls, path: str, entry: dict, as_json: bool):
+        if not as_json:
+            return entry["body"]
+        memo = cls._parsed.get(path)
+        if memo and memo[0] == entry["stamp"]:
+            return memo[1]
+        data = json.loads(entry["body"])
+        cls._parsed[path] = (entry["stamp"], data)
+        return data
+    
+    @classmethod
+    def get(cls, source: str, url: str, as_json: bool = True, ttl: Optional[int] = None):
+        """Devuelve el contenido de `url` (JSON o texto) o None si nunca se pudo obtener."""
+        path = cls._path(source, url)
+        entry = cls._load(path)
+        ttl = cls.TTL.get(source, cls.DEFAULT_TTL) if ttl is None else ttl
+        now = time.time()
+        
+        if entry and now - entry["checked"] < ttl:
+            return cls._decode(path, entry, as_json)
+        
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        
+        try:
+            r = HttpPool.session(url).get(url, headers=headers, timeout=10)
+            if r.status_code == 304 and entry:
+                entry = dict(entry, checked=now)
+            else:
+                r.raise_for_status()
+                if as_json:
+                    r.json()  # Validar antes de guardar
+                entry = {
+                    "url": url,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "checked": now,
+                    "stamp": hashlib.sha1(r.content).hexdigest(),
+                    "body": r.text,
+                }
+            cls._save(path, entry)
+        except Exception:
+            if not entry:
+                return None
+            # Sin red: servimos la copia caducada
+        return cls._decode(path, entry, as_json)
+    
+    @classmethod
+    def submit(cls, source: str, url: str, as_json: bool = True):
+        """Como `get`, pero en segundo plano y compartiendo peticiones idénticas en curso."""
+        key = (source, url, as_json)
+        with cls._lock:
+            fut = cls._inflight.get(key)
+            if fut is None:
+                fut = cls._executor.submit(cls.get, source, url, as_json)
+                cls._inflight[key] = fut
+                fut.add_done_callback(lambda _: cls._inflight.pop(key, None))
+            return fut
+    
+    @classmethod
+    async def get_async(cls, source: str, url: str, as_json: bool = True):
+        return await asyncio.wrap_future(cls.submit(source, url, as_json))
+    
+    @classmethod
+    def stamp(cls, source: str, url: str) -> Optional[str]:
+        """Huella del contenido actualmente en caché (cambia solo si cambia el cuerpo)."""
+        entry = cls._load(cls._path(source, url))
+        return entry["stamp"] if entry else None
+
+class VersionIndex:
+    """Índice persistente, ya ordenado, de todas las versiones por familia."""
+    PATH = os.path.join(Config.CACHE_DIR, "versions.json")
+    _data = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def _all(cls) -> dict:
+        if cls._data is None:
+            try:
+                with open(cls.PATH, encoding="utf-8") as f:
+                    cls._data = json.load(f)
+            except (OSError, ValueError):
+                cls._data = {}
+        return cls._data
+    
+    @classmethod
+    def get(cls, family: str, stamp: Optional[str] = None) -> Optional[List[str]]:
+        """Versiones indexadas; si se da `stamp`, solo si el índice corresponde a esa huella."""
+        entry = cls._all().get(family)
+        if not entry or (stamp and entry.get("stamp") != stamp):
+            return None
+        return entry["versions"]
+    
+    @classmethod
+    def put(cls, family: str, stamp: Optional[str], versions: List[str], keep_order: bool = False) -> List[str]:
+        if not keep_order:
+            versions = sorted(set(versions), key=version_key, reverse=True)
+        with cls._lock:
+            cls._all()[family] = {"stamp": stamp, "versions": versions}
+            try:
+                os.makedirs(Config.CACHE_DIR, exist_ok=True)
+                tmp = f"{cls.PATH}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(cls._data, f)
+                os.replace(tmp, cls.PATH)
+            except OSError:
+                pass
+        return versions
+    
+    @classmethod
+    def search(cls, family: str, query: str, limit: int = 15) -> List[str]:
+        """Busca versiones que empiecen por `query` (o lo contengan, como segunda opción)."""
+        versions = cls.get(family) or []
+        query = query.strip()
+        prefix = [v for v in versions if v.startswith(query)]
+        if prefix:
+            return prefix[:limit]
+        return [v for v in versions if query in v][:limit]
+
+class Versions:
+    CACHE = {}
+    MENU_SIZE = 15
+    MOJANG_MANIFEST = "https://launchermeta.mojang.com/mc/game/version_manifest.json"
+    FORGE_PROMOS = "https://files.minecraftforge.net/net/minecraftforge/forge/promotions_slim.json"
+    MOHIST_PROJECT = "https://mohistmc.com/api/v2/projects/mohist"
+    
+    @staticmethod
+    def family(server_type: str) -> str:
+        return {"Forge": "forge", "Mohist": "mohist"}.get(server_type, "minecraft")
+    
+    @classmethod
+    def get(cls, server_type: str) -> List[str]:
+        if server_type in cls.CACHE:
+            return cls.CACHE[server_type]
+        
+        fetchers = {
+            "minecraft": cls._minecraft,
+            "forge": cls._forge,
+            "mohist": cls._mohist,
+        }
+        
+        versions = fetchers[cls.family(server_type)]()[:cls.MENU_SIZE]
+        if versions:
+            cls.CACHE[server_type] = versions
+        return versions
+    
+    @classmethod
+    def search(cls, server_type: str, query: str) -> List[str]:
+        cls.get(server_type)  # Asegura que el índice exista
+        return VersionIndex.search(cls.family(server_type), query)
+    
+    @staticmethod
+    def _indexed(family: str, source: str, url: str, parse, keep_order: bool = False) -> List[str]:
+        data = MetaCache.submit(source, url).result()
+        stamp = MetaCache.stamp(source, url)
+        versions = VersionIndex.get(family, stamp)
+        if versions is not None:
+            return versions
+        if data is None:
+            return VersionIndex.get(family) or []
+        try:
+            parsed = parse(data)
+        except Exception:
+            return VersionIndex.get(family) or []
+        return VersionIndex.put(family, stamp, parsed, keep_order)
+    
+    @staticmethod
+    def _minecraft() -> List[str]:
+        # El manifest ya viene ordenado por fecha de publicación
+        return Versions._indexed(
+            "minecraft", "mojang", Versions.MOJANG_MANIFEST,
+            lambda d: [v["id"] for v in d["versions"] if v["type"] == "release"],
+            keep_order=True)
+    
+    @staticmethod
+    def _forge() -> List[str]:
+        def parse(d):
+            return [k.replace("-recommended", "").replace("-latest", "") for k in d.get("promos", {})]
+        versions = Versions._indexed("forge", "forge", Versions.FORGE_PROMOS, parse)
+        return versions or Versions._minecraft()[:10]
+    
+    @staticmethod
+    def _mohist() -> List[str]:
+        return Versions._indexed("mohist", "mohist", Versions.MOHIST_PROJECT,
+                                 lambda d: d.get("versions", []))
+
+class Downloads:
+    """Resuelve versión, build, URL y hash publicado de cada tipo de servidor.
+
+    Todas las consultas pasan por MetaCache (pool por host, caché en disco y
+    peticiones en curso compartidas), y las que no dependen entre sí se
+    lanzan a la vez.
+    """
+    FORGE_MAVEN = "https://maven.minecraftforge.net/net/minecraftforge/forge"
+    PAPER_API = "https://papermc.io/api/v2/projects/paper/versions"
+    PURPUR_API = "https://api.purpurmc.org/v2/purpur"
+    FABRIC_META = "https://meta.fabricmc.net/v2/versions"
+    MOHIST_API = "https://mohistmc.com/api/v2/projects/mohist"
+    
+    @classmethod
+    async def resolve_async(cls, server_type: str, version: str) -> Optional[dict]:
+        handlers = {
+            "Vanilla": cls._vanilla,
+            "Forge": cls._forge,
+            "Paper": cls._paper,
+            "Fabric": cls._fabric,
+            "Mohist": cls._mohist,
+            "Purpur": cls._purpur,
+        }
+        handler = handlers.get(server_type)
+        if not handler:
+            return None
+        try:
+            found = await handler(version)
+        except Exception:
+            return None
+        if found:
+            found.update(type=server_type, version=version)
+        return found
+    
+    @classmethod
+    def resolve(cls, server_type: str, version: str) -> Optional[dict]:
+        """Devuelve {"type", "version", "build", "url", "checksum": "algo:hex" | None} o None."""
+        return asyncio.run(cls.resolve_async(server_type, version))
+    
+    @classmethod
+    def resolve_many(cls, pairs: List[tuple]) -> List[Optional[dict]]:
+        """Resuelve varios pares (tipo, versión) en una sola pasada concurrente."""
+        async def _all():
+            return await asyncio.gather(*(cls.resolve_async(t, v) for t, v in pairs))
+        return asyncio.run(_all())
+    
+    @classmethod
+    def get_url(cls, server_type: str, version: str) -> Optional[str]:
+        info = cls.resolve(server_type, version)
+        return info["url"] if info else None
+    
+    @staticmethod
+    def _result(url: str, checksum: Optional[str] = None, build=None) -> dict:
+        return {"build": build, "url": url, "checksum": checksum}
+    
+    @staticmethod
+    async def _vanilla(version: str) -> Optional[dict]:
+        # Mismo manifest (y misma caché) que usa Versions._minecraft
+        manifest = await MetaCache.get_async("mojang", Versions.MOJANG_MANIFEST)
+        url = next((v["url"] for v in manifest["versions"] if v["id"] == version), None) if manifest else None
+        if not url:
+            return None
+        meta = await MetaCache.get_async("mojang-version", url)
+        server = meta["downloads"]["server"]
+        checksum = f"sha1:{server['sha1']}" if server.get("sha1") else None
+        return Downloads._result(server["url"], checksum)
+    
+    @staticmethod
+    async def _forge(version: str) -> Optional[dict]:
+        base = Downloads.FORGE_MAVEN
+        promos = await MetaCache.get_async("forge", Versions.FORGE_PROMOS)
+        promos = (promos or {}).get("promos", {})
+        build = promos.get(f"{version}-recommended") or promos.get(f"{version}-latest")
+        
+        if build:
+            full = f"{version}-{build}"
+            url = f"{base}/{full}/forge-{full}-installer.jar"
+            sha1 = await MetaCache.get_async("forge-sha1", f"{url}.sha1", as_json=False)
+            if sha1:
+                return Downloads._result(url, f"sha1:{sha1.strip()[:40]}", build)
+        
+        # Versiones antiguas usan otro esquema de nombres: consultar el metadata de Maven
+        xml = await MetaCache.get_async("forge-maven", f"{base}/maven-metadata.xml", as_json=False)
+        if not xml:
+            return None
+        versions = [v.text for v in ET.fromstring(xml).iter("version")
+                    if v.text and v.text.startswith(f"{version}-")]
+        if not versions:
+            return None
+        full = max(versions, key=version_key)
+        url = f"{base}/{full}/forge-{full}-installer.jar"
+        sha1 = await MetaCache.get_async("forge-sha1", f"{url}.sha1", as_json=False)
+        return Downloads._result(url, f"sha1:{sha1.strip()[:40]}" if sha1 else None, full[len(version) + 1:])
+    
+    @staticmethod
+    async def _paper(version: str) -> Optional[dict]:
+        base = f"{Downloads.PAPER_API}/{version}"
+        builds = await MetaCache.get_async("paper", f"{base}/builds")
+        builds = (builds or {}).get("builds", [])
+        if not builds:
+            return None
+        b = builds[-1]
+        app = b["downloads"]["application"]
+        checksum = f"sha256:{app['sha256']}" if app.get("sha256") else None
+        return Downloads._result(f"{base}/builds/{b['build']}/downloads/{app['name']}", checksum, b["build"])
+    
+    @staticmethod
+    async def _fabric(version: str) -> Optional[dict]:
+        loader, installer = await asyncio.gather(
+            MetaCache.get_async("fabric", f"{Downloads.FABRIC_META}/loader"),
+            MetaCache.get_async("fabric", f"{Downloads.FABRIC_META}/installer"),
+        )
+        lv = next((v["version"] for v in loader or [] if v.get("stable")), None)
+        iv = next((v["version"] for v in installer or [] if v.get("stable")), None)
+        if not (lv and iv):
+            return None
+        return Downloads._result(f"{Downloads.FABRIC_META}/loader/{version}/{lv}/{iv}/server/jar", None, f"{lv}/{iv}")
+    
+    @staticmethod
+    async def _mohist(version: str) -> Optional[dict]:
+        data = await MetaCache.get_async("mohist", f"{Downloads.MOHIST_API}/{version}/builds")
+        builds = (data or {}).get("builds", [])
+        if not builds:
+            return None
+        b = builds[-1]
+        checksum = f"md5:{b['fileMd5']}" if b.get("fileMd5") else None
+        return Downloads._result(b["url"], checksum, b.get("number"))
+    
+    @staticmethod
+    async def _purpur(version: str) -> Optional[dict]:
+        # "latest" devuelve el build con su md5 en una sola petición
+        b = await MetaCache.get_async("purpur", f"{Downloads.PURPUR_API}/{version}/latest")
+        if not b or "build" not in b:
+            return None
+        checksum = f"md5:{b['md5']}" if b.get("md5") else None
+        return Downloads._result(f"{Downloads.PURPUR_API}/{version}/{b['build']}/download", checksum, b["build"])
+
+# =====================================================
+# PRECARGA EN SEGUNDO PLANO
+# =====================================================
+
+class Prefetch:
+    """Adelanta el trabajo de red de create_server mientras el usuario elige.
+
+    Al mostrar el menú se cargan las versiones de todos los tipos y se
+    resuelve la URL de la versión más reciente de cada uno. Con
+    `PREFETCH_JAR_MB` > 0 también se descargan los primeros MB del jar
+    elegido al `.part` del almacén, que luego se reanuda. Todo es cancelable.
+    """
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+    _cancel = threading.Event()
+    _resolved = {}
+    _warming = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def start(cls):
+        """Precarga versiones de todos los tipos y la URL de su versión más reciente."""
+        cls._cancel.clear()
+        for server_type in Config.SERVER_TYPES:
+            cls._executor.submit(cls._warm_type, server_type)
+    
+    @classmethod
+    def _warm_type(cls, server_type: str):
+        if cls._cancel.is_set():
+            return
+        versions = Versions.get(server_type)
+        if versions and not cls._cancel.is_set():
+            cls.resolve(server_type, versions[0])
+    
+    @classmethod
+    def resolve(cls, server_type: str, version: str):
+        """Future compartido con el resultado de Downloads.resolve."""
+        key = (server_type, version)
+        with cls._lock:
+            fut = cls._resolved.get(key)
+            # Un fallo (None o excepción, p. ej. sin red un momento) no se guarda: se reintenta
+            if fut is None or fut.cancelled() or (fut.done() and (fut.exception() or fut.result() is None)):
+                fut = cls._executor.submit(Downloads.resolve, server_type, version)
+                cls._resolved[key] = fut
+            return fut
+    
+    @classmethod
+    def result(cls, server_type: str, version: str) -> Optional[dict]:
+        fut = cls.resolve(server_type, version)
+        if not fut.done():
+            with Spinner("Resolviendo descarga"):
+                return fut.result()
+        return fut.result()
+    
+    @staticmethod
+    def jar_bytes() -> int:
+        try:
+            return int(os.getenv("PREFETCH_JAR_MB", "0") or 0) * 1048576
+        except ValueError:
+            return 0
+    
+    @classmethod
+    def warm_jar(cls, server_type: str, version: str):
+        """Empieza a bajar los primeros bytes del jar si así se configuró."""
+        limit = cls.jar_bytes()
+        if not limit or cls._cancel.is_set():
+            return
+        
+        def _warm():
+            target = cls.resolve(server_type, version).result()
+            if not target or cls._cancel.is_set():
+                return
+            # Con el lock de la URL, Store.fetch no escribe el mismo .part a la vez: espera a que termine
+            with Store.url_lock(target["url"]):
+                if cls._cancel.is_set() or Store.lookup(target["url"], target["checksum"]):
+                    return
+                try:
+                    Downloader(target["url"], Store.staging_path(target["url"]), target["checksum"],
+                               quiet=True).warm(limit, cls._cancel)
+                except Exception:
+                    pass
+        
+        with cls._lock:
+            key = (server_type, version)
+            if key not in cls._warming:
+                cls._warming[key] = cls._executor.submit(_warm)
+    
+    @classmethod
+    def cancel(cls):
+        """Detiene la precarga. Una precarga que aún escriba su `.part` tiene el lock
+        de la URL, así que Store.fetch la espera aunque aquí se deje de esperar."""
+        cls._cancel.set()
+        with cls._lock:
+            for fut in list(cls._resolved.values()):
+                fut.cancel()
+            warming = list(cls._warming.values())
+            cls._warming.clear()
+        for fut in warming:
+            try:
+                fut.result(timeout=10)
+            except Exception:
+                pass
+
+# =====================================================
+# CONSOLA DEL SERVIDOR
+# =====================================================
+
+class ConsoleLog:
+    """Log de consola comprimido y rotativo, escrito desde su propio hilo."""
+    MAX_BYTES = 16 * 1048576  # Texto sin comprimir por fichero
+    KEEP = 10
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def write(self, text: str):
+        self._queue.put(text)
+    
+    def close(self, timeout: float = 5):
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = datetime.now().strftime("console-%Y%m%d-%H%M%S-%f.log.gz")
+        files = sorted(f for f in os.listdir(self.directory) if f.startswith("console-"))
+        for old in files[:max(0, len(files) - self.KEEP + 1)]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+        return gzip.open(os.path.join(self.directory, name), "wt", encoding="utf-8", compresslevel=6)
+    
+    def _run(self):
+        f, written = None, 0
+        try:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                while item is not None and not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    batch.append(item)
+                text = "".join(t for t in batch if t)
+                if text:
+                    if f is None or written >= self.MAX_BYTES:
+                        if f:
+                            f.close()
+                        f, written = self._open(), 0
+                    f.write(text)
+                    written += len(text)
+                if item is None:
+                    break
+        except OSError:
+            pass
+        finally:
+            if f:
+                f.close()
+
+class Console:
+    """Salida de la consola del servidor.
+
+    Decodifica UTF-8 de forma incremental (un carácter partido entre dos
+    lecturas ya no rompe nada), ajusta el tamaño de lectura a la carga,
+    agrupa las escrituras al terminal, guarda las últimas líneas en memoria
+    y las manda al log comprimido sin bloquear la lectura.
+    """
+    MIN_READ = 4096
+    MAX_READ = 256 * 1024
+    FLUSH_INTERVAL = 0.05   # Máxima espera antes de pintar lo pendiente
+    RING_LINES = 2000
+    
+    def __init__(self, log_dir: Optional[str] = None, out=None, echo: bool = True):
+        self.out = out or sys.stdout
+        self.echo = echo
+        self.lines = deque(maxlen=self.RING_LINES)
+        self.log = ConsoleLog(log_dir) if log_dir else None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+        self._pending = []
+        self._pending_since = None
+        self._listeners = []
+        self._read_size = self.MIN_READ
+    
+    def add_listener(self, fn):
+        """`fn(linea)` se llama con cada línea completa (sin códigos ANSI)."""
+        self._listeners.append(fn)
+    
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+    
+    def tail(self, n: int = 50) -> List[str]:
+        return list(self.lines)[-n:]
+    
+    def feed(self, data: bytes, final: bool = False):
+        text = self._decoder.decode(data, final)
+        if not text:
+            return
+        if self.echo:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(text)
+        if self.log:
+            self.log.write(text.replace("\r", ""))
+        
+        chunks = (self._partial + text).split("\n")
+        self._partial = chunks.pop()
+        for raw in chunks:
+            line = strip_ansi(raw.rstrip("\r"))
+            self.lines.append(line)
+            for fn in list(self._listeners):
+                try:
+                    fn(line)
+                except Exception:
+                    pass
+    
+    def flush(self):
+        if self._pending:
+            self.out.write("".join(self._pending))
+            self.out.flush()
+            self._pending.clear()
+            self._pending_since = None
+    
+    def _adapt(self, n: int):
+        if n >= self._read_size:
+            self._read_size = min(self._read_size * 2, self.MAX_READ)
+        elif n < self._read_size // 4:
+            self._read_size = max(self._read_size // 2, self.MIN_READ)
+    
+    def pump(self, fd: int):
+        """Lee `fd` hasta EOF (bucle del hilo lector)."""
+        try:
+            while True:
+                timeout = None
+                if self._pending_since is not None:
+                    timeout = max(0.0, self._pending_since + self.FLUSH_INTERVAL - time.monotonic())
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if not ready:
+                    self.flush()
+                    continue
+                data = os.read(fd, self._read_size)
+                if not data:
+                    break
+                self._adapt(len(data))
+                self.feed(data)
+                if (self._pending_since is not None
+                        and time.monotonic() - self._pending_since >= self.FLUSH_INTERVAL):
+                    self.flush()
+        except (OSError, ValueError):
+            pass  # EIO al cerrarse el pty
+        finally:
+            self.feed(b"", final=True)
+            self.flush()
+    
+    def attach(self, loop, fd: int, on_eof):
+        """Como `pump`, pero atendido por el bucle de eventos con `add_reader`."""
+        flush_handle = [None]
+        
+        def _timed_flush():
+            flush_handle[0] = None
+            self.flush()
+        
+        def _readable():
+            try:
+                data = os.read(fd, self._read_size)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""  # EIO al cerrarse el pty
+            if not data:
+                loop.remove_reader(fd)
+                if flush_handle[0]:
+                    flush_handle[0].cancel()
+                self.feed(b"", final=True)
+                self.flush()
+                on_eof()
+                return
+            self._adapt(len(data))
+            self.feed(data)
+            if self._pending_since is not None and flush_handle[0] is None:
+                flush_handle[0] = loop.call_later(self.FLUSH_INTERVAL, _timed_flush)
+        
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, _readable)
+    
+    def close(self):
+        if self.log:
+            self.log.close()
+
+# =====================================================
+# ARRANQUE SIN INTERFAZ Y MEDICIÓN
+# =====================================================
+
+class Resources:
+    """Memoria y CPU que de verdad puede usar el contenedor.
+
+    psutil informa de la máquina anfitriona; en un Codespace el límite real
+    lo pone el cgroup (v1 o v2), igual que la cuota de CPU. `suggest`
+    descuenta lo que la JVM usa fuera del heap para que el total quepa.
+    """
+    CGROUP_ROOT = "/sys/fs/cgroup"
+    OS_RESERVE_MB = 384        # Gestor, túnel y sistema
+    CODE_CACHE_MB = 240        # ReservedCodeCacheSize por defecto con compilación escalonada
+    MIN_HEAP_MB = 1024
+    
+    @staticmethod
+    def _read(path: str) -> Optional[str]:
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    
+    @classmethod
+    def _cgroup_dirs(cls, controller: str) -> List[str]:
+        """Directorios del cgroup del proceso, del más concreto a la raíz."""
+        dirs = []
+        for line in (cls._read("/proc/self/cgroup") or "").splitlines():
+            parts = line.split(":", 2)
+            if len(parts) != 3:
+                continue
+            _, controllers, rel = parts
+            if controller == "" and controllers == "":
+                base = cls.CGROUP_ROOT
+            elif controller and controller in controllers.split(","):
+                base = os.path.join(cls.CGROUP_ROOT, controllers)
+                if not os.path.isdir(base):
+                    base = os.path.join(cls.CGROUP_ROOT, controller)
+            else:
+                continue
+            rel = rel.strip("/")
+            while True:
+                dirs.append(os.path.join(base, rel) if rel else base)
+                if not rel:
+                    break
+                rel = os.path.dirname(rel)
+        return dirs
+    
+    @classmethod
+    def cgroup_version(cls) -> Optional[str]:
+        if os.path.exists(os.path.join(cls.CGROUP_ROOT, "cgroup.controllers")):
+            return "v2"
+        if os.path.isdir(os.path.join(cls.CGROUP_ROOT, "memory")):
+            return "v1"
+        return None
+    
+    @classmethod
+    def memory_limit(cls) -> int:
+        """Bytes de memoria utilizables: el menor entre la máquina y los límites del cgroup."""
+        limit = psutil.virtual_memory().total
+        candidates = [(d, "memory.max") for d in cls._cgroup_dirs("")]
+        candidates += [(d, "memory.limit_in_bytes") for d in cls._cgroup_dirs("memory")]
+        for directory, name in candidates:
+            value = cls._read(os.path.join(directory, name))
+            if value and value.isdigit():
+                limit = min(limit, int(value))  # v1 usa ~2^63 como "sin límite"
+        return limit
+    
+    @classmethod
+    def memory_available(cls) -> int:
+        """Bytes libres ahora mismo, respetando también el consumo del cgroup."""
+        available = psutil.virtual_memory().available
+        limit = cls.memory_limit()
+        for directory, name in ([(d, "memory.current") for d in cls._cgroup_dirs("")[:1]] +
+                                [(d, "memory.usage_in_bytes") for d in cls._cgroup_dirs("memory")[:1]]):
+            value = cls._read(os.path.join(directory, name))
+            if value and value.isdigit():
+                available = min(available, max(0, limit - int(value)))
+        return available
+    
+    @classmethod
+    def cpu_limit(cls) -> float:
+        """CPUs efectivas: afinidad del proceso limitada por la cuota del cgroup."""
+        try:
+            cpus = float(len(os.sched_getaffinity(0)))
+        except AttributeError:
+            cpus = float(os.cpu_count() or 1)
+        for directory in cls._cgroup_dirs(""):
+            value = cls._read(os.path.join(directory, "cpu.max"))
+            if value:
+                quota, _, period = value.partition(" ")
+                if quota != "max" and period:
+                    cpus = min(cpus, int(quota) / int(period))
+        for directory in cls._cgroup_dirs("cpu"):
+            quota = cls._read(os.path.join(directory, "cpu.cfs_quota_us"))
+            period = cls._read(os.path.join(directory, "cpu.cfs_period_us"))
+            if quota and period and quota.lstrip("-").isdigit() and int(quota) > 0:
+                cpus = min(cpus, int(quota) / int(period))
+        return max(cpus, 1.0)
+    
+    @classmethod
+    def overhead_mb(cls, cores: int, mods: int = 0) -> dict:
+        """Memoria que la JVM usa fuera del heap, estimada por partes."""
+        return {
+            "metaspace": min(128 + mods * 2, 1024),
+            "code_cache": cls.CODE_CACHE_MB,
+            "thread_stacks": 48 + cores * 4 + mods // 4,   # ~1 MB por hilo
+            "direct_buffers": 128 + mods // 2,             # Netty, compresión de chunks
+            "os_reserve": cls.OS_RESERVE_MB,
+        }
+    
+    @classmethod
+    def suggest(cls, mods: int = 0, limit_mb: Optional[int] = None, cpus: Optional[float] = None) -> dict:
+        """Heap y presupuesto de hilos de GC/JIT que caben en los límites reales.
+
+        `limit_mb` y `cpus` sustituyen a los del contenedor cuando el servidor
+        solo tiene una parte (varias instancias a la vez). El heap nunca se
+        sube al mínimo: pasarse del límite llevaría al OOM-killer, así que si
+        no llega se marca `too_small` y quien arranca debe rechazarlo.
+        """
+        limit_mb = limit_mb if limit_mb is not None else cls.memory_limit() // 1048576
+        cpus = cpus if cpus is not None else cls.cpu_limit()
+        cores = max(1, int(cpus))
+        overhead = cls.overhead_mb(cores, mods)
+        fixed = sum(overhead.values())
+        # Estructuras internas del GC (remembered sets, marcado): ~5% del heap
+        heap_mb = max(0, int((limit_mb - fixed) / 1.05) // 256 * 256)
+        
+        parallel = cores if cores <= 8 else 8 + (cores - 8) * 5 // 8
+        conc = max(1, (parallel + 2) // 4)
+        ci = 2 if cores <= 2 else 3 if cores <= 4 else 4 if cores <= 8 else min(12, cores // 2)
+        return {
+            "limit_mb": limit_mb,
+            "host_mb": psutil.virtual_memory().total // 1048576,
+            "container_mb": cls.memory_limit() // 1048576,
+            "cgroup": cls.cgroup_version(),
+            "cpus": cpus,
+            "cores": cores,
+            "heap_mb": heap_mb,
+            "too_small": heap_mb < cls.MIN_HEAP_MB,
+            "overhead_mb": overhead,
+            "parallel_gc_threads": parallel,
+            "conc_gc_threads": conc,
+            "ci_compiler_count": ci,
+        }
+
+    @classmethod
+    def no_room(cls, budget: dict) -> str:
+        """Mensaje para un presupuesto `too_small` de un servidor solo."""
+        return (f"Con {budget['limit_mb']}MB no caben el heap mínimo ({cls.MIN_HEAP_MB}MB) y "
+                f"{sum(budget['overhead_mb'].values())}MB fuera del heap. Indica la RAM a mano")
+
+class Instances:
+    """Varios servidores a la vez: puerto, RAM y CPUs propios para cada uno.
+
+    Cada gestor en marcha deja en `.mcsm/instance.json` su puerto, su heap
+    y las CPUs a las que está fijado. Al planificar un arranque se descuenta
+    lo que ya ocupan los demás: la RAM restante del cgroup se reparte a
+    partes iguales entre las instancias nuevas (el heap de una JVM en marcha
+    no se puede encoger), y las CPUs se dividen en grupos disjuntos entre
+    todas, volviendo a fijar las que ya corrían, para que los hilos de GC y
+    JIT de una no compitan con los de otra. La JVM nace ya fijada a su
+    grupo, así que calcula sus hilos con él.
+    """
+    STATE = "instance.json"
+    _lock = threading.Lock()
+    _reserved = set()  # Puertos dados a servidores que se están creando
+    
+    @staticmethod
+    def state_path(name: str) -> str:
+        return os.path.join(Server.path(name), Server.META_DIR, Instances.STATE)
+    
+    @staticmethod
+    def running(exclude: tuple = ()) -> dict:
+        """{nombre: estado} de los servidores con un gestor vivo."""
+        result = {}
+        for name in Server.get_all():
+            if name in exclude or not Server.running_pid(name):
+                continue
+            try:
+                with open(Instances.state_path(name), encoding="utf-8") as f:
+                    result[name] = json.load(f)
+            except (OSError, ValueError):
+                result[name] = {"port": Server.port(name), "reserved_mb": 0, "cpus": []}
+        return result
+    
+    @staticmethod
+    def configured_ports(exclude: tuple = ()) -> set:
+        ports = set()
+        for name in Server.get_all():
+            port = Server.properties(name).get("server-port", "") if name not in exclude else ""
+            if port.isdigit():
+                ports.add(int(port))
+        return ports
+    
+    @staticmethod
+    def free_port(taken: set) -> int:
+        port = Config.MC_PORT
+        while port in taken or Network.is_port_busy(port):
+            port += 1
+        return port
+    
+    @classmethod
+    def reserve_port(cls) -> int:
+        """Puerto para un servidor nuevo, distinto del de todos los demás (también entre hilos)."""
+        with cls._lock:
+            port = cls.free_port(cls.configured_ports() | cls._reserved)
+            cls._reserved.add(port)
+            return port
+    
+    @staticmethod
+    def assign_port(name: str, claimed: set) -> int:
+        """Puerto para `name`: el suyo si nadie lo reclama; si no, uno libre. Queda en server.properties."""
+        configured = Server.properties(name).get("server-port", "")
+        port = int(configured) if configured.isdigit() else None
+        # Ocupado sin que lo reclame una instancia: no se sabe de quién es, así que no se mata
+        if port is None or port in claimed or Network.is_port_busy(port):
+            port = Instances.free_port(claimed | Instances.configured_ports(exclude=(name,)))
+        if str(port) != configured:
+            Server.set_property(name, "server-port", port)
+        return port
+    
+    @staticmethod
+    def split_cpus(cpus: List[int], count: int) -> List[List[int]]:
+        """`count` grupos disjuntos y contiguos (si no llegan, se reparten en rueda)."""
+        if count <= 0:
+            return []
+        if len(cpus) < count:
+            return [[cpus[i % len(cpus)]] for i in range(count)] if cpus else [[] for _ in range(count)]
+        size, extra = divmod(len(cpus), count)
+        groups, start = [], 0
+        for i in range(count):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(cpus[start:end])
+            start = end
+        return groups
+    
+    @staticmethod
+    def free_mb(others: dict) -> int:
+        """RAM del cgroup que no han reservado las instancias en marcha."""
+        limit_mb = Resources.memory_limit() // 1048576
+        return max(0, limit_mb - sum(o.get("reserved_mb", 0) for o in others.values()))
+    
+    @staticmethod
+    def plan(names: List[str]) -> List[dict]:
+        """Puerto, CPUs y presupuesto de memoria para arrancar `names` junto a lo que ya corre."""
+        others = Instances.running(exclude=tuple(names))
+        free_mb = Instances.free_mb(others)
+        try:
+            allowed = sorted(psutil.Process().cpu_affinity())
+        except (AttributeError, psutil.Error):
+            allowed = list(range(os.cpu_count() or 1))
+        
+        total = len(others) + len(names)
+        groups = Instances.split_cpus(allowed, total) if total > 1 else [[]]
+        # La cuota del cgroup también se reparte: fijar más CPUs de las que se pueden usar no ayuda
+        quota = Resources.cpu_limit() / total
+        
+        claimed = {o["port"] for o in others.values() if o.get("port")}
+        share_mb = free_mb // len(names)
+        plans = []
+        for name, cpus in zip(names, groups[len(others):]):
+            port = Instances.assign_port(name, claimed)
+            claimed.add(port)
+            cpu_share = max(1.0, min(len(cpus), quota)) if cpus else quota
+            budget = Resources.suggest(Server.get_info(name)["mods"], share_mb, cpu_share)
+            plans.append({"name": name, "port": port, "cpus": cpus, "heap_mb": budget["heap_mb"],
+                          "budget": budget, "others": sorted(others), "resize": [],
+                          "too_small": budget["too_small"]})
+        if any(p["too_small"] for p in plans):
+            return plans  # No va a arrancar: no se toca a los que ya corren
+        
+        resize = []  # Instancias con hilos de GC/JIT calculados para más CPUs de las que les quedan
+        for (other, state), cpus in zip(sorted(others.items()), groups):
+            if state.get("cpus") != cpus and Instances.repin(other, state, cpus):
+                if len(cpus) < state.get("sized_cpus", 0):
+                    resize.append(other)
+        for p in plans:
+            p["resize"] = resize
+        return plans
+    
+    @staticmethod
+    def no_room(plan: dict) -> str:
+        """Mensaje para un plan cuya parte de RAM no llega al heap mínimo."""
+        return (f"No queda RAM para '{plan['name']}': le tocarían {plan['budget']['limit_mb']}MB y el heap "
+                f"mínimo es {Resources.MIN_HEAP_MB}MB. Para antes otro servidor")
+    
+    @staticmethod
+    def set_affinity(pid: int, cpus: List[int]):
+        """Fija todos los hilos de `pid`: la afinidad de Linux es por hilo, no por proceso."""
+        for thread in psutil.Process(pid).threads():
+            try:
+                os.sched_setaffinity(thread.id, cpus)
+            except ProcessLookupError:
+                pass  # El hilo terminó entre la lista y la llamada
+    
+    @staticmethod
+    def repin(name: str, state: dict, cpus: List[int]) -> bool:
+        """Mueve una instancia en marcha (gestor, JVM y túneles, con todos sus hilos) a otro grupo de CPUs.
+
+        Los hilos de GC y JIT que la JVM ya creó siguen siendo los mismos:
+        quedan dentro del grupo, pero su número solo se ajusta al reiniciarla.
+        """
+        try:
+            root = psutil.Process(state["pid"])
+            for proc in [root] + root.children(recursive=True):
+                Instances.set_affinity(proc.pid, cpus)
+        except (KeyError, AttributeError, ValueError, OSError, psutil.Error):
+            return False
+        Instances._write(name, dict(state, cpus=cpus))
+        return True
+    
+    @staticmethod
+    def cpus_for(name: str) -> List[int]:
+        """CPUs asignadas ahora mismo a la instancia (pueden cambiar si arranca otra)."""
+        try:
+            with open(Instances.state_path(name), encoding="utf-8") as f:
+                return json.load(f).get("cpus") or []
+        except (OSError, ValueError):
+            return []
+    
+    @staticmethod
+    def format_cpus(cpus: List[int]) -> str:
+        """[0, 1, 2, 5] -> "0-2,5"."""
+        ranges = []
+        for cpu in sorted(cpus):
+            if ranges and cpu == ranges[-1][1] + 1:
+                ranges[-1][1] = cpu
+            else:
+                ranges.append([cpu, cpu])
+        return ",".join(f"{a}-{b}" if b > a else str(a) for a, b in ranges)
+    
+    @staticmethod
+    def parse_cpus(text: str) -> List[int]:
+        cpus = []
+        for part in text.split(","):
+            first, _, last = part.strip().partition("-")
+            cpus += range(int(first), int(last or first) + 1)
+        return sorted(set(cpus))
+    
+    @staticmethod
+    def wrap(cmd: List[str], cpus: List[int]) -> List[str]:
+        """Antepone `taskset` para que el proceso nazca ya fijado a `cpus`.
+
+        Sin taskset, quien lance el proceso debe llamar a `set_affinity`
+        justo después de Popen (un preexec_fn no es seguro en un proceso
+        con hilos).
+        """
+        taskset = shutil.which("taskset")
+        if not cpus or not taskset:
+            return cmd
+        return [taskset, "-c", Instances.format_cpus(cpus)] + cmd
+    
+    @staticmethod
+    def _write(name: str, state: dict):
+        """Escritura atómica: `running` de otro proceso nunca ve el fichero a medias."""
+        path = Instances.state_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    
+    @staticmethod
+    def register(name: str, port: int, heap_mb: int, budget: dict, cpus: List[int]):
+        Instances._write(name, {"pid": os.getpid(), "port": port, "heap_mb": heap_mb, "cpus": cpus,
+                                "sized_cpus": budget["cores"],
+                                "reserved_mb": heap_mb + sum(budget["overhead_mb"].values())})
+    
+    @staticmethod
+    def resized(name: str, budget: dict):
+        try:
+            with open(Instances.state_path(name), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        state["sized_cpus"] = budget["cores"]
+        Instances._write(name, state)
+    
+    @staticmethod
+    def unregister(name: str):
+        try:
+            os.remove(Instances.state_path(name))
+        except OSError:
+            pass
+
+class JvmProfiles:
+    """Perfiles de GC/JIT para la JVM, calculados a partir del heap y los núcleos."""
+    DEFAULT = "aikar"
+    PROFILES = {
+        "aikar": {"name": "G1 ajustado (Aikar)", "desc": "Recomendado: pausas cortas y estables"},
+        "zgc": {"name": "ZGC generacional", "desc": "Pausas casi nulas; JDK 21+ y heaps grandes"},
+        "basico": {"name": "Básico", "desc": "Solo -Xms/-Xmx (comportamiento anterior)"},
+    }
+    THP_PATH = "/sys/kernel/mm/transparent_hugepage/enabled"
+    
+    _java = None
+    
+    @staticmethod
+    def java_version() -> int:
+        """Versión mayor de `java` (8, 17, 21...), cacheada por binario. 0 si no se sabe."""
+        if JvmProfiles._java is not None:
+            return JvmProfiles._java
+        binary = shutil.which("java")
+        if not binary:
+            return 0
+        real = os.path.realpath(binary)
+        key = f"{real}:{os.stat(real).st_mtime_ns}"
+        cache_path = os.path.join(Config.CACHE_DIR, "java.json")
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == key:
+                JvmProfiles._java = cached["major"]
+                return JvmProfiles._java
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        major = 0
+        try:
+            out = subprocess.run([binary, "-version"], capture_output=True, text=True, timeout=20).stderr
+            m = re.search(r'version "(\d+)(?:\.(\d+))?', out)
+            if m:
+                major = int(m.group(2)) if m.group(1) == "1" else int(m.group(1))
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        try:
+            os.makedirs(Config.CACHE_DIR, exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "major": major}, f)
+        except OSError:
+            pass
+        JvmProfiles._java = major
+        return major
+    
+    @staticmethod
+    def available() -> List[str]:
+        return [p for p in JvmProfiles.PROFILES if p != "zgc" or JvmProfiles.java_version() >= 21]
+    
+    @staticmethod
+    def _large_pages() -> bool:
+        try:
+            with open(JvmProfiles.THP_PATH) as f:
+                mode = f.read()
+        except OSError:
+            return False
+        return "[always]" in mode or "[madvise]" in mode
+    
+    @staticmethod
+    def _can_pretouch(heap_mb: int) -> bool:
+        """Reservar todo el heap al arrancar solo si cabe holgadamente en la memoria libre."""
+        try:
+            return Resources.memory_available() >= heap_mb * 1048576 * 1.15
+        except Exception:
+            return False
+    
+    @staticmethod
+    def flags(profile: str, heap_mb: int, budget: Optional[dict] = None) -> List[str]:
+        """Flags para `heap_mb` de heap; `budget` es el resultado de Resources.suggest."""
+        budget = budget or Resources.suggest()
+        if profile not in JvmProfiles.PROFILES or (profile == "zgc" and "zgc" not in JvmProfiles.available()):
+            profile = JvmProfiles.DEFAULT
+        xms_min = min(2048, heap_mb)
+        if profile == "basico":
+            return [f"-Xms{xms_min}M", f"-Xmx{heap_mb}M"]
+        
+        pretouch = JvmProfiles._can_pretouch(heap_mb)
+        # Con AlwaysPreTouch el heap inicial es el máximo; si no, crece bajo demanda
+        flags = [f"-Xms{heap_mb if pretouch else xms_min}M", f"-Xmx{heap_mb}M"]
+        # Hilos de GC y compiladores JIT según las CPUs reales del contenedor
+        threads = [f"-XX:ParallelGCThreads={budget['parallel_gc_threads']}",
+                   f"-XX:ConcGCThreads={budget['conc_gc_threads']}",
+                   f"-XX:CICompilerCount={budget['ci_compiler_count']}"]
+        
+        if profile == "zgc":
+            flags += ["-XX:+UseZGC"]
+            if JvmProfiles.java_version() < 23:
+                flags += ["-XX:+ZGenerational"]  # Por defecto desde JDK 23
+            flags += threads
+        else:
+            big = heap_mb >= 12 * 1024
+            flags += [
+                "-XX:+UseG1GC", "-XX:+ParallelRefProcEnabled", "-XX:MaxGCPauseMillis=200",
+                "-XX:+UnlockExperimentalVMOptions", "-XX:+DisableExplicitGC",
+                f"-XX:G1NewSizePercent={40 if big else 30}",
+                f"-XX:G1MaxNewSizePercent={50 if big else 40}",
+                f"-XX:G1HeapRegionSize={16 if big else 8}M",
+                f"-XX:G1ReservePercent={15 if big else 20}",
+                "-XX:G1HeapWastePercent=5", "-XX:G1MixedGCCountTarget=4",
+                f"-XX:InitiatingHeapOccupancyPercent={20 if big else 15}",
+                "-XX:G1MixedGCLiveThresholdPercent=90", "-XX:G1RSetUpdatingPauseTimePercent=5",
+                "-XX:SurvivorRatio=32", "-XX:MaxTenuringThreshold=1",
+                *threads,
+                "-Dusing.aikars.flags=https://mcflags.emc.gs", "-Daikars.new.flags=true",
+            ]
+        
+        flags += ["-XX:+PerfDisableSharedMem"]
+        if pretouch:
+            flags += ["-XX:+AlwaysPreTouch"]
+            if JvmProfiles._large_pages():
+                flags += ["-XX:+UseTransparentHugePages"]
+        return flags
+
+class Launch:
+    """Línea de comandos de la JVM para un servidor."""
+    
+    @staticmethod
+    def find_jar(server_dir: str) -> Optional[str]:
+        return JarIndex.server_jar(server_dir)
+    
+    @staticmethod
+    def profile_for(server_dir: str) -> str:
+        """Perfil de JVM recordado en el meta.json del servidor."""
+        try:
+            with open(os.path.join(server_dir, Server.META_DIR, "meta.json"), encoding="utf-8") as f:
+                return json.load(f).get("jvm_profile") or JvmProfiles.DEFAULT
+        except (OSError, ValueError):
+            return JvmProfiles.DEFAULT
+    
+    @staticmethod
+    def command(server_dir: str, heap_mb: int, profile: Optional[str] = None,
+                budget: Optional[dict] = None) -> Optional[tuple]:
+        """(cmd, flags) para lanzar desde `server_dir`, o None si no hay jar.
+
+        El mismo perfil se aplica a `java -jar` y a `run.sh` (Forge).
+        """
+        flags = JvmProfiles.flags(profile or Launch.profile_for(server_dir), heap_mb, budget)
+        if os.path.exists(os.path.join(server_dir, "run.sh")):
+            # Forge lee los flags de user_jvm_args.txt
+            with open(os.path.join(server_dir, "user_jvm_args.txt"), "w") as f:
+                f.write("\n".join(flags) + "\n")
+            return ["bash", "run.sh", "nogui"], flags
+        jar = Launch.find_jar(server_dir)
+        if not jar:
+            return None
+        return ["java", *flags, "-jar", jar, "nogui"], flags
+
+class BootTimer:
+    """Mide, a partir de la consola, cuánto tarda un arranque.
+
+    - jvm_startup: de Popen a la primera línea de la JVM
+    - time_to_ready: de Popen a la línea `Done (X.XXXs)!`
+    """
+    DONE_RE = re.compile(r"Done \((\d+(?:[.,]\d+)?)s\)!")
+    
+    def __init__(self, console: Console, started: float):
+        self.started = started
+        self.first_output = None
+        self.ready_at = None
+        self.reported = None
+        self.ready = threading.Event()
+        self._console = console
+        console.add_listener(self._on_line)
+    
+    def _on_line(self, line: str):
+        now = time.monotonic()
+        if self.first_output is None and line.strip():
+            self.first_output = now
+        m = self.DONE_RE.search(line)
+        if m and self.ready_at is None:
+            self.ready_at = now
+            self.reported = float(m.group(1).replace(",", "."))
+            self.ready.set()
+            self._console.remove_listener(self._on_line)
+    
+    def mark_ready(self):
+        """Listo detectado por otra vía (ping de estado) antes que por la consola."""
+        if self.ready_at is None:
+            self.ready_at = time.monotonic()
+            self.ready.set()
+    
+    def record(self, kind: str, flags: List[str], heap_mb: int) -> dict:
+        return {
+            "ts": time.time(),
+            "kind": kind,
+            "ok": self.ready_at is not None,
+            "time_to_ready": round(self.ready_at - self.started, 3) if self.ready_at else None,
+            "jvm_startup": round(self.first_output - self.started, 3) if self.first_output else None,
+            "reported_done": self.reported,
+            "jvm_flags": flags,
+            "heap_mb": heap_mb,
+        }
+
+class BootHistory:
+    """Historial de arranques de cada servidor (`.mcsm/boots.jsonl`)."""
+    
+    @staticmethod
+    def path(name: str) -> str:
+        return os.path.join(Server.path(name), Server.META_DIR, "boots.jsonl")
+    
+    @staticmethod
+    def append(name: str, record: dict):
+        info = Server.get_info(name)
+        record.update(
+            loader=info["type"],
+            mods=info["mods"],
+            plugins=info["plugins"],
+            world_size=Server.dir_size(os.path.join(Server.path(name), "world")),
+        )
+        path = BootHistory.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    
+    @staticmethod
+    def load(name: str) -> List[dict]:
+        records = []
+        try:
+            with open(BootHistory.path(name), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except OSError:
+            pass
+        return records
+
+class HeadlessServer:
+    """Servidor arrancado sin túnel ni teclado, controlado por su consola."""
+    
+    def __init__(self, server_dir: str, heap_mb: int, echo: bool = False, profile: Optional[str] = None):
+        self.server_dir = server_dir
+        self.heap_mb = heap_mb
+        self.echo = echo
+        self.profile = profile
+        self.proc = None
+        self.flags = []
+        self.console = None
+        self.timer = None
+        self._master = None
+        self._reader = None
+        port = Server.read_properties(server_dir).get("server-port", "")
+        self.port = int(port) if port.isdigit() else 25565
+        self._port_taken = False  # Otro proceso ya respondía en el puerto antes de arrancar
+    
+    def start(self) -> bool:
+        self._port_taken = Network.is_port_busy(self.port)
+        launch = Launch.command(self.server_dir, self.heap_mb, self.profile)
+        if not launch:
+            return False
+        cmd, self.flags = launch
+        self._master, slave = pty.openpty()
+        started = time.monotonic()
+        self.proc = subprocess.Popen(cmd, cwd=self.server_dir, stdin=slave, stdout=slave, stderr=slave)
+        os.close(slave)
+        self.console = Console(os.path.join(self.server_dir, Server.META_DIR, "console"), echo=self.echo)
+        self.timer = BootTimer(self.console, started)
+        self._reader = threading.Thread(target=self.console.pump, args=(self._master,), daemon=True)
+        self._reader.start()
+        return True
+    
+    def wait_ready(self, timeout: float) -> str:
+        """"ready", "exited" (terminó antes de estar listo) o "timeout".
+
+        Listo es el "Done" de la consola o, antes, que el propio servidor
+        conteste a un Server List Ping (sirve con loaders que cambian el log).
+        """
+        deadline = time.monotonic() + timeout
+        next_ping = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            if self.timer.ready.wait(0.2):
+                return "ready"
+            if self.proc.poll() is not None:
+                return "ready" if self.timer.ready.is_set() else "exited"
+            if not self._port_taken and time.monotonic() >= next_ping:
+                next_ping = time.monotonic() + 1
+                if Network.is_port_busy(self.port) and self.status(0.5):
+                    self.timer.mark_ready()
+                    return "ready"
+        return "timeout"
+    
+    def status(self, timeout: float = 2) -> Optional[dict]:
+        return ServerListPing.status("127.0.0.1", self.port, timeout)
+    
+    def send(self, command: str):
+        os.write(self._master, f"{command}\n".encode())
+    
+    def expect(self, command: Optional[str], pattern, timeout: float):
+        """Envía `command` (si hay) y espera una línea que cumpla `pattern`. Devuelve el match o None."""
+        regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+        found = []
+        event = threading.Event()
+        
+        def _on_line(line: str):
+            m = regex.search(line)
+            if m and not found:
+                found.append(m)
+                event.set()
+        
+        self.console.add_listener(_on_line)
+        try:
+            if command:
+                self.send(command)
+            deadline = time.monotonic() + timeout
+            while not event.wait(0.2):
+                if self.proc.poll() is not None or time.monotonic() >= deadline:
+                    break
+        finally:
+            self.console.remove_listener(_on_line)
+        return found[0] if found else None
+    
+    def stop(self, timeout: float = 60) -> Optional[int]:
+        if self.proc and self.proc.poll() is None:
+            try:
+                self.send("stop")
+                self.proc.wait(timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.terminate()
+                try:
+                    self.proc.wait(10)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+                    self.proc.wait()
+        if self._reader:
+            self._reader.join(2)
+        if self._master is not None:
+            try:
+                os.close(self._master)
+            except OSError:
+                pass
+            self._master = None
+        if self.console:
+            self.console.close()
+        return self.proc.returncode if self.proc else None
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil con interpolación lineal."""
+    v = sorted(values)
+    k = (len(v) - 1) * pct / 100
+    f = int(k)
+    c = min(f + 1, len(v) - 1)
+    return v[f] + (v[c] - v[f]) * (k - f)
+
+class Bench:
+    """`bench boot`: arranques repetidos sin interfaz, en frío y en caliente."""
+    
+    @staticmethod
+    def drop_caches() -> bool:
+        """Vacía la caché de páginas del kernel (requiere sudo sin contraseña)."""
+        result = subprocess.run("sync && echo 3 | sudo -n tee /proc/sys/vm/drop_caches",
+                                shell=True, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return result.returncode == 0
+    
+    @staticmethod
+    def boot_once(name: str, heap_mb: int, kind: str, timeout: float, record: bool = True,
+                  profile: Optional[str] = None) -> dict:
+        server = HeadlessServer(Server.path(name), heap_mb, profile=profile)
+        if not server.start():
+            raise FileNotFoundError("No se encontró el JAR del servidor")
+        state = server.wait_ready(timeout)
+        server.stop()
+        result = server.timer.record(kind, server.flags, heap_mb)
+        result["result"] = state
+        if record:
+            BootHistory.append(name, result)
+        return result
+    
+    @staticmethod
+    def boot(name: str, runs: int, mode: str, heap_mb: int, timeout: float,
+             profile: Optional[str] = None) -> List[dict]:
+        results = []
+        kinds = ["frío", "caliente"] if mode == "both" else [{"cold": "frío", "warm": "caliente"}[mode]]
+        
+        for kind in kinds:
+            if kind == "frío" and not Bench.drop_caches():
+                Log.warn("No se pudo vaciar la caché de páginas: el arranque en frío será aproximado")
+            if kind == "caliente":
+                with Spinner("Arranque de calentamiento (no se registra)"):
+                    Bench.boot_once(name, heap_mb, kind, timeout, record=False, profile=profile)
+            for i in range(runs):
+                if kind == "frío":
+                    Bench.drop_caches()
+                with Spinner(f"Arranque en {kind} {i + 1}/{runs}") as sp:
+                    r = Bench.boot_once(name, heap_mb, kind, timeout, profile=profile)
+                    ready = f"{r['time_to_ready']:.2f}s" if r["time_to_ready"] else r["result"]
+                    sp.msg = f"Arranque en {kind} {i + 1}/{runs}: {ready}"
+                results.append(r)
+        Bench.print_stats(results)
+        return results
+    
+    @staticmethod
+    def print_stats(records: List[dict]):
+        UI.header("⏱️  Tiempos de arranque")
+        widths = [16, 6, 10, 10, 10, 10, 10]
+        UI.table_row([(h, C.BOLD) for h in ("Tipo", "N", "p50", "p90", "p99", "mín", "máx")], widths)
+        UI.divider("─", sum(widths))
+        for kind in sorted({r["kind"] for r in records}):
+            for field, label in (("time_to_ready", "listo"), ("jvm_startup", "jvm")):
+                values = [r[field] for r in records if r["kind"] == kind and r.get(field) is not None]
+                if not values:
+                    continue
+                cols = [(f"{kind}/{label}", C.WHITE), (str(len(values)), C.DIM)]
+                cols += [(f"{percentile(values, p):.2f}s", C.CYAN) for p in (50, 90, 99)]
+                cols += [(f"{min(values):.2f}s", C.GREEN), (f"{max(values):.2f}s", C.YELLOW)]
+                UI.table_row(cols, widths)
+        failed = sum(1 for r in records if not r.get("ok"))
+        if failed:
+            print()
+            Log.warn(f"{failed} arranque(s) no llegaron a estar listos")
+        print()
+
+# =====================================================
+# MODS Y PLUGINS
+# =====================================================
+
+class ModError(Exception):
+    pass
+
+class Mods:
+    """Mods y plugins desde Modrinth (o un índice compatible en MODRINTH_API).
+
+    `resolve` elige la versión que encaja con el loader y la versión del
+    servidor y recorre sus dependencias obligatorias, nivel a nivel y con
+    las consultas de cada nivel en paralelo. `install` descarga todo a la
+    vez a través del almacén compartido, verificando el sha512 publicado.
+    `check_updates` pregunta por todos los jars de todos los servidores
+    con una petición `version_files/update` por cada loader+versión, no una
+    por fichero.
+    """
+    API = "https://api.modrinth.com/v2"
+    USER_AGENT = "codespaces-minecraft-server (github.com)"
+    WORKERS = 6
+    MOD_LOADERS = {"forge", "neoforge", "fabric", "quilt"}
+    LOADERS = {
+        "Forge": ["forge"],
+        "Fabric": ["fabric"],
+        "Paper": ["paper", "spigot", "bukkit"],
+        "Purpur": ["purpur", "paper", "spigot", "bukkit"],
+        "Mohist": ["forge", "paper", "spigot", "bukkit"],
+    }
+    _pool = None
+    
+    @classmethod
+    def pool(cls) -> ThreadPoolExecutor:
+        if cls._pool is None:
+            cls._pool = ThreadPoolExecutor(max_workers=cls.WORKERS, thread_name_prefix="mods")
+        return cls._pool
+    
+    @staticmethod
+    def api() -> str:
+        return os.getenv("MODRINTH_API", Mods.API).rstrip("/")
+    
+    @staticmethod
+    def _request(method: str, path: str, **kwargs):
+        """JSON de la API, None si es 404. Los fallos de red o del índice salen como ModError."""
+        url = f"{Mods.api()}{path}"
+        try:
+            r = HttpPool.session(url).request(method, url, timeout=15,
+                                              headers={"User-Agent": Mods.USER_AGENT}, **kwargs)
+            if r.status_code == 404:
+                return None
+            r.raise_for_status()
+            return r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ModError(f"No se pudo consultar Modrinth: {e}")
+    
+    @staticmethod
+    def target(name: str) -> Optional[dict]:
+        """Loaders y versión de Minecraft del servidor, o None si no admite mods ni plugins."""
+        loaders = Mods.LOADERS.get(Server.get_info(name)["type"])
+        version = Server.load_meta(name).get("version")
+        if not loaders or not version:
+            return None
+        return {"loaders": loaders, "game_version": version}
+    
+    @staticmethod
+    def folder(version: dict) -> str:
+        return "mods" if Mods.MOD_LOADERS & set(version.get("loaders", [])) else "plugins"
+    
+    @staticmethod
+    def primary_file(version: dict) -> dict:
+        files = version["files"]
+        return next((f for f in files if f.get("primary")), files[0])
+    
+    @staticmethod
+    def checksum(file: dict) -> Optional[str]:
+        hashes = file.get("hashes", {})
+        for algo in ("sha512", "sha1"):
+            if hashes.get(algo):
+                return f"{algo}:{hashes[algo]}"
+        return None
+    
+    @staticmethod
+    def search(query: str, target: dict, limit: int = 10) -> List[dict]:
+        facets = [[f"categories:{l}" for l in target["loaders"]], [f"versions:{target['game_version']}"]]
+        found = Mods._request("GET", "/search", params={"query": query, "limit": limit,
+                                                        "facets": json.dumps(facets)})
+        return (found or {}).get("hits", [])
+    
+    @staticmethod
+    def _version_for(project: str, target: dict) -> Optional[dict]:
+        versions = Mods._request("GET", f"/project/{project}/version", params={
+            "loaders": json.dumps(target["loaders"]),
+            "game_versions": json.dumps([target["game_version"]]),
+        })
+        return versions[0] if versions else None
+    
+    @staticmethod
+    def _fetch_dependency(dep: dict, target: dict) -> Optional[dict]:
+        if dep.get("version_id"):
+            return Mods._request("GET", f"/version/{dep['version_id']}")
+        return Mods._version_for(dep["project_id"], target)
+    
+    @staticmethod
+    def resolve(project: str, target: dict) -> dict:
+        """{"versions": [la pedida y sus dependencias obligatorias], "missing": [proyectos sin versión compatible]}."""
+        root = Mods._version_for(project, target)
+        if not root:
+            return {"versions": [], "missing": [project]}
+        versions = {root["project_id"]: root}
+        missing = []
+        frontier = [root]
+        while frontier:
+            deps = []
+            for version in frontier:
+                for dep in version.get("dependencies", []):
+                    key = dep.get("project_id") or dep.get("version_id")
+                    if dep.get("dependency_type") == "required" and key not in versions and dep not in deps:
+                        deps.append(dep)
+            found = list(Mods.pool().map(lambda d: Mods._fetch_dependency(d, target), deps))
+            frontier = []
+            for dep, version in zip(deps, found):
+                if not version:
+                    missing.append(dep.get("project_id") or dep.get("version_id"))
+                elif version["project_id"] not in versions:
+                    versions[version["project_id"]] = version
+                    frontier.append(version)
+        return {"versions": list(versions.values()), "missing": missing}
+    
+    @staticmethod
+    def staged(dest: str) -> str:
+        """Nombre provisional junto a `dest`; sin `.jar`, el loader no lo carga."""
+        return os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.part")
+    
+    @staticmethod
+    def _install_one(name: str, version: dict) -> dict:
+        file = Mods.primary_file(version)
+        folder = os.path.join(Server.path(name), Mods.folder(version))
+        dest = os.path.join(folder, file["filename"])
+        if not Store.fetch(file["url"], Mods.staged(dest), Mods.checksum(file), quiet=True):
+            raise ModError(f"no se pudo descargar {file['filename']}")
+        return {"project_id": version["project_id"], "version_id": version["id"],
+                "version": version.get("version_number"), "file": os.path.relpath(dest, Server.path(name))}
+    
+    @staticmethod
+    def install(name: str, versions: List[dict]) -> List[dict]:
+        """Descarga en paralelo y sustituye la versión anterior de cada proyecto. Devuelve lo instalado.
+
+        Todo se descarga y verifica primero con un nombre provisional; solo si
+        no falla ninguno se colocan los jars y se quitan los anteriores. Si
+        alguno falla, se borran los provisionales y la carpeta queda como estaba.
+        """
+        installed = dict(Server.load_meta(name).get("installed_mods", {}))
+        futures = [Mods.pool().submit(Mods._install_one, name, v) for v in versions]
+        done, errors = [], []
+        for future in futures:
+            try:
+                done.append(future.result())
+            except Exception as e:
+                errors.append(str(e))
+        if errors:
+            for entry in done:
+                try:
+                    os.remove(Mods.staged(os.path.join(Server.path(name), entry["file"])))
+                except OSError:
+                    pass
+            raise ModError("; ".join(errors))
+        
+        for entry in done:
+            dest = os.path.join(Server.path(name), entry["file"])
+            Store.rename(Mods.staged(dest), dest)
+        for entry in done:
+            previous = installed.get(entry["project_id"])
+            if previous and previous["file"] != entry["file"]:
+                try:
+                    os.remove(os.path.join(Server.path(name), previous["file"]))
+                except OSError:
+                    pass
+            installed[entry["project_id"]] = entry
+        Server.save_meta(name, installed_mods=installed)
+        return done
+    
+    @staticmethod
+    def jars(name: str) -> List[str]:
+        base = Server.path(name)
+        found = []
+        for sub in ("mods", "plugins"):
+            folder = os.path.join(base, sub)
+            if os.path.isdir(folder):
+                found += [os.path.join(sub, f) for f in sorted(os.listdir(folder)) if f.endswith(".jar")]
+        return found
+    
+    @staticmethod
+    def check_updates(names: Optional[List[str]] = None) -> List[dict]:
+        """Actualizaciones de todos los jars: una petición por cada loader+versión distintos."""
+        groups = {}  # (loaders, versión) -> {sha1: [(servidor, ruta relativa)]}
+        for name in names or Server.get_all():
+            target = Mods.target(name)
+            if not target:
+                continue
+            key = (tuple(target["loaders"]), target["game_version"])
+            jars = JarIndex.read_many([os.path.join(Server.path(name), rel) for rel in Mods.jars(name)])
+            for path, info in jars.items():
+                rel = os.path.relpath(path, Server.path(name))
+                groups.setdefault(key, {}).setdefault(info["sha1"], []).append((name, rel))
+        
+        def _lookup(item):
+            (loaders, game_version), files = item
+            return Mods._request("POST", "/version_files/update", json={
+                "hashes": list(files), "algorithm": "sha1",
+                "loaders": list(loaders), "game_versions": [game_version],
+            }) or {}
+        
+        updates = []
+        items = list(groups.items())
+        for (_, files), latest in zip(items, Mods.pool().map(_lookup, items)):
+            for digest, version in latest.items():
+                new_file = Mods.primary_file(version)
+                if new_file.get("hashes", {}).get("sha1") == digest:
+                    continue
+                for name, rel in files.get(digest, []):
+                    updates.append({"server": name, "file": rel, "version": version,
+                                     "new_file": new_file["filename"]})
+        return updates
+    
+    @staticmethod
+    def apply_updates(updates: List[dict]) -> int:
+        """Instala las versiones nuevas y quita los jars que sustituyen.
+
+        Cada servidor se actualiza entero o no se toca (ver `install`). Si
+        alguno falla, se sigue con los demás y al final se lanza ModError.
+        """
+        by_server = {}
+        for u in updates:
+            by_server.setdefault(u["server"], []).append(u)
+        count = 0
+        errors = []
+        for name, items in by_server.items():
+            try:
+                Mods.install(name, [u["version"] for u in items])
+            except ModError as e:
+                errors.append(f"{name}: {e}")
+                continue
+            for u in items:
+                old = os.path.join(Server.path(name), u["file"])
+                if os.path.basename(old) != u["new_file"] and os.path.exists(old):
+                    os.remove(old)
+                count += 1
+        if errors:
+            raise ModError("; ".join(errors))
+        return count
+
+# =====================================================
+# PREGENERACIÓN DEL MUNDO
+# =====================================================
+
+class Pregen:
+    """Genera el terreno alrededor del spawn con el servidor sin interfaz ni túnel.
+
+    Usa Chunky si está instalado (o lo instala con Mods en servidores con
+    mods o plugins). Si no, recurre a `/forceload` por bloques de 16×16 chunks,
+    comprobando con `execute if loaded` que cada bloque terminó.
+    """
+    TILE = 16  # Chunks por lado en cada /forceload (máximo 256 chunks)
+    CHUNKY_PROGRESS = re.compile(r"Processed: (\d+) chunks \(([\d.,]+)%\)")
+    CHUNKY_DONE = re.compile(r"\[Chunky\] Task (?:finished|stopped)")
+    
+    @staticmethod
+    def has_chunky(server_dir: str) -> bool:
+        for sub in ("plugins", "mods"):
+            jars = JarIndex.folder(os.path.join(server_dir, sub))
+            if any(mod_id.lower() == "chunky" for info in jars.values() for mod_id in info["ids"]):
+                return True
+        return False
+    
+    @staticmethod
+    def _progress(done: int, total: int, started: float):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rate = done / elapsed
+        pct = min(done / total, 1.0) if total else 0
+        eta = (total - done) / rate if rate and total else 0
+        bar = "█" * int(32 * pct) + "░" * (32 - int(32 * pct))
+        print(f"\r  {C.CYAN}│{bar}│{C.RESET} {pct*100:5.1f}% {C.DIM}{done}/{total} chunks · "
+              f"{rate:6.1f} chunks/s · ETA {int(eta // 60)}:{int(eta % 60):02d}{C.RESET}  ", end="", flush=True)
+    
+    @staticmethod
+    def _chunky(server: HeadlessServer, radius: int, center: tuple) -> bool:
+        total = (2 * -(-radius // 16)) ** 2
+        started = time.monotonic()
+        finished = threading.Event()
+        state = {"done": 0}
+        
+        def _on_line(line: str):
+            m = Pregen.CHUNKY_PROGRESS.search(line)
+            if m:
+                state["done"] = int(m.group(1))
+                pct = float(m.group(2).replace(",", "."))
+                if pct > 0:
+                    state["total"] = int(state["done"] * 100 / pct)
+            if Pregen.CHUNKY_DONE.search(line):
+                finished.set()
+        
+        server.console.add_listener(_on_line)
+        try:
+            server.send(f"chunky center {center[0]} {center[1]}")
+            server.send(f"chunky radius {radius}")
+            server.send("chunky start")
+            server.send("chunky confirm")  # Por si quedaba una tarea anterior
+            while not finished.wait(1):
+                if server.proc.poll() is not None:
+                    return False
+                Pregen._progress(state["done"], state.get("total", total), started)
+            Pregen._progress(state.get("total", total), state.get("total", total), started)
+            print()
+            return True
+        finally:
+            server.console.remove_listener(_on_line)
+    
+    @staticmethod
+    def _forceload(server: HeadlessServer, radius: int, center: tuple) -> bool:
+        cx, cz = center[0] // 16, center[1] // 16
+        r = -(-radius // 16)
+        tiles = [(x, z) for x in range(cx - r, cx + r, Pregen.TILE) for z in range(cz - r, cz + r, Pregen.TILE)]
+        total = (2 * r) ** 2
+        done = 0
+        started = time.monotonic()
+        can_check = True
+        
+        for x, z in tiles:
+            x2, z2 = min(x + Pregen.TILE, cx + r) - 1, min(z + Pregen.TILE, cz + r) - 1
+            area = f"{x * 16} {z * 16} {x2 * 16} {z2 * 16}"
+            if not server.expect(f"forceload add {area}", r"Marked|already|No chunks", 60):
+                if server.proc.poll() is not None:
+                    return False
+            # Esperar a que el bloque esté cargado del todo (1.19.4+); si no existe el comando, pausa fija
+            corners = [(x, z), (x2, z), (x, z2), (x2, z2)]
+            for px, pz in corners:
+                while can_check:
+                    m = server.expect(f"execute if loaded {px * 16} 0 {pz * 16}",
+                                      r"Test passed|Test failed|Unknown or incomplete|Incorrect argument", 30)
+                    if not m or "passed" in m.group(0):
+                        break
+                    if "failed" not in m.group(0):
+                        can_check = False
+                        break
+                    time.sleep(0.25)
+            if not can_check:
+                time.sleep(2)
+            server.expect(f"forceload remove {area}", r"Unmarked|No chunks|was not", 60)
+            done += (x2 - x + 1) * (z2 - z + 1)
+            Pregen._progress(done, total, started)
+        print()
+        server.expect("save-all flush", r"Saved the game", 300)
+        return True
+    
+    @staticmethod
+    def run(name: str, radius: int, center: tuple = (0, 0), heap_mb: Optional[int] = None) -> bool:
+        server_dir = Server.path(name)
+        # Una segunda JVM sobre el mismo mundo no arrancaría (session.lock) o lo corrompería
+        if Server.running_pid(name) or World.in_use(name):
+            Log.error("El servidor está en marcha; detenlo antes de pregenerar")
+            return False
+        target = Mods.target(name)
+        if not Pregen.has_chunky(server_dir) and target:
+            with Spinner("Instalando Chunky"):
+                try:
+                    plan = Mods.resolve("chunky", target)
+                    if not plan["missing"]:
+                        Mods.install(name, plan["versions"])
+                except Exception:
+                    pass
+        use_chunky = Pregen.has_chunky(server_dir)
+        
+        if not heap_mb:
+            budget = Resources.suggest(Server.get_info(name)["mods"])
+            if budget["too_small"]:
+                Log.error(Resources.no_room(budget))
+                return False
+            heap_mb = budget["heap_mb"]
+        server = HeadlessServer(server_dir, heap_mb)
+        if not server.start():
+            Log.error("No se encontró el JAR del servidor")
+            return False
+        
+        try:
+            with Spinner("Arrancando servidor sin túnel"):
+                state = server.wait_ready(900)
+            if state != "ready":
+                Log.error("El servidor no llegó a arrancar")
+                for line in server.console.tail(15):
+                    print(f"  {C.DIM}{line}{C.RESET}")
+                return False
+            
+            method = "Chunky" if use_chunky else "forceload"
+            Log.info(f"Generando radio de {radius} bloques alrededor de {center} con {method}...")
+            started = time.monotonic()
+            ok = (Pregen._chunky if use_chunky else Pregen._forceload)(server, radius, center)
+            if ok:
+                Log.success(f"Pregeneración terminada en {time.monotonic() - started:.0f}s")
+                Server.save_meta(name, pregen={"radius": radius, "center": list(center)})
+            else:
+                Log.error("El servidor se detuvo durante la pregeneración")
+            return ok
+        finally:
+            with Spinner("Deteniendo servidor"):
+                server.stop()
+            Server.save_meta(name, world_size=Server.dir_size(os.path.join(server_dir, "world")))
+
+# =====================================================
+# BÚSQUEDA DE MODS CONFLICTIVOS
+# =====================================================
+
+class Bisect:
+    """Encuentra el mod (o la pareja de mods) que impide arrancar el servidor.
+
+    Cada prueba arranca sin interfaz una copia del servidor en `.bisect/`
+    hecha con hardlinks de los jars (el resto de ficheros se copia, porque
+    el servidor escribe en ellos), sin el mundo y con un puerto propio. Se
+    busca el prefijo más corto de la lista de mods (más sus dependencias)
+    que falla: su último mod es el culpable, o la mitad de una pareja que
+    se busca igual. Si hay RAM para varias pruebas a la vez, cada ronda
+    prueba varios puntos de corte en paralelo.
+    """
+    DIR = os.path.join(Config.BASE_DIR, ".bisect")
+    TIMEOUT = 300
+    HEAP_MB = 2048
+    COPY_SKIP = {"mods", "logs", "crash-reports", Server.META_DIR, "world", "world_nether", "world_the_end"}
+    LINK_EXT = (".jar", ".zip")
+    
+    def __init__(self, name: str, timeout: float = TIMEOUT, parallel: Optional[int] = None,
+                 heap_mb: int = HEAP_MB, on_result=None):
+        self.name = name
+        self.server_dir = Server.path(name)
+        self.timeout = timeout
+        self.heap_mb = heap_mb
+        self.on_result = on_result
+        self.results = {}       # frozenset(mods) -> {"state", "seconds", "tail"}
+        self.boots = []
+        mods_dir = os.path.join(self.server_dir, "mods")
+        self.mods = sorted(f for f in os.listdir(mods_dir) if f.endswith(".jar")) if os.path.isdir(mods_dir) else []
+        self.info = JarIndex.folder(mods_dir)
+        self.parallel = parallel or self.slots()
+        self._counter = 0
+        self._ports = set()     # Puertos ya dados a una prueba
+        self._lock = threading.Lock()
+    
+    def slots(self) -> int:
+        """Pruebas simultáneas que caben en la memoria libre y las CPUs."""
+        per_boot = self.heap_mb + sum(Resources.overhead_mb(2, len(self.mods)).values())
+        by_ram = int(Resources.memory_available() // 1048576 // per_boot)
+        by_cpu = max(1, int(Resources.cpu_limit()))
+        return max(1, min(by_ram, by_cpu, 4))
+    
+    def closure(self, subset) -> frozenset:
+        """El subconjunto más los mods de los que depende, recursivamente."""
+        provides = {}
+        for mod, info in self.info.items():
+            for mod_id in info["ids"] or [mod]:
+                provides.setdefault(mod_id, mod)
+        result = set(subset)
+        pending = list(subset)
+        while pending:
+            for dep in self.info[pending.pop()]["depends"]:
+                mod = provides.get(dep)
+                if mod and mod not in result:
+                    result.add(mod)
+                    pending.append(mod)
+        return frozenset(result)
+    
+    def _stage(self, mods) -> str:
+        with self._lock:
+            self._counter += 1
+            staging = os.path.join(self.DIR, f"{self.name}-{self._counter}")
+        shutil.rmtree(staging, ignore_errors=True)
+        for root, dirs, files in os.walk(self.server_dir):
+            rel = os.path.relpath(root, self.server_dir)
+            if rel == ".":
+                dirs[:] = [d for d in dirs if d not in self.COPY_SKIP and not d.startswith(".")]
+            target = os.path.normpath(os.path.join(staging, rel))
+            os.makedirs(target, exist_ok=True)
+            for f in files:
+                src = os.path.join(root, f)
+                if f.endswith(self.LINK_EXT):
+                    os.link(src, os.path.join(target, f))
+                else:
+                    shutil.copy2(src, os.path.join(target, f))
+        os.makedirs(os.path.join(staging, "mods"))
+        for mod in mods:
+            os.link(os.path.join(self.server_dir, "mods", mod), os.path.join(staging, "mods", mod))
+        
+        props = Server.read_properties(staging)
+        props.update({"server-port": str(self._free_port()), "level-name": "bisect-world",
+                      "enable-query": "false", "enable-rcon": "false"})
+        with open(os.path.join(staging, "server.properties"), "w") as f:
+            f.writelines(f"{k}={v}\n" for k, v in props.items())
+        return staging
+    
+    def _free_port(self) -> int:
+        """Puerto libre que no se haya dado ya a otra prueba.
+
+        El socket se cierra antes de que arranque el servidor, así que el
+        sistema puede repetir el puerto a una prueba paralela que aún no lo
+        ha abierto; por eso se descartan los ya repartidos.
+        """
+        with self._lock:
+            while True:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    s.bind(("127.0.0.1", 0))
+                    port = s.getsockname()[1]
+                if port not in self._ports:
+                    self._ports.add(port)
+                    return port
+    
+    def boot(self, mods) -> str:
+        """Arranca con `mods` y devuelve "ok", "crash" o "hang" (con caché por subconjunto)."""
+        key = frozenset(mods)
+        if key in self.results:
+            return self.results[key]["state"]
+        staging = self._stage(sorted(key))
+        started = time.monotonic()
+        state = "crash"
+        server = HeadlessServer(staging, self.heap_mb)
+        try:
+            if not server.start():
+                raise ModError("No se encontró el JAR del servidor")
+            state = {"ready": "ok", "exited": "crash", "timeout": "hang"}[server.wait_ready(self.timeout)]
+            tail = server.console.tail(20)
+        finally:
+            server.stop(30 if state == "ok" else 5)
+            shutil.rmtree(staging, ignore_errors=True)
+        result = {"state": state, "mods": len(key), "seconds": time.monotonic() - started, "tail": tail}
+        with self._lock:
+            self.results[key] = result
+            self.boots.append(result)
+        if self.on_result:
+            self.on_result(result)
+        return state
+    
+    def _fails(self, mods) -> bool:
+        return self.boot(mods) != "ok"
+    
+    def _first_failing_prefix(self, order: List[str], extra=frozenset()) -> Optional[int]:
+        """Menor k tal que closure(order[:k] + extra) falla. Búsqueda (k+1)-aria con `parallel` pruebas por ronda."""
+        lo, hi = 0, len(order)  # closure(order[:lo]) funciona; closure(order[:hi]) falla
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            while hi - lo > 1:
+                step = (hi - lo) / (self.parallel + 1)
+                points = sorted({lo + max(1, round(step * (i + 1))) for i in range(self.parallel)} - {hi})
+                points = [p for p in points if lo < p < hi] or [(lo + hi) // 2]
+                subsets = [self.closure(order[:p]) | extra for p in points]
+                failed = list(pool.map(self._fails, subsets))
+                for point, bad in zip(points, failed):
+                    if bad:
+                        hi = point
+                        break
+                    lo = point
+        return hi
+    
+    def run(self) -> dict:
+        """{"verdict": "ok" | "base" | "mod" | "pair" | "flaky", "mods": [...]}"""
+        everything = frozenset(self.mods)
+        if not self._fails(everything):
+            return {"verdict": "ok", "mods": []}
+        if self._fails(frozenset()):
+            return {"verdict": "base", "mods": []}  # Falla incluso sin mods
+        
+        k = self._first_failing_prefix(self.mods)
+        culprit = self.mods[k - 1]
+        alone = self.closure([culprit])
+        if self._fails(alone):
+            return {"verdict": "mod", "mods": [culprit], "with": sorted(alone - {culprit})}
+        
+        others = [m for m in self.mods[:k - 1] if m not in alone]
+        if not others or not self._fails(self.closure(others) | alone):
+            return {"verdict": "flaky", "mods": [culprit]}
+        j = self._first_failing_prefix(others, alone)
+        return {"verdict": "pair", "mods": [others[j - 1], culprit]}
+
+# =====================================================
+# COPIAS DE SEGURIDAD
+# =====================================================
+
+class BackupError(Exception):
+    pass
+
+class Backup:
+    """Copias incrementales y deduplicadas de los mundos.
+
+    Cada fichero se trocea en piezas (en los .mca, una por chunk según la
+    cabecera de la región) que se guardan comprimidas en un almacén por
+    contenido común a todos los servidores. Una copia es un manifiesto con
+    las piezas de cada fichero; los que tienen el mismo tamaño y mtime que
+    en la copia anterior se reutilizan sin leerlos. Con el servidor en
+    marcha se coordina save-off / save-all flush / save-on por consola, de
+    modo que el juego sigue funcionando mientras se copia.
+    """
+    DIR = os.path.join(Config.BASE_DIR, ".backups")
+    OBJECTS = os.path.join(DIR, "objects")
+    KEEP = 20                    # Copias por servidor (BACKUP_KEEP)
+    PIECE = 1048576              # Troceo fijo de lo que no es una región
+    LEVEL = 6
+    MAX_IN_FLIGHT = 256 * 1048576  # Bytes leídos pendientes de comprimir
+    EXTRA_FILES = ("server.properties", "ops.json", "whitelist.json", "banned-players.json", "banned-ips.json")
+    SKIP = ("session.lock",)
+    SAVE_OFF = r"Automatic saving is now disabled|Saving is already turned off"
+    SAVE_ON = r"Automatic saving is now enabled|Saving is already turned on"
+    SAVED = r"Saved the game"
+    GC_GRACE = 3600              # No borrar objetos recientes: pueden ser de una copia en curso
+    _pool = None
+    
+    @classmethod
+    def pool(cls) -> ThreadPoolExecutor:
+        if cls._pool is None:
+            cls._pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="backup")
+        return cls._pool
+    
+    @staticmethod
+    def object_path(digest: str) -> str:
+        return os.path.join(Backup.OBJECTS, digest[:2], digest[2:])
+    
+    @staticmethod
+    def list(name: str) -> List[dict]:
+        """Manifiestos del servidor, del más antiguo al más reciente.
+
+        Se ordenan por `created`, no por nombre: "…-120000-5.json" queda
+        antes que "…-120000.json" aunque sea posterior.
+        """
+        folder = os.path.join(Backup.DIR, name)
+        manifests = []
+        try:
+            for f in os.listdir(folder):
+                if f.endswith(".json"):
+                    with open(os.path.join(folder, f)) as fh:
+                        manifests.append(json.load(fh))
+        except (OSError, ValueError):
+            pass
+        return sorted(manifests, key=lambda m: (m.get("created", 0), m["id"]))
+    
+    @staticmethod
+    def _files(name: str) -> dict:
+        """Ficheros que entran en la copia: los mundos (carpetas con level.dat) y la configuración."""
+        base = Server.path(name)
+        files = {}
+        with os.scandir(base) as it:
+            entries = [e for e in it if not e.name.startswith(".")]
+        for entry in entries:
+            if entry.is_file() and entry.name in Backup.EXTRA_FILES:
+                files[entry.name] = entry.stat()
+            elif entry.is_dir() and os.path.exists(os.path.join(entry.path, "level.dat")):
+                for root, dirs, names in os.walk(entry.path):
+                    for f in names:
+                        if f not in Backup.SKIP:
+                            full = os.path.join(root, f)
+                            files[os.path.relpath(full, base)] = os.stat(full)
+        return files
+    
+    @staticmethod
+    def _cuts(rel: str, data: bytes) -> List[int]:
+        """Límites de las piezas: cabecera y cada chunk en una región; bloques fijos en el resto."""
+        size = len(data)
+        if not rel.endswith(".mca") or size < 8192:
+            return list(range(0, size, Backup.PIECE)) + [size]
+        cuts = {0, 8192, size}
+        for entry in struct.unpack_from(">1024I", data):
+            offset, count = entry >> 8, entry & 0xFF
+            if offset >= 2 and count and offset * 4096 < size:
+                cuts.add(offset * 4096)
+                cuts.add(min((offset + count) * 4096, size))
+        return sorted(cuts)
+    
+    @staticmethod
+    def _store_piece(piece) -> tuple:
+        """Guarda una pieza si no existe ya. Devuelve (hash, bytes escritos)."""
+        digest = hashlib.sha256(piece).hexdigest()
+        path = Backup.object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        blob = zlib.compress(piece, Backup.LEVEL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        return digest, len(blob)
+    
+    @staticmethod
+    def create(name: str, server=None, reason: str = "manual") -> dict:
+        """Hace una copia. `server` es el servidor en marcha (cualquier objeto con `expect`), si lo hay."""
+        started = time.monotonic()
+        history = Backup.list(name)
+        previous = history[-1]["files"] if history else {}
+        files, pending = {}, []
+        stats = {"changed": 0, "read": 0, "written": 0}
+        
+        def _drain():
+            for rel, st, futures in pending:
+                pieces = []
+                for future in futures:
+                    digest, written = future.result()
+                    pieces.append(digest)
+                    stats["written"] += written
+                files[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns, "pieces": pieces}
+            pending.clear()
+        
+        if server:
+            if not server.expect("save-off", Backup.SAVE_OFF, 30):
+                Log.warn("El servidor no confirmó save-off; la copia puede no ser consistente")
+            server.expect("save-all flush", Backup.SAVED, 300)
+        try:
+            in_flight = 0
+            for rel, st in sorted(Backup._files(name).items()):
+                old = previous.get(rel)
+                if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime_ns:
+                    files[rel] = old
+                    continue
+                with open(os.path.join(Server.path(name), rel), "rb") as f:
+                    data = f.read()
+                view = memoryview(data)
+                cuts = Backup._cuts(rel, data)
+                futures = [Backup.pool().submit(Backup._store_piece, view[a:b]) for a, b in zip(cuts, cuts[1:])]
+                pending.append((rel, st, futures))
+                stats["changed"] += 1
+                stats["read"] += len(data)
+                in_flight += len(data)
+                if in_flight > Backup.MAX_IN_FLIGHT:
+                    _drain()
+                    in_flight = 0
+        finally:
+            # Todo lo necesario ya está leído: el resto se comprime con el guardado activo
+            if server:
+                server.expect("save-on", Backup.SAVE_ON, 30)
+        _drain()
+        
+        folder = os.path.join(Backup.DIR, name)
+        backup_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+        base_id, n = backup_id, len(history)
+        while os.path.exists(os.path.join(folder, f"{backup_id}.json")):
+            backup_id = f"{base_id}-{n}"
+            n += 1
+        manifest = {
+            "id": backup_id,
+            "created": time.time(),
+            "reason": reason,
+            "size": sum(f["size"] for f in files.values()),
+            "changed": stats["changed"],
+            "read": stats["read"],
+            "written": stats["written"],
+            "seconds": round(time.monotonic() - started, 2),
+            "files": files,
+        }
+        os.makedirs(folder, exist_ok=True)
+        tmp = os.path.join(folder, f"{manifest['id']}.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp, os.path.join(folder, f"{manifest['id']}.json"))
+        Backup.prune(name)
+        return manifest
+    
+    @staticmethod
+    def _restore_file(path: str, entry: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.restore.tmp"
+        with open(tmp, "wb") as out:
+            for digest in entry["pieces"]:
+                with open(Backup.object_path(digest), "rb") as f:
+                    out.write(zlib.decompress(f.read()))
+        os.utime(tmp, ns=(entry["mtime"], entry["mtime"]))
+        os.replace(tmp, path)
+    
+    @staticmethod
+    def take(name: str, reason: str = "manual") -> dict:
+        """Copia desde fuera del gestor: si el servidor está en marcha, se la pide a su gestor.
+
+        Solo el gestor puede coordinar save-off / save-all flush con la JVM;
+        copiar los ficheros por detrás daría regiones a medio escribir.
+        """
+        if Server.running_pid(name):
+            reply = Server.control(name, f"backup {reason}", 900)
+            if reply is None:
+                raise BackupError("El servidor está en marcha y su gestor no responde; haz la copia con !backup")
+            if not reply.get("ok"):
+                raise BackupError(reply.get("error") or "El gestor no pudo hacer la copia")
+            return next(m for m in Backup.list(name) if m["id"] == reply["id"])
+        if World.in_use(name):
+            raise BackupError("Otro proceso tiene el mundo abierto; detén el servidor antes de copiarlo")
+        return Backup.create(name, reason=reason)
+    
+    @staticmethod
+    def restore(name: str, backup_id: str) -> dict:
+        """Deja los mundos como en la copia; solo reescribe los ficheros que difieren."""
+        manifest = next((m for m in Backup.list(name) if m["id"] == backup_id), None)
+        if not manifest:
+            raise KeyError(backup_id)
+        if Server.running_pid(name) or World.in_use(name):
+            raise BackupError("El mundo está abierto; detén el servidor antes de restaurar")
+        base = Server.path(name)
+        current = Backup._files(name)
+        wanted = manifest["files"]
+        
+        removed = 0
+        for rel in current:
+            if rel not in wanted:
+                os.remove(os.path.join(base, rel))
+                removed += 1
+        futures = []
+        for rel, entry in wanted.items():
+            st = current.get(rel)
+            if st and st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime"]:
+                continue
+            futures.append(Backup.pool().submit(Backup._restore_file, os.path.join(base, rel), entry))
+        for future in futures:
+            future.result()
+        return {"restored": len(futures), "removed": removed, "unchanged": len(wanted) - len(futures)}
+    
+    @staticmethod
+    def prune(name: str, keep: Optional[int] = None) -> int:
+        """Borra las copias más antiguas por encima de `keep` y los objetos que quedan huérfanos."""
+        if keep is None:
+            keep = int(os.getenv("BACKUP_KEEP", Backup.KEEP))
+        history = Backup.list(name)
+        old = history[:max(0, len(history) - keep)]
+        for manifest in old:
+            os.remove(os.path.join(Backup.DIR, name, f"{manifest['id']}.json"))
+        return Backup.gc() if old else 0
+    
+    @staticmethod
+    def gc() -> int:
+        """Elimina los objetos que ningún manifiesto usa. Devuelve los bytes liberados."""
+        referenced = set()
+        try:
+            servers = [d for d in os.listdir(Backup.DIR) if d != "objects"]
+        except OSError:
+            return 0
+        for name in servers:
+            for manifest in Backup.list(name):
+                for entry in manifest["files"].values():
+                    referenced.update(entry["pieces"])
+        freed = 0
+        cutoff = time.time() - Backup.GC_GRACE
+        for root, _, names in os.walk(Backup.OBJECTS):
+            for f in names:
+                path = os.path.join(root, f)
+                st = os.stat(path)
+                if os.path.basename(root) + f not in referenced and st.st_mtime < cutoff:
+                    freed += st.st_size
+                    os.remove(path)
+        return freed
+    
+    @staticmethod
+    def summary(manifest: dict) -> str:
+        return (f"{manifest['changed']} ficheros cambiados · {format_size(manifest['read'])} leídos · "
+                f"{format_size(manifest['written'])} nuevos en disco · {manifest['seconds']:.1f}s")
+
+# =====================================================
+# ANÁLISIS DEL MUNDO
+# =====================================================
+
+class Region:
+    """Lectura y reescritura de ficheros de región Anvil (.mca).
+
+    Cabecera de 8 KiB (1024 posiciones de 4 bytes: sector inicial de 3 bytes
+    y número de sectores; luego 1024 marcas de tiempo) seguida de sectores
+    de 4 KiB. Cada chunk empieza con su longitud, el tipo de compresión y
+    el NBT comprimido. Del NBT solo se recorre lo justo para sacar
+    InhabitedTime y Status, sin construir el árbol.
+    """
+    SECTOR = 4096
+    EXTERNAL = 128               # Bit de "chunk en fichero .mcc aparte"
+    _FIXED = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+    _ARRAY = {7: 1, 11: 4, 12: 8}
+    
+    @staticmethod
+    def _skip(buf, pos: int, tag: int) -> int:
+        if tag in Region._FIXED:
+            return pos + Region._FIXED[tag]
+        if tag in Region._ARRAY:
+            return pos + 4 + struct.unpack_from(">i", buf, pos)[0] * Region._ARRAY[tag]
+        if tag == 8:
+            return pos + 2 + struct.unpack_from(">H", buf, pos)[0]
+        if tag == 9:
+            sub, count = buf[pos], struct.unpack_from(">i", buf, pos + 1)[0]
+            pos += 5
+            if sub in Region._FIXED:
+                return pos + count * Region._FIXED[sub]
+            for _ in range(count):
+                pos = Region._skip(buf, pos, sub)
+            return pos
+        if tag == 10:
+            while True:
+                child = buf[pos]
+                if child == 0:
+                    return pos + 1
+                pos += 3 + struct.unpack_from(">H", buf, pos + 1)[0]
+                pos = Region._skip(buf, pos, child)
+        raise ValueError(f"etiqueta NBT desconocida {tag}")
+    
+    @staticmethod
+    def chunk_fields(buf) -> dict:
+        """InhabitedTime y Status del chunk, en la raíz (1.18+) o dentro de Level."""
+        fields = {}
+        
+        def _scan(pos: int):
+            while True:
+                tag = buf[pos]
+                if tag == 0:
+                    return
+                length = struct.unpack_from(">H", buf, pos + 1)[0]
+                name = bytes(buf[pos + 3:pos + 3 + length])
+                pos += 3 + length
+                if tag == 4 and name == b"InhabitedTime":
+                    fields["inhabited"] = struct.unpack_from(">q", buf, pos)[0]
+                elif tag == 8 and name == b"Status":
+                    n = struct.unpack_from(">H", buf, pos)[0]
+                    fields["status"] = bytes(buf[pos + 2:pos + 2 + n]).decode(errors="replace")
+                elif tag == 10 and name == b"Level":
+                    _scan(pos)
+                    return
+                pos = Region._skip(buf, pos, tag)
+        
+        if buf and buf[0] == 10:
+            _scan(3 + struct.unpack_from(">H", buf, 1)[0])
+        return fields
+    
+    @staticmethod
+    def _decompress(kind: int, data) -> bytes:
+        if kind == 2:
+            return zlib.decompress(data)
+        if kind == 1:
+            return gzip.decompress(data)
+        if kind == 3:
+            return bytes(data)
+        raise ValueError(f"compresión {kind} no soportada")
+    
+    @staticmethod
+    def _chunk_header(mm, start: int, count: int) -> tuple:
+        """(longitud, compresión) del chunk, o (0, 0) si la cabecera no cuadra con sus sectores."""
+        if start + 5 > len(mm):
+            return 0, 0
+        length, kind = struct.unpack_from(">IB", mm, start)
+        if length < 1 or length + 4 > count * Region.SECTOR or start + 4 + length > len(mm):
+            return 0, 0
+        return length, kind
+    
+    @staticmethod
+    def analyze_file(path: str, min_ticks: Optional[int] = None) -> dict:
+        """Estadísticas de una región; con `min_ticks`, índices de chunks podables."""
+        result = {"path": path, "size": os.path.getsize(path), "chunks": 0, "data": 0,
+                  "used_sectors": 0, "wasted_sectors": 0, "prunable": [], "unreadable": 0}
+        if result["size"] < 2 * Region.SECTOR:
+            return result
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            file_sectors = -(-len(mm) // Region.SECTOR)
+            for index, entry in enumerate(struct.unpack_from(">1024I", mm)):
+                offset, count = entry >> 8, entry & 0xFF
+                if offset < 2 or not count:
+                    continue
+                start = offset * Region.SECTOR
+                result["chunks"] += 1
+                length, kind = Region._chunk_header(mm, start, count)
+                if not length:
+                    result["unreadable"] += 1
+                    result["used_sectors"] += count
+                    continue
+                result["data"] += length + 4
+                result["used_sectors"] += -(-(length + 4) // Region.SECTOR)
+                if min_ticks is None or kind & Region.EXTERNAL:
+                    continue
+                try:
+                    fields = Region.chunk_fields(Region._decompress(kind, mm[start + 5:start + 4 + length]))
+                except (ValueError, zlib.error, OSError, IndexError, struct.error):
+                    result["unreadable"] += 1
+                    continue
+                if fields.get("inhabited", 0) < min_ticks:
+                    result["prunable"].append(index)
+            result["wasted_sectors"] = max(0, file_sectors - 2 - result["used_sectors"])
+        return result
+    
+    @staticmethod
+    def rewrite(path: str, drop=()) -> tuple:
+        """Reescribe la región sin los chunks de `drop` y sin huecos. Devuelve (antes, después)."""
+        drop = set(drop)
+        before = os.path.getsize(path)
+        if before < 2 * Region.SECTOR:
+            return before, before
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            locations = list(struct.unpack_from(">1024I", mm))
+            header = bytearray(mm[:2 * Region.SECTOR])
+            body = bytearray()
+            next_sector = 2
+            for index, entry in enumerate(locations):
+                offset, count = entry >> 8, entry & 0xFF
+                struct.pack_into(">I", header, index * 4, 0)
+                if offset < 2 or not count or index in drop:
+                    struct.pack_into(">I", header, Region.SECTOR + index * 4, 0)
+                    continue
+                start = offset * Region.SECTOR
+                length = Region._chunk_header(mm, start, count)[0]
+                if length:
+                    sectors = -(-(length + 4) // Region.SECTOR)
+                    chunk = mm[start:start + length + 4]
+                else:
+                    sectors = count  # Chunk dañado: se copia tal cual
+                    chunk = mm[start:start + count * Region.SECTOR]
+                body += chunk
+                body += bytes(sectors * Region.SECTOR - len(chunk))
+                struct.pack_into(">I", header, index * 4, (next_sector << 8) | sectors)
+                next_sector += sectors
+        if not body:
+            os.remove(path)
+            return before, 0
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(body)
+        shutil.copystat(path, tmp)
+        os.replace(tmp, path)
+        return before, os.path.getsize(path)
+
+class World:
+    """Análisis y poda de los mundos de un servidor, región a región en paralelo.
+
+    El recorrido del NBT es CPU puro, así que se reparte entre procesos
+    (fork) y no entre hilos. Podar quita los chunks con InhabitedTime por
+    debajo del umbral (nadie ha estado cerca; el juego los vuelve a generar
+    igual) junto con sus entidades y POI, y compacta las regiones.
+    """
+    TICKS_PER_SECOND = 20
+    MIN_SECONDS = 10
+    
+    @staticmethod
+    def region_dirs(name: str) -> List[str]:
+        base = Server.path(name)
+        dirs = []
+        for entry in sorted(os.listdir(base)):
+            world = os.path.join(base, entry)
+            if entry.startswith(".") or not os.path.exists(os.path.join(world, "level.dat")):
+                continue
+            for root, subdirs, _ in os.walk(world):
+                subdirs.sort()
+                if os.path.basename(root) == "region":
+                    dirs.append(root)
+        return dirs
+    
+    @staticmethod
+    def in_use(name: str) -> bool:
+        """Comprueba el session.lock que la JVM mantiene bloqueado mientras el mundo está abierto."""
+        base = Server.path(name)
+        for entry in os.listdir(base):
+            lock = os.path.join(base, entry, "session.lock")
+            if not os.path.exists(lock):
+                continue
+            with open(lock, "a") as f:
+                try:
+                    fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.lockf(f, fcntl.LOCK_UN)
+                except OSError:
+                    return True
+        return False
+    
+    @staticmethod
+    def _pool() -> ProcessPoolExecutor:
+        # "spawn": un fork con hilos vivos (túneles, bucle de eventos, pools) puede
+        # heredar un lock tomado y colgar al trabajador
+        return ProcessPoolExecutor(max_workers=os.cpu_count() or 2, mp_context=multiprocessing.get_context("spawn"))
+    
+    @staticmethod
+    def _regions(name: str) -> List[str]:
+        return [os.path.join(d, f) for d in World.region_dirs(name) for f in sorted(os.listdir(d)) if f.endswith(".mca")]
+    
+    @staticmethod
+    def analyze(name: str, min_seconds: Optional[float] = None) -> List[dict]:
+        """Una entrada por dimensión con regiones, chunks, tamaño, sectores perdidos y podables."""
+        min_ticks = None if min_seconds is None else int(min_seconds * World.TICKS_PER_SECOND)
+        paths = World._regions(name)
+        with World._pool() as pool:
+            results = list(pool.map(Region.analyze_file, paths, [min_ticks] * len(paths), chunksize=4))
+        
+        base = Server.path(name)
+        dims = {}
+        for r in results:
+            dim = os.path.relpath(os.path.dirname(os.path.dirname(r["path"])), base)
+            d = dims.setdefault(dim, {"dimension": dim, "regions": 0, "chunks": 0, "size": 0, "data": 0,
+                                      "wasted": 0, "prunable": 0, "unreadable": 0, "files": []})
+            d["regions"] += 1
+            d["chunks"] += r["chunks"]
+            d["size"] += r["size"]
+            d["data"] += r["data"]
+            d["wasted"] += r["wasted_sectors"] * Region.SECTOR
+            d["prunable"] += len(r["prunable"])
+            d["unreadable"] += r["unreadable"]
+            d["files"].append(r)
+        return list(dims.values())
+    
+    @staticmethod
+    def _rewrite_job(job: tuple) -> tuple:
+        return Region.rewrite(*job)
+    
+    @staticmethod
+    def pregen_warning(name: str) -> Optional[str]:
+        """Aviso si el mundo se pregeneró: esos chunks tienen InhabitedTime 0 y caen con cualquier umbral."""
+        pregen = Server.load_meta(name).get("pregen")
+        if not pregen:
+            return None
+        return (f"El mundo se pregeneró (radio {pregen['radius']} bloques): los chunks que nadie ha "
+                f"visitado tienen InhabitedTime 0 y podarlos deshace la pregeneración")
+    
+    @staticmethod
+    def prune(report: List[dict], compact: bool = True) -> dict:
+        """Poda los chunks podables de `report` (de analyze con umbral) y sus entidades/POI, y compacta."""
+        jobs = []
+        removed = 0
+        for dim in report:
+            for r in dim["files"]:
+                drop = r["prunable"]
+                if drop or (compact and r["wasted_sectors"]):
+                    jobs.append((r["path"], drop))
+                if not drop:
+                    continue
+                removed += len(drop)
+                # Las entidades y los POI (1.14+/1.17+) van en regiones paralelas con el mismo nombre
+                dim_dir = os.path.dirname(os.path.dirname(r["path"]))
+                for sibling in ("entities", "poi"):
+                    path = os.path.join(dim_dir, sibling, os.path.basename(r["path"]))
+                    if os.path.exists(path):
+                        jobs.append((path, drop))
+        with World._pool() as pool:
+            sizes = list(pool.map(World._rewrite_job, jobs))
+        return {
+            "chunks_removed": removed,
+            "files": len(jobs),
+            "freed": sum(before - after for before, after in sizes),
+        }
+    
+    @staticmethod
+    def print_report(report: List[dict]):
+        widths = [22, 9, 9, 11, 11, 10]
+        UI.table_row([(h, C.BOLD) for h in ("Dimensión", "Regiones", "Chunks", "Tamaño", "Perdido", "Podables")], widths)
+        UI.divider("─", sum(widths))
+        for d in report:
+            UI.table_row([(d["dimension"], C.WHITE), (str(d["regions"]), C.DIM), (str(d["chunks"]), C.CYAN),
+                          (format_size(d["size"]), C.WHITE), (format_size(d["wasted"]), C.YELLOW),
+                          (str(d["prunable"]), C.GREEN)], widths)
+        unreadable = sum(d["unreadable"] for d in report)
+        if unreadable:
+            Log.warn(f"{unreadable} chunks no se pudieron leer (se conservan)")
+        print()
+
+# =====================================================
+# SUPERVISIÓN DEL SERVIDOR
+# =====================================================
+
+class ServerSupervisor:
+    """Ejecuta el servidor en el bucle de eventos y lo vuelve a arrancar si se cae.
+
+    El pty del servidor, el teclado y la salida de los túneles comparten el
+    bucle de EventLoop. Un cierre con código distinto de 0 que no pidió el
+    usuario cuenta como caída: se reinicia tras BACKOFF_BASE·2ⁿ segundos
+    (hasta BACKOFF_MAX) y se desiste con CRASH_LIMIT caídas dentro de
+    CRASH_WINDOW. Cada SAMPLE_INTERVAL se mide CPU y RSS de cada hijo.
+    Las líneas que empiezan por "!" son órdenes del gestor (!help); otros
+    procesos pueden enviarlas por `.mcsm/control.sock` (`Server.control`).
+    """
+    BACKOFF_BASE = 2
+    BACKOFF_MAX = 60
+    CRASH_LIMIT = 4
+    CRASH_WINDOW = 600
+    SAMPLE_INTERVAL = 5
+    USER_EXIT_CODES = (0, 130, -2)  # "stop", o Ctrl+C (la JVM sale con 130; -2 si muere por la señal)
+    
+    def __init__(self, name: str, heap_mb: int, profile: Optional[str] = None,
+                 budget: Optional[dict] = None, tunnel: Optional[TunnelSupervisor] = None):
+        self.name = name
+        self.server_dir = Server.path(name)
+        self.heap_mb = heap_mb
+        self.profile = profile
+        self.budget = budget
+        self.tunnel = tunnel
+        self.console = Console(os.path.join(self.server_dir, Server.META_DIR, "console"))
+        self.proc = None
+        self.master = None
+        self.timer = None
+        self.flags = []
+        self.crashes = deque()
+        self.restarts = 0
+        self.started = None
+        self.samples = {}       # etiqueta -> {"cpu": %, "rss": bytes}
+        self.peak_rss = 0
+        self.stopping = False
+        self._restart_requested = False
+        self._stop_event = None
+        self._eof = None
+        self._stdin_partial = b""
+        self._ps = {}           # pid -> psutil.Process (cpu_percent necesita el mismo objeto)
+        self.commands = {
+            "help": (self._cmd_help, "esta ayuda"),
+            "stats": (self._cmd_stats, "CPU, memoria, jugadores y reinicios"),
+            "tunnel": (self._cmd_tunnel, "estado de los túneles"),
+            "restart": (self._cmd_restart, "reinicio ordenado del servidor"),
+            "backup": (self._cmd_backup, "copia de seguridad sin detener el juego"),
+        }
+        self._backing_up = False
+    
+    # --- Proceso del servidor ---
+    
+    def _spawn(self) -> bool:
+        cpus = Instances.cpus_for(self.name)
+        if cpus and self.budget and len(cpus) < self.budget["cores"]:
+            # Otra instancia nos quitó CPUs: los hilos de GC/JIT se recalculan en este arranque
+            threads = Resources.suggest(0, self.budget["limit_mb"], float(len(cpus)))
+            self.budget = dict(self.budget, **{k: threads[k] for k in (
+                "cpus", "cores", "parallel_gc_threads", "conc_gc_threads", "ci_compiler_count")})
+            Instances.resized(self.name, self.budget)
+        launch = Launch.command(self.server_dir, self.heap_mb, self.profile, self.budget)
+        if not launch:
+            return False
+        cmd, self.flags = launch
+        master, slave = pty.openpty()
+        # Sin eco en el pty: el terminal ya muestra lo que escribe el usuario
+        attrs = termios.tcgetattr(slave)
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        
+        self.started = time.monotonic()
+        self.proc = subprocess.Popen(Instances.wrap(cmd, cpus), cwd=self.server_dir,
+                                     stdin=slave, stdout=slave, stderr=slave)
+        if cpus:
+            try:
+                Instances.set_affinity(self.proc.pid, cpus)
+            except (OSError, psutil.Error):
+                pass
+        os.close(slave)
+        self.master = master
+        self.timer = BootTimer(self.console, self.started)
+        self._eof = asyncio.Event()
+        self.console.attach(asyncio.get_running_loop(), master, self._eof.set)
+        return True
+    
+    async def _wait_exit(self) -> int:
+        while self.proc.poll() is None:
+            try:
+                await asyncio.wait_for(self._eof.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+        # Dar un momento para vaciar lo que quede en el pty
+        try:
+            await asyncio.wait_for(self._eof.wait(), 1)
+        except asyncio.TimeoutError:
+            asyncio.get_running_loop().remove_reader(self.master)
+        try:
+            os.close(self.master)
+        except OSError:
+            pass
+        return self.proc.returncode
+    
+    def send(self, command: str):
+        if self.proc and self.proc.poll() is None:
+            os.write(self.master, f"{command}\n".encode())
+        else:
+            Log.warn("El servidor no está en marcha")
+    
+    async def _expect(self, command: Optional[str], pattern: str, timeout: float):
+        regex = re.compile(pattern)
+        found = asyncio.get_running_loop().create_future()
+        
+        def _on_line(line: str):
+            m = regex.search(line)
+            if m and not found.done():
+                found.set_result(m)
+        
+        self.console.add_listener(_on_line)
+        try:
+            if command:
+                self.send(command)
+            return await asyncio.wait_for(found, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.console.remove_listener(_on_line)
+    
+    def expect(self, command: Optional[str], pattern: str, timeout: float):
+        """Versión bloqueante de `_expect` para hilos fuera del bucle (p. ej. Backup.create)."""
+        return EventLoop.submit(self._expect(command, pattern, timeout)).result()
+    
+    def request_stop(self):
+        """Ctrl+C: no reiniciar más (la JVM recibe la misma señal y se cierra sola)."""
+        self.stopping = True
+        if self._stop_event:
+            self._stop_event.set()
+    
+    def shutdown(self):
+        """Parada pedida desde fuera (SIGTERM de `stop`): la JVM no recibió ninguna señal, hay que pedírsela."""
+        self.request_stop()
+        if self.proc and self.proc.poll() is None:
+            try:
+                os.write(self.master, b"stop\n")
+            except OSError:
+                pass
+    
+    def kill(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+    
+    async def run(self) -> Optional[int]:
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        stdin_fd = sys.stdin.fileno()
+        try:
+            loop.add_reader(stdin_fd, self._on_stdin, stdin_fd)
+        except OSError:
+            stdin_fd = None  # Ficheros normales o /dev/null no admiten epoll: sin teclado
+        sampler = asyncio.ensure_future(self._sample())
+        auto_backup = asyncio.ensure_future(self._auto_backup())
+        control = await self._listen()
+        code = None
+        try:
+            while not self.stopping:
+                if not self._spawn():
+                    Log.error("No se encontró el JAR del servidor")
+                    return None
+                if self.tunnel and self.restarts == 0:
+                    Log.info("Conectando túnel; la dirección aparecerá cuando el servidor esté listo")
+                    Tunnel.publish_when_ready(self.tunnel, self.timer.ready, self.proc)
+                
+                code = await self._wait_exit()
+                kind = "interactivo" if self.restarts == 0 else "reinicio"
+                BootHistory.append(self.name, self.timer.record(kind, self.flags, self.heap_mb))
+                
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self.restarts += 1
+                    Log.info("Reiniciando servidor...")
+                    continue
+                if self.stopping or code in self.USER_EXIT_CODES:
+                    break
+                if not await self._backoff(code):
+                    break
+                self.restarts += 1
+            return code
+        finally:
+            if stdin_fd is not None:
+                loop.remove_reader(stdin_fd)
+            sampler.cancel()
+            auto_backup.cancel()
+            if control:
+                control.close()
+                try:
+                    os.remove(Server.control_path(self.name))
+                except OSError:
+                    pass
     
-    @classmethod
-    def get(cls, server_type: str) -> List[str]:
-        if server_type in cls.CACHE:
-            return cls.CACHE[server_type]
+    async def _backoff(self, code: int) -> bool:
+        """Registra la caída y espera antes de reintentar. False si hay que desistir."""
+        now = time.monotonic()
+        self.crashes.append(now)
+        while self.crashes and now - self.crashes[0] > self.CRASH_WINDOW:
+            self.crashes.popleft()
         
-        fetchers = {
-            "Vanilla": cls._minecraft,
-            "Paper": cls._minecraft,
-            "Purpur": cls._minecraft,
-            "Fabric": cls._minecraft,
-            "Forge": cls._forge,
-            "Mohist": cls._mohist,
-        }
+        print()
+        if len(self.crashes) >= self.CRASH_LIMIT:
+            Log.error(f"El servidor se ha caído {len(self.crashes)} veces en "
+                      f"{self.CRASH_WINDOW // 60} minutos; no se reinicia más")
+            for line in self.console.tail(10):
+                print(f"  {C.DIM}{line}{C.RESET}")
+            return False
         
-        versions = fetchers.get(server_type, cls._minecraft)()
-        cls.CACHE[server_type] = versions
-        return versions
-    
-    @staticmethod
-    def _minecraft() -> List[str]:
+        delay = min(self.BACKOFF_BASE * 2 ** (len(self.crashes) - 1), self.BACKOFF_MAX)
+        Log.warn(f"El servidor se cayó (código {code}); reinicio en {delay}s "
+                 f"({len(self.crashes)}/{self.CRASH_LIMIT})")
         try:
-            r = requests.get("https://launchermeta.mojang.com/mc/game/version_manifest.json", timeout=10)
-            return [v["id"] for v in r.json()["versions"] if v["type"] == "release"][:15]
-        except:
-            return ["1.20.4", "1.20.2", "1.20.1", "1.19.4", "1.18.2"]
+            await asyncio.wait_for(self._stop_event.wait(), delay)
+            return False  # Ctrl+C durante la espera
+        except asyncio.TimeoutError:
+            return True
     
-    @staticmethod
-    def _forge() -> List[str]:
+    # --- Teclado ---
+    
+    def _on_stdin(self, fd: int):
         try:
-            r = requests.get("https://files.minecraftforge.net/net/minecraftforge/forge/promotions_slim.json", timeout=10)
-            versions = set()
-            for key in r.json().get("promos", {}):
-                v = key.replace("-recommended", "").replace("-latest", "")
-                versions.add(v)
-            return sorted(versions, key=lambda x: [int(n) if n.isdigit() else 0 for n in x.split(".")], reverse=True)[:15]
-        except:
-            return Versions._minecraft()[:10]
+            data = os.read(fd, 4096)
+        except OSError:
+            data = b""
+        if not data:
+            asyncio.get_running_loop().remove_reader(fd)
+            return
+        chunks = (self._stdin_partial + data).split(b"\n")
+        self._stdin_partial = chunks.pop()
+        for raw in chunks:
+            line = raw.decode(errors="replace").strip()
+            if line.startswith("!"):
+                asyncio.ensure_future(self._command(line[1:]))
+            elif line:
+                self.send(line)
     
-    @staticmethod
-    def _mohist() -> List[str]:
+    async def _command(self, line: str):
+        name, _, arg = line.partition(" ")
+        entry = self.commands.get(name.lower())
+        self.console.flush()
+        if not entry:
+            Log.warn(f"Orden desconocida: !{name} (prueba !help)")
+            return
         try:
-            r = requests.get("https://mohistmc.com/api/v2/projects/mohist", timeout=10)
-            v = r.json().get("versions", [])
-            v.reverse()
-            return v[:15]
-        except:
-            return []
-
-class Downloads:
-    @staticmethod
-    def get_url(server_type: str, version: str) -> Optional[str]:
-        handlers = {
-            "Vanilla": Downloads._vanilla,
-            "Forge": Downloads._forge,
-            "Paper": Downloads._paper,
-            "Fabric": Downloads._fabric,
-            "Mohist": Downloads._mohist,
-            "Purpur": Downloads._purpur,
-        }
-        return handlers.get(server_type, lambda v: None)(version)
+            await entry[0](arg.strip())
+        except Exception as e:
+            Log.error(f"!{name}: {e}")
     
-    @staticmethod
-    def _vanilla(version: str) -> Optional[str]:
+    # --- Órdenes desde otros procesos (backup, CLI...) ---
+    
+    async def _listen(self):
+        path = Server.control_path(self.name)
         try:
-            r = requests.get("https://launchermeta.mojang.com/mc/game/version_manifest.json")
-            url = next((v["url"] for v in r.json()["versions"] if v["id"] == version), None)
-            return requests.get(url).json()["downloads"]["server"]["url"] if url else None
-        except:
+            if os.path.exists(path):
+                os.remove(path)  # De un gestor anterior que no llegó a limpiar
+            return await asyncio.start_unix_server(self._on_control, path=path)
+        except OSError as e:
+            Log.warn(f"Sin canal de órdenes para otros procesos: {e}")
             return None
     
-    @staticmethod
-    def _forge(version: str) -> Optional[str]:
+    async def _on_control(self, reader, writer):
+        """Una orden por conexión; se responde con una línea JSON."""
         try:
-            base = "https://maven.minecraftforge.net/net/minecraftforge/forge"
-            r = requests.get(f"{base}/maven-metadata.xml")
-            versions = [v.split('</version>')[0] for v in r.text.split('<version>')[1:]]
-            match = [v for v in versions if v.startswith(version)]
-            if match:
-                latest = max(match, key=lambda v: [int(x) if x.isdigit() else 0 for x in v.replace("-", ".").split(".")])
-                return f"{base}/{latest}/forge-{latest}-installer.jar"
-        except:
+            line = (await reader.readline()).decode(errors="replace").strip().lstrip("!")
+            name, _, arg = line.partition(" ")
+            if name == "backup":
+                manifest = await self._backup(arg.strip() or "manual")
+                reply = ({"ok": True, "id": manifest["id"]} if manifest else
+                         {"ok": False, "error": "El servidor aún no está listo o ya hay una copia en curso"})
+            elif name in self.commands:
+                await self._command(line)
+                reply = {"ok": True}
+            else:
+                reply = {"ok": False, "error": f"Orden desconocida: !{name}"}
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        try:
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+            writer.close()
+        except OSError:
             pass
-        return None
     
-    @staticmethod
-    def _paper(version: str) -> Optional[str]:
+    async def _cmd_help(self, arg: str):
+        for name, (_, help_text) in self.commands.items():
+            print(f"  {C.CYAN}!{name:<10}{C.RESET} {C.DIM}{help_text}{C.RESET}")
+    
+    async def _cmd_stats(self, arg: str):
+        uptime = time.monotonic() - self.started if self.started else 0
+        print(f"  {C.BOLD}Tiempo en marcha:{C.RESET} {int(uptime // 3600)}h {int(uptime % 3600 // 60):02d}m"
+              f"  {C.DIM}· reinicios: {self.restarts} · caídas recientes: {len(self.crashes)}{C.RESET}")
+        for label, sample in self.samples.items():
+            print(f"  {label:<20} CPU {sample['cpu']:5.1f}%  RSS {format_size(sample['rss'])}")
+        status = await ServerListPing.query("127.0.0.1", Server.port(self.name), 2)
+        if status:
+            players = f" ({', '.join(status['players'])})" if status["players"] else ""
+            print(f"  Jugadores: {status['online']}/{status['max']}{players}  "
+                  f"{C.DIM}· {status['version']} · {status['latency_ms']:.1f}ms{C.RESET}")
+    
+    async def _cmd_tunnel(self, arg: str):
+        if not self.tunnel:
+            Log.info("Sin túnel")
+            return
+        for handle in self.tunnel.handles.values():
+            mark = "●" if handle is self.tunnel.active else " "
+            rtt = f"{handle.rtt_ms:.0f}ms" if handle.rtt_ms is not None else "sin medir"
+            state = "vivo" if handle.alive() else "caído"
+            print(f"  {mark} {handle.name:<14} {handle.address or '—'}  {C.DIM}{state} · {rtt} · "
+                  f"fallos {handle.failures} · reinicios {handle.restarts}{C.RESET}")
+    
+    async def _cmd_backup(self, arg: str):
+        await self._backup("manual")
+    
+    async def _backup(self, reason: str) -> Optional[dict]:
+        if self._backing_up:
+            Log.warn("Ya hay una copia en curso")
+            return None
+        if not (self.timer and self.timer.ready.is_set() and self.proc.poll() is None):
+            Log.warn("El servidor aún no está listo")
+            return None
+        self._backing_up = True
         try:
-            r = requests.get(f"https://papermc.io/api/v2/projects/paper/versions/{version}")
-            builds = r.json().get('builds', [])
-            if builds:
-                b = builds[-1]
-                return f"https://papermc.io/api/v2/projects/paper/versions/{version}/builds/{b}/downloads/paper-{version}-{b}.jar"
-        except:
-            pass
-        return None
+            Log.info("Copia de seguridad en curso...")
+            loop = asyncio.get_running_loop()
+            manifest = await loop.run_in_executor(None, Backup.create, self.name, self, reason)
+            self.console.flush()
+            Log.success(f"Copia {manifest['id']}: {Backup.summary(manifest)}")
+            return manifest
+        finally:
+            self._backing_up = False
     
-    @staticmethod
-    def _fabric(version: str) -> Optional[str]:
+    async def _auto_backup(self):
+        """Copia periódica cada BACKUP_INTERVAL_MIN minutos (0 la desactiva)."""
         try:
-            loader = requests.get("https://meta.fabricmc.net/v2/versions/loader").json()
-            installer = requests.get("https://meta.fabricmc.net/v2/versions/installer").json()
-            lv = next((v["version"] for v in loader if v.get("stable")), None)
-            iv = next((v["version"] for v in installer if v.get("stable")), None)
-            if lv and iv:
-                return f"https://meta.fabricmc.net/v2/versions/loader/{version}/{lv}/{iv}/server/jar"
-        except:
-            pass
-        return None
+            minutes = float(os.getenv("BACKUP_INTERVAL_MIN", "60"))
+        except ValueError:
+            minutes = 60
+        if minutes <= 0:
+            return
+        while True:
+            await asyncio.sleep(minutes * 60)
+            try:
+                await self._backup("automática")
+            except Exception as e:
+                Log.error(f"Copia automática fallida: {e}")
+    
+    async def _cmd_restart(self, arg: str):
+        self._restart_requested = True
+        self.send("stop")
+    
+    # --- Muestreo ---
+    
+    async def _sample(self):
+        while True:
+            try:
+                self._take_sample()
+            except Exception:
+                pass
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+    
+    def _process(self, pid: int):
+        proc = self._ps.get(pid)
+        if proc is None:
+            proc = self._ps[pid] = psutil.Process(pid)
+            proc.cpu_percent(None)  # La primera lectura solo fija la referencia
+        return proc
+    
+    def _take_sample(self):
+        children = {"servidor": self.proc}
+        if self.tunnel:
+            for handle in self.tunnel.handles.values():
+                children[f"túnel {handle.name}"] = handle.proc
+        samples = {}
+        for label, child in children.items():
+            if child is None or child.poll() is not None:
+                continue
+            try:
+                root = self._process(child.pid)
+                procs = [root] + [self._process(p.pid) for p in root.children(recursive=True)]  # run.sh → java
+                samples[label] = {
+                    "cpu": sum(p.cpu_percent(None) for p in procs),
+                    "rss": sum(p.memory_info().rss for p in procs),
+                }
+            except psutil.Error:
+                continue
+        self.samples = samples
+        self.peak_rss = max(self.peak_rss, samples.get("servidor", {}).get("rss", 0))
+    
+    def close(self):
+        self.console.close()
+
+# =====================================================
+# APROVISIONAMIENTO EN LOTE
+# =====================================================
+
+class Batch:
+    """Crea varios servidores a la vez a partir de un manifiesto YAML (o JSON).
+
+    ```yaml
+    workers: 3                # opcional
+    defaults: {type: Paper}   # opcional, se aplica a cada servidor
+    servers:
+      - name: lobby
+        version: "1.20.4"
+        properties: {max-players: 50}
+      - name: modded
+        type: Fabric
+        mods: [lithium, chunky]
+    ```
+
+    Las descargas pasan por el almacén compartido, así que dos servidores
+    con el mismo jar lo bajan una sola vez aunque se creen a la vez.
+    """
+    WORKERS = 4
     
     @staticmethod
-    def _mohist(version: str) -> Optional[str]:
-        try:
-            r = requests.get(f"https://mohistmc.com/api/v2/projects/mohist/{version}/builds")
-            return r.json()["builds"][-1]["url"]
-        except:
-            return None
+    def load(path: str) -> dict:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".json"):
+            data = json.loads(text)
+        else:
+            import yaml
+            data = yaml.safe_load(text)
+        if isinstance(data, list):
+            data = {"servers": data}
+        if not isinstance(data, dict) or not isinstance(data.get("servers"), list):
+            raise ValueError("el manifiesto necesita una lista 'servers'")
+        defaults = data.get("defaults") or {}
+        specs = []
+        for entry in data["servers"]:
+            spec = dict(defaults, **entry)
+            if not spec.get("name") or not spec.get("type"):
+                raise ValueError(f"cada servidor necesita 'name' y 'type': {entry}")
+            specs.append(spec)
+        names = [spec["name"] for spec in specs]
+        duplicated = sorted({n for n in names if names.count(n) > 1})
+        if duplicated:
+            raise ValueError(f"nombres repetidos: {', '.join(duplicated)}")
+        return {"servers": specs, "workers": data.get("workers")}
     
     @staticmethod
-    def _purpur(version: str) -> Optional[str]:
-        try:
-            r = requests.get(f"https://api.purpurmc.org/v2/purpur/{version}")
-            b = r.json()["builds"]["latest"]
-            return f"https://api.purpurmc.org/v2/purpur/{version}/{b}/download"
-        except:
-            return None
+    def provision(spec: dict) -> dict:
+        result = install_server(spec["name"], spec["type"], str(spec.get("version") or "latest"),
+                                spec.get("properties"), quiet=True)
+        if result["ok"] and spec.get("mods"):
+            target = Mods.target(spec["name"])
+            try:
+                if not target:
+                    raise ModError("este tipo de servidor no admite mods ni plugins")
+                versions, missing = [], []
+                for project in spec["mods"]:
+                    plan = Mods.resolve(project, target)
+                    versions += [v for v in plan["versions"] if v["project_id"] not in {x["project_id"] for x in versions}]
+                    missing += plan["missing"]
+                if missing:
+                    raise ModError(f"sin versión compatible para: {', '.join(missing)}")
+                result["mods"] = [entry["file"] for entry in Mods.install(spec["name"], versions)]
+            except Exception as e:
+                result.update(ok=False, error=f"Mods: {e}")
+        return result
+    
+    @staticmethod
+    def run(specs: List[dict], workers: Optional[int] = None, on_done=None) -> List[dict]:
+        """Aprovisiona `specs` con un pool acotado. Devuelve los resultados en el mismo orden."""
+        workers = max(1, min(workers or Batch.WORKERS, len(specs) or 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            futures = [pool.submit(Batch.provision, spec) for spec in specs]
+            results = []
+            for spec, fut in zip(specs, futures):
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    result = {"name": spec["name"], "type": spec.get("type"), "ok": False, "error": str(e)}
+                if on_done:
+                    on_done(result)
+                results.append(result)
+        return results
 
 # =====================================================
 # ACCIONES PRINCIPALES
@@ -783,11 +5511,29 @@ def create_server() -> Optional[str]:
         Log.error("No se pudieron obtener las versiones")
         return None
     
-    answer = inquirer.prompt([inquirer.List('ver', message="Versión de Minecraft", choices=versions)])
+    Prefetch.warm_jar(server_type, versions[0])
+    
+    search_choice = "🔎  Buscar otra versión..."
+    answer = inquirer.prompt([inquirer.List('ver', message="Versión de Minecraft", choices=versions + [search_choice])])
     if not answer:
         return None
     version = answer['ver']
     
+    if version == search_choice:
+        query = Log.ask("Versión a buscar (ej. 1.16): ").strip()
+        matches = Versions.search(server_type, query) if query else []
+        if not matches:
+            Log.error(f"No hay versiones que coincidan con '{query}'")
+            return None
+        answer = inquirer.prompt([inquirer.List('ver', message="Resultados", choices=matches)])
+        if not answer:
+            return None
+        version = answer['ver']
+    
+    # Resolver la descarga mientras el usuario revisa el resumen
+    Prefetch.resolve(server_type, version)
+    Prefetch.warm_jar(server_type, version)
+    
     type_cfg = Config.SERVER_TYPES[server_type]
     UI.box([
         f"{C.BOLD}╔══ Resumen de Configuración ══╗{C.RESET}",
@@ -803,64 +5549,355 @@ def create_server() -> Optional[str]:
         Log.warn("Operación cancelada")
         return None
     
-    server_dir = os.path.join(Config.BASE_DIR, name)
-    os.makedirs(server_dir, exist_ok=True)
-    
-    url = Downloads.get_url(server_type, version)
-    if not url:
-        Log.error("No se encontró URL de descarga")
-        shutil.rmtree(server_dir)
+    Prefetch.result(server_type, version)
+    Prefetch.cancel()
+    print()
+    Log.info(f"Descargando {server_type} {version}...")
+    result = install_server(name, server_type, version)
+    if not result["ok"]:
+        Log.error(result["error"])
         return None
     
     print()
-    Log.info(f"Descargando {server_type} {version}...")
+    Log.success(f"Servidor '{name}' creado exitosamente!")
+    return name
+
+def install_server(name: str, server_type: str, version: str = "latest",
+                   properties: Optional[dict] = None, quiet: bool = False) -> dict:
+    """Crea el servidor sin preguntar nada (menú, `create` y manifiestos).
+
+    `version` puede ser "latest" o el prefijo de una versión ("1.20" elige
+    la más reciente que empiece así). Devuelve {"name", "type", "version",
+    "ok", "error", "seconds"}; si algo falla no deja la carpeta a medias.
+    """
+    started = time.monotonic()
+    result = {"name": name, "type": server_type, "version": version, "ok": False, "error": None}
     
-    if server_type == "Forge":
-        installer = os.path.join(server_dir, "installer.jar")
-        if not Network.download(url, installer):
-            shutil.rmtree(server_dir)
-            return None
+    def _fail(message: str) -> dict:
+        result.update(error=message, seconds=time.monotonic() - started)
+        return result
+    
+    if not name or name.startswith(".") or os.sep in name:
+        return _fail(f"Nombre no válido: '{name}'")
+    if os.path.exists(Server.path(name)):
+        return _fail("Ya existe un servidor con ese nombre")
+    server_type = next((t for t in Config.SERVER_TYPES if t.lower() == str(server_type).lower()), None)
+    if not server_type:
+        return _fail(f"Tipo desconocido: '{result['type']}' (elige entre {', '.join(Config.SERVER_TYPES)})")
+    result["type"] = server_type
+    
+    versions = Versions.get(server_type)
+    if not versions:
+        return _fail("No se pudieron obtener las versiones")
+    if not version or version == "latest":
+        version = versions[0]
+    elif version not in versions:
+        matches = Versions.search(server_type, version)
+        exact = [v for v in matches if v == version or v.startswith(f"{version}.") or v.startswith(f"{version}-")]
+        if not exact:
+            return _fail(f"No hay versiones de {server_type} que coincidan con '{version}'")
+        version = exact[0]
+    result["version"] = version
+    
+    target = Prefetch.resolve(server_type, version).result()
+    if not target:
+        return _fail("No se encontró URL de descarga")
+    url, checksum = target["url"], target["checksum"]
+    
+    server_dir = Server.path(name)
+    os.makedirs(server_dir)
+    try:
+        if server_type == "Forge":
+            installer = os.path.join(server_dir, "installer.jar")
+            if not Store.fetch(url, installer, checksum, quiet):
+                shutil.rmtree(server_dir)
+                return _fail("Error en la descarga")
+            
+            with ForgeLibraries.exclusive(installer):
+                reused = ForgeLibraries.seed(server_dir, installer)
+                if reused and not quiet:
+                    Log.info(f"{reused} librerías reutilizadas de la caché compartida")
+                cmd = ["java", "-jar", installer, "--installServer"]
+                if quiet:
+                    install = subprocess.run(cmd, cwd=server_dir, capture_output=True)
+                else:
+                    with Spinner("Instalando Forge (esto puede tardar)"):
+                        install = subprocess.run(cmd, cwd=server_dir, capture_output=True)
+                if install.returncode != 0:
+                    shutil.rmtree(server_dir)
+                    return _fail("Error al instalar Forge")
+                ForgeLibraries.collect(server_dir, installer)
+            
+            try:
+                os.remove(installer)
+            except:
+                pass
+        else:
+            if not Store.fetch(url, os.path.join(server_dir, "server.jar"), checksum, quiet):
+                shutil.rmtree(server_dir)
+                return _fail("Error en la descarga")
         
-        with Spinner("Instalando Forge (esto puede tardar)"):
-            result = subprocess.run(
-                ["java", "-jar", installer, "--installServer"],
-                cwd=server_dir, capture_output=True
-            )
+        with open(os.path.join(server_dir, 'eula.txt'), 'w') as f:
+            f.write('eula=true\n')
         
-        if result.returncode != 0:
-            Log.error("Error al instalar Forge")
-            shutil.rmtree(server_dir)
-            return None
+        props = {
+            "server-name": name,
+            "motd": f"\\u00A7b{name} \\u00A77- \\u00A7aOnline",
+            "gamemode": "survival",
+            "difficulty": "hard",
+            "max-players": "20",
+            "view-distance": "10",
+            "spawn-protection": "0",
+            "online-mode": "false",
+            "enable-command-block": "true",
+            "server-port": str(Instances.reserve_port()),
+        }
+        props.update({k: str(v).lower() if isinstance(v, bool) else str(v) for k, v in (properties or {}).items()})
+        with open(os.path.join(server_dir, 'server.properties'), 'w') as f:
+            f.writelines(f"{k}={v}\n" for k, v in props.items())
         
+        Server.save_meta(name, type=server_type, version=version, build=target.get("build"),
+                         created=time.time())
+    except Exception as e:
+        shutil.rmtree(server_dir, ignore_errors=True)
+        return _fail(str(e))
+    
+    result.update(ok=True, seconds=time.monotonic() - started)
+    return result
+
+def pregenerate_world(name: str) -> bool:
+    UI.header("🗺️  Pregenerar Mundo", name)
+    if Server.running_pid(name) or World.in_use(name):
+        Log.warn("El servidor está en marcha; detenlo antes de pregenerar")
+        return False
+    radius_input = Log.ask("Radio en bloques alrededor del spawn [1000]: ").strip()
+    radius = int(radius_input) if radius_input.isdigit() else 1000
+    print()
+    return Pregen.run(name, radius)
+
+def backup_menu(name: str):
+    UI.header("💾 Copias de Seguridad", name)
+    history = Backup.list(name)
+    if history:
+        widths = [18, 14, 12, 12]
+        UI.table_row([(h, C.BOLD) for h in ("Copia", "Motivo", "Tamaño", "Nuevo")], widths)
+        UI.divider("─", sum(widths))
+        for m in history[-10:]:
+            UI.table_row([(m["id"], C.WHITE), (m["reason"], C.DIM), (format_size(m["size"]), C.CYAN),
+                          (format_size(m["written"]), C.GREEN)], widths)
+        print()
+    else:
+        Log.info("Todavía no hay copias")
+        print()
+    
+    choices = ["💾  Crear copia ahora"]
+    if history:
+        choices.append("⏪  Restaurar una copia")
+    choices.append("↩️   Volver")
+    answer = inquirer.prompt([inquirer.List('a', message="Copias", choices=choices)])
+    action = answer['a'] if answer else "↩️   Volver"
+    
+    if action.startswith("💾"):
         try:
-            os.remove(installer)
-        except:
-            pass
+            with Spinner("Creando copia"):
+                manifest = Backup.take(name)
+        except BackupError as e:
+            Log.error(str(e))
+            return
+        Log.success(f"Copia {manifest['id']}: {Backup.summary(manifest)}")
+    elif action.startswith("⏪"):
+        ids = [m["id"] for m in reversed(history)]
+        pick = inquirer.prompt([inquirer.List('id', message="Copia a restaurar", choices=ids)])
+        if not pick:
+            return
+        confirm = inquirer.prompt([inquirer.Confirm('ok', message=f"⚠️  ¿Sustituir el mundo actual por {pick['id']}?", default=False)])
+        if confirm and confirm['ok']:
+            try:
+                with Spinner("Restaurando"):
+                    result = Backup.restore(name, pick['id'])
+            except BackupError as e:
+                Log.error(str(e))
+                return
+            Log.success(f"Restaurada: {result['restored']} ficheros reescritos, "
+                        f"{result['unchanged']} intactos, {result['removed']} eliminados")
+
+def world_menu(name: str):
+    UI.header("🧹 Analizar y Podar Mundo", name)
+    if not World.region_dirs(name):
+        Log.info("Este servidor aún no tiene mundo")
+        return
+    
+    seconds_input = Log.ask(f"Podar chunks habitados menos de N segundos [{World.MIN_SECONDS}]: ").strip()
+    try:
+        seconds = float(seconds_input) if seconds_input else World.MIN_SECONDS
+    except ValueError:
+        seconds = World.MIN_SECONDS
+    with Spinner("Analizando regiones"):
+        report = World.analyze(name, seconds)
+    print()
+    World.print_report(report)
+    
+    prunable = sum(d["prunable"] for d in report)
+    wasted = sum(d["wasted"] for d in report)
+    if not prunable and not wasted:
+        Log.success("Nada que podar ni compactar")
+        return
+    if World.in_use(name):
+        Log.warn("El mundo está abierto por un servidor en marcha; detenlo antes de podar")
+        return
+    
+    warning = World.pregen_warning(name)
+    if warning and prunable:
+        Log.warn(warning)
+    confirm = inquirer.prompt([inquirer.Confirm(
+        'ok', message=f"¿Podar {prunable} chunks (incluidos los pregenerados sin visitar) y compactar "
+                      f"({format_size(wasted)} perdidos)?", default=False)])
+    if not confirm or not confirm['ok']:
+        return
+    backup = inquirer.prompt([inquirer.Confirm('b', message="¿Hacer antes una copia de seguridad?", default=True)])
+    if backup and backup['b']:
+        with Spinner("Creando copia"):
+            manifest = Backup.create(name, reason="antes de podar")
+        Log.info(f"Copia {manifest['id']} creada")
+    with Spinner("Podando y compactando"):
+        result = World.prune(report)
+    Log.success(f"{result['chunks_removed']} chunks podados en {result['files']} ficheros · "
+                f"{format_size(result['freed'])} liberados")
+    Server.save_meta(name, world_size=Server.dir_size(os.path.join(Server.path(name), "world")))
+
+def mods_menu(name: str):
+    UI.header("🧩 Mods y Plugins", name)
+    target = Mods.target(name)
+    if not target:
+        Log.warn("Este tipo de servidor no admite mods ni plugins")
+        return
+    jars = Mods.jars(name)
+    Log.info(f"{len(jars)} instalados · {'/'.join(target['loaders'])} {target['game_version']}")
+    index = JarIndex.read_many([os.path.join(Server.path(name), rel) for rel in jars])
+    for path, info in index.items():
+        label = info["name"] or (info["ids"][0] if info["ids"] else os.path.basename(path))
+        print(f"  {C.CYAN}•{C.RESET} {label} {C.DIM}{info['version'] or ''} · {os.path.basename(path)}{C.RESET}")
+    print()
+    
+    choices = ["➕  Instalar (buscar en Modrinth)", "🔄  Buscar actualizaciones (todos los servidores)", "↩️   Volver"]
+    answer = inquirer.prompt([inquirer.List('a', message="Mods y plugins", choices=choices)])
+    action = answer['a'] if answer else "↩️   Volver"
+    
+    try:
+        if action.startswith("➕"):
+            query = Log.ask("Buscar: ").strip()
+            if not query:
+                return
+            with Spinner("Buscando"):
+                hits = Mods.search(query, target)
+            if not hits:
+                Log.warn("Sin resultados compatibles")
+                return
+            labels = [f"{h['title']} {C.DIM}({h.get('downloads', 0):,} descargas){C.RESET}" for h in hits]
+            pick = inquirer.prompt([inquirer.List('p', message="Proyecto", choices=labels + ["↩️   Volver"])])
+            if not pick or pick['p'] not in labels:
+                return
+            hit = hits[labels.index(pick['p'])]
+            with Spinner("Resolviendo dependencias"):
+                plan = Mods.resolve(hit["project_id"], target)
+            if plan["missing"]:
+                Log.error(f"Sin versión compatible para: {', '.join(plan['missing'])}")
+                return
+            for v in plan["versions"]:
+                print(f"  {C.CYAN}•{C.RESET} {Mods.primary_file(v)['filename']} {C.DIM}→ {Mods.folder(v)}/{C.RESET}")
+            print()
+            with Spinner(f"Descargando {len(plan['versions'])} fichero(s)"):
+                Mods.install(name, plan["versions"])
+            Log.success("Instalado")
+        elif action.startswith("🔄"):
+            with Spinner("Consultando actualizaciones"):
+                updates = Mods.check_updates()
+            if not updates:
+                Log.success("Todo está al día")
+                return
+            for u in updates:
+                print(f"  {C.BOLD}{u['server']:<16}{C.RESET} {u['file']} {C.DIM}→{C.RESET} {C.GREEN}{u['new_file']}{C.RESET}")
+            print()
+            confirm = inquirer.prompt([inquirer.Confirm('ok', message=f"¿Actualizar {len(updates)} fichero(s)?", default=True)])
+            if confirm and confirm['ok']:
+                with Spinner("Actualizando"):
+                    count = Mods.apply_updates(updates)
+                Log.success(f"{count} fichero(s) actualizados")
+    except ModError as e:
+        Log.error(str(e))
+
+def describe_bisect(result: dict):
+    mods = result["mods"]
+    if result["verdict"] == "ok":
+        Log.success("El servidor arranca con todos los mods: no hay conflicto que buscar")
+    elif result["verdict"] == "base":
+        Log.error("Falla incluso sin mods: el problema no está en mods/")
+    elif result["verdict"] == "mod":
+        deps = f" {C.DIM}(con sus dependencias {', '.join(result['with'])}){C.RESET}" if result["with"] else ""
+        Log.error(f"Mod culpable: {C.BOLD}{mods[0]}{C.RESET}{deps}")
+    elif result["verdict"] == "pair":
+        Log.error(f"Conflicto entre {C.BOLD}{mods[0]}{C.RESET} y {C.BOLD}{mods[1]}{C.RESET}")
     else:
-        if not Network.download(url, os.path.join(server_dir, "server.jar")):
-            shutil.rmtree(server_dir)
-            return None
+        Log.warn(f"Resultado inestable; sospechoso: {mods[0]} (repite la prueba)")
+
+def bisect_menu(name: str):
+    UI.header("🔬 Buscar Mod Conflictivo", name)
+    mods_dir = os.path.join(Server.path(name), "mods")
+    if not os.path.isdir(mods_dir) or not any(f.endswith(".jar") for f in os.listdir(mods_dir)):
+        Log.info("Este servidor no tiene mods")
+        return
+    timeout_input = Log.ask(f"Segundos antes de dar un arranque por colgado [{Bisect.TIMEOUT}]: ").strip()
+    timeout = int(timeout_input) if timeout_input.isdigit() else Bisect.TIMEOUT
     
-    with open(os.path.join(server_dir, 'eula.txt'), 'w') as f:
-        f.write('eula=true\n')
-    
-    props = {
-        "server-name": name,
-        "motd": f"\\u00A7b{name} \\u00A77- \\u00A7aOnline",
-        "gamemode": "survival",
-        "difficulty": "hard",
-        "max-players": "20",
-        "view-distance": "10",
-        "spawn-protection": "0",
-        "online-mode": "false",
-        "enable-command-block": "true"
-    }
-    with open(os.path.join(server_dir, 'server.properties'), 'w') as f:
-        f.writelines(f"{k}={v}\n" for k, v in props.items())
+    def _report(result):
+        icon = {"ok": f"{C.GREEN}✓", "crash": f"{C.RED}✗", "hang": f"{C.YELLOW}⏱"}[result["state"]]
+        print(f"  {icon}{C.RESET} {result['mods']:>4} mods · {result['state']:<5} {C.DIM}{result['seconds']:.0f}s{C.RESET}")
     
+    bisect = Bisect(name, timeout, on_result=_report)
+    Log.info(f"{len(bisect.mods)} mods · {bisect.parallel} arranque(s) en paralelo")
     print()
-    Log.success(f"Servidor '{name}' creado exitosamente!")
-    return name
+    try:
+        result = bisect.run()
+    except ModError as e:
+        Log.error(str(e))
+        return
+    print()
+    describe_bisect(result)
+    Log.info(f"{len(bisect.boots)} arranques en total")
+
+def server_menu(name: str) -> bool:
+    """Acciones sobre un servidor concreto. Devuelve si hay que volver al menú principal."""
+    choices = [
+        "▶️   Iniciar servidor",
+        "🗺️   Pregenerar mundo",
+        "💾  Copias de seguridad",
+        "🧹  Analizar y podar mundo",
+        "🧩  Mods y plugins",
+        "🔬  Buscar mod conflictivo",
+        "↩️   Volver",
+    ]
+    answer = inquirer.prompt([inquirer.List('a', message=name, choices=choices)])
+    action = answer['a'] if answer else "↩️   Volver"
+    
+    if action.startswith("▶️"):
+        run_server(name)
+        return False
+    elif action.startswith("💾"):
+        backup_menu(name)
+    elif action.startswith("🧹"):
+        world_menu(name)
+    elif action.startswith("🧩"):
+        mods_menu(name)
+    elif action.startswith("🔬"):
+        bisect_menu(name)
+    elif action.startswith("🗺️"):
+        if pregenerate_world(name):
+            # El túnel solo se abre ahora, con el mundo ya generado
+            start = inquirer.prompt([inquirer.Confirm('start', message="¿Iniciar servidor ahora?", default=True)])
+            if start and start['start']:
+                run_server(name)
+                return False
+    return True
 
 def delete_server():
     UI.header("🗑️  Eliminar Servidor")
@@ -881,83 +5918,148 @@ def delete_server():
     ])
     
     if confirm and confirm['ok']:
-        shutil.rmtree(os.path.join(Config.BASE_DIR, answer['s']))
+        if Server.running_pid(answer['s']):
+            Log.error("El servidor está en marcha; detenlo antes de eliminarlo")
+            return
+        keep = inquirer.prompt([
+            inquirer.Confirm('backup', message="¿Guardar antes una copia del mundo?", default=True)
+        ])
+        backup = bool(keep and keep['backup'])
+        with Spinner("Eliminando"):
+            result = remove_server(answer['s'], backup)
+        if result["backup"]:
+            Log.info(f"Copia {result['backup']} guardada en {os.path.join(Backup.DIR, answer['s'])}")
         Log.success("Servidor eliminado correctamente")
+        if result["freed"]:
+            Log.info(f"Almacén compartido: {result['freed'] / 1048576:.1f} MB liberados")
+
+def remove_server(name: str, backup: bool = False) -> dict:
+    """Borra el servidor (con copia previa opcional) y libera lo que nadie más usa del almacén."""
+    manifest = Backup.create(name, reason="antes de borrar") if backup else None
+    shutil.rmtree(Server.path(name))
+    return {"name": name, "backup": manifest["id"] if manifest else None, "freed": Store.gc()}
+
+def choose_jvm_profile(name: str) -> str:
+    """Pregunta el perfil de JVM (por defecto, el último usado) y lo recuerda."""
+    current = Server.load_meta(name).get("jvm_profile", JvmProfiles.DEFAULT)
+    options = JvmProfiles.available()
+    choices = [f"{JvmProfiles.PROFILES[p]['name']} │ {JvmProfiles.PROFILES[p]['desc']}" for p in options]
+    default = choices[options.index(current)] if current in options else choices[0]
+    answer = inquirer.prompt([inquirer.List('p', message="Perfil de JVM", choices=choices, default=default)])
+    profile = options[choices.index(answer['p'])] if answer else current
+    if profile != current or "jvm_profile" not in Server.load_meta(name):
+        Server.save_meta(name, jvm_profile=profile)
+    return profile
 
 def run_server(name: str):
     server_dir = os.path.join(Config.BASE_DIR, name)
     os.chdir(server_dir)
     
+    if Server.running_pid(name):
+        Log.error("Este servidor ya está en marcha en otra terminal")
+        return
+    plan = Instances.plan([name])[0]
+    if plan["too_small"]:
+        Log.error(Instances.no_room(plan))
+        return
+    for other in plan["resize"]:
+        Log.warn(f"'{other}' tiene ahora menos CPUs: reinícialo (!restart) para ajustar sus hilos de GC/JIT")
+    
     UI.header("🌐 Configurar Túnel")
     tunnels = Tunnel.get_available()
     answer = inquirer.prompt([inquirer.List('t', message="Método de conexión", choices=tunnels)])
     if not answer:
         return
-    tunnel_proc = Tunnel.start(answer['t'])
+    # El túnel conecta en segundo plano mientras se configura y arranca la JVM
+    tunnel_proc = Tunnel.start(answer['t'], plan["port"], shared=bool(plan["others"]))
     
     UI.header("⚡ Iniciar Servidor", name)
     
-    total_ram = psutil.virtual_memory().total // (1024 ** 3)
-    default_ram = max(2, int(total_ram * 0.75))
+    budget = plan["budget"]
+    limit_gb = budget["limit_mb"] / 1024
+    default_gb = budget["heap_mb"] / 1024
+    off_heap_gb = sum(budget["overhead_mb"].values()) / 1024
+    if plan["others"]:
+        source = f"parte de esta instancia; en marcha: {', '.join(plan['others'])}"
+    else:
+        source = f"límite cgroup {budget['cgroup']}" if budget["limit_mb"] < budget["host_mb"] else "sistema"
     
-    print(f"  {C.DIM}RAM del sistema: {total_ram}GB{C.RESET}")
-    print(f"  {C.DIM}Recomendado: {default_ram}GB (75%){C.RESET}")
+    cpus = f" (fijado a {Instances.format_cpus(plan['cpus'])})" if plan["cpus"] else ""
+    print(f"  {C.DIM}Puerto: {plan['port']}{C.RESET}")
+    print(f"  {C.DIM}RAM disponible: {limit_gb:.1f}GB ({source}) · CPUs: {budget['cpus']:g}{cpus}{C.RESET}")
+    print(f"  {C.DIM}Recomendado: {default_gb:.1f}GB de heap + {off_heap_gb:.1f}GB fuera del heap{C.RESET}")
     print()
     
-    ram_input = Log.ask(f"RAM a usar [{default_ram}GB]: ").strip()
-    ram = int(ram_input) if ram_input.isdigit() else default_ram
+    ram_input = Log.ask(f"RAM a usar [{default_gb:.1f}GB]: ").strip().replace(",", ".")
+    try:
+        heap_mb = int(float(ram_input) * 1024) if ram_input else budget["heap_mb"]
+    except ValueError:
+        heap_mb = budget["heap_mb"]
+    if heap_mb + off_heap_gb * 1024 > budget["limit_mb"]:
+        Log.warn("Ese heap más la memoria fuera del heap supera el límite: riesgo de OOM-kill")
+    
+    profile = choose_jvm_profile(name)
+    serve(name, heap_mb, profile, budget, tunnel_proc, plan["port"], plan["cpus"])
+
+def serve(name: str, heap_mb: int, profile: str, budget: dict, tunnel_proc: Optional["TunnelSupervisor"],
+          port: int, cpus: List[int]):
+    """Arranca y supervisa el servidor hasta que se detiene (menú y `start`).
+
+    Ctrl+C o SIGTERM (lo que envía `stop` desde otra terminal) lo paran
+    limpiamente; un segundo aviso lo mata.
+    """
+    server_dir = os.path.join(Config.BASE_DIR, name)
+    os.chdir(server_dir)
     
     print()
-    Log.info(f"Iniciando servidor con {ram}GB de RAM...")
+    Log.info(f"Iniciando servidor con {heap_mb / 1024:.1f}GB de RAM...")
     UI.divider("─", 50)
     print()
     
-    if os.path.exists("run.sh"):
-        with open("user_jvm_args.txt", "w") as f:
-            f.write(f"-Xms{min(2, ram)}G\n-Xmx{ram}G\n")
-        cmd = ["bash", "run.sh", "nogui"]
-    else:
-        jars = [j for j in glob.glob("*.jar") if "installer" not in j.lower()]
-        jar = next((j for j in jars if any(x in j.lower() for x in 
-                   ["server", "paper", "fabric", "mohist", "purpur", "forge"])), 
-                   jars[0] if jars else None)
-        
-        if not jar:
-            Log.error("No se encontró el JAR del servidor")
-            return
-        
-        cmd = ["java", f"-Xms{min(2, ram)}G", f"-Xmx{ram}G", "-jar", jar, "nogui"]
+    Log.info(f"{C.DIM}Órdenes del gestor con \"!\" (prueba !help){C.RESET}")
     
-    master, slave = pty.openpty()
-    proc = subprocess.Popen(cmd, stdout=slave, stderr=slave, universal_newlines=True)
-    os.close(slave)
+    terminated = []
     
-    def monitor():
-        while True:
-            try:
-                data = os.read(master, 4096).decode()
-                if data:
-                    print(data, end="", flush=True)
-                else:
-                    break
-            except OSError:
-                break
+    def _interrupt(signum, frame):
+        terminated.append(signum)
+        raise KeyboardInterrupt
     
-    threading.Thread(target=monitor, daemon=True).start()
+    previous = signal.signal(signal.SIGTERM, _interrupt)
+    pid_path = Server.pid_path(name)
+    os.makedirs(os.path.dirname(pid_path), exist_ok=True)
+    with open(pid_path, "w") as f:
+        f.write(str(os.getpid()))
+    Instances.register(name, port, heap_mb, budget, cpus)
     
+    supervisor = ServerSupervisor(name, heap_mb, profile, budget, tunnel_proc)
+    future = EventLoop.submit(supervisor.run())
     try:
-        proc.wait()
-    except KeyboardInterrupt:
-        print()
-        Log.warn("Deteniendo servidor...")
+        try:
+            future.result()
+        except KeyboardInterrupt:
+            print()
+            Log.warn("Deteniendo servidor...")
+            EventLoop.call(supervisor.shutdown if terminated else supervisor.request_stop)
+            try:
+                future.result()
+            except KeyboardInterrupt:
+                EventLoop.call(supervisor.kill)  # Segundo Ctrl+C: forzar
+                future.result(10)
     finally:
+        signal.signal(signal.SIGTERM, previous)
+        Instances.unregister(name)
         try:
-            os.close(master)
-        except:
+            os.remove(pid_path)
+        except OSError:
             pass
+        supervisor.close()
+        if supervisor.peak_rss:
+            Log.info(f"Memoria máxima del servidor: {format_size(supervisor.peak_rss)}")
         if tunnel_proc:
             tunnel_proc.terminate()
             Log.info("Túnel cerrado")
+        Server.save_meta(name, last_played=time.time(),
+                         world_size=Server.dir_size(os.path.join(server_dir, "world")))
 
 # =====================================================
 # MAIN
@@ -973,55 +6075,448 @@ def main():
             interval = 4
         keep_codespace_alive(interval_minutes=interval, url=url)
         Log.info(f"Keep-alive activado cada {interval} minutos -> {url}")
+    
+    while True:
+        UI.banner()
+        servers = Server.display_list()
+        Prefetch.start()
+        
+        if servers:
+            choices = servers + [
+                "",
+                "📦  Crear nuevo servidor",
+                "🗑️   Eliminar servidor",
+                "❌  Salir"
+            ]
+        else:
+            Log.info("No hay servidores. ¡Crea tu primero!")
+            print()
+            choices = [
+                "📦  Crear nuevo servidor",
+                "❌  Salir"
+            ]
+        
+        answer = inquirer.prompt([inquirer.List('a', message="¿Qué deseas hacer?", choices=choices)])
+        
+        if not answer:
+            return
+        
+        action = answer['a']
+        
+        if action == "" or action.startswith("─"):
+            continue
+        elif action == "❌  Salir":
+            Prefetch.cancel()
+            print()
+            Log.info("¡Hasta pronto! 👋")
+            return
+        elif action == "📦  Crear nuevo servidor":
+            server = create_server()
+            if server:
+                print()
+                start = inquirer.prompt([inquirer.Confirm('start', message="¿Iniciar servidor ahora?", default=True)])
+                if start and start['start']:
+                    run_server(server)
+                    return
+        elif action == "🗑️   Eliminar servidor":
+            delete_server()
+        else:
+            Prefetch.cancel()
+            if not server_menu(action):
+                return
 
-    UI.banner()
-    servers = Server.display_list()
+def profile_startup(budget_ms: float) -> bool:
+    """Recorre el camino hasta el primer menú y muestra el tiempo de cada fase."""
+    with Startup.phase("banner"):
+        UI.banner()
+    with Startup.phase("lista de servidores"):
+        Server.display_list()
+    inquirer.List  # Fuerza la carga que haría el primer prompt (queda registrada)
+    total = Startup.elapsed_ms()
     
-    if servers:
-        choices = servers + [
-            "",
-            "📦  Crear nuevo servidor",
-            "🗑️   Eliminar servidor",
-            "❌  Salir"
-        ]
+    UI.header("⏱️  Perfil de arranque")
+    for name, ms in Startup.phases:
+        UI.table_row([(name, C.WHITE), (f"{ms:8.1f} ms", C.CYAN)], [30, 12])
+    UI.divider()
+    ok = total <= budget_ms
+    color = C.GREEN if ok else C.RED
+    UI.table_row([("Hasta el primer menú", C.BOLD), (f"{total:8.1f} ms", color)], [30, 12])
+    print()
+    if ok:
+        Log.success(f"Dentro del presupuesto ({budget_ms:.0f} ms)")
     else:
-        Log.info("No hay servidores. ¡Crea tu primero!")
-        print()
-        choices = [
-            "📦  Crear nuevo servidor",
-            "❌  Salir"
-        ]
+        Log.error(f"Supera el presupuesto de {budget_ms:.0f} ms")
+    return ok
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Minecraft Server Manager para GitHub Codespaces")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="mide cada fase del arranque hasta el primer menú y termina")
+    parser.add_argument("--budget-ms", type=float, default=Startup.BUDGET_MS,
+                        help=f"presupuesto para --profile-startup (por defecto {Startup.BUDGET_MS} ms)")
+    commands = parser.add_subparsers(dest="command")
+    as_json = argparse.ArgumentParser(add_help=False)
+    as_json.add_argument("--json", action="store_true", help="salida en JSON (una línea por resultado)")
     
-    answer = inquirer.prompt([inquirer.List('a', message="¿Qué deseas hacer?", choices=choices)])
+    create = commands.add_parser("create", parents=[as_json], help="crea un servidor, o varios desde un manifiesto")
+    create.add_argument("server", nargs="?")
+    create.add_argument("--type", choices=list(Config.SERVER_TYPES), help="tipo de servidor")
+    create.add_argument("--version", default="latest", help="versión o prefijo (por defecto, la más reciente)")
+    create.add_argument("--property", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="valor de server.properties (se puede repetir)")
+    create.add_argument("--from", dest="manifest", metavar="MANIFIESTO", help="YAML/JSON con varios servidores")
+    create.add_argument("--workers", type=int, help=f"servidores a la vez con --from (por defecto {Batch.WORKERS})")
     
-    if not answer:
-        return
+    start = commands.add_parser("start", parents=[as_json],
+                                help="arranca uno o varios servidores sin menús (varios: en segundo plano)")
+    start.add_argument("server", nargs="+")
+    start.add_argument("--ram", type=float, help="GB de heap (por defecto, su parte de la RAM libre)")
+    start.add_argument("--cpus", help="CPUs a las que fijar el servidor, p. ej. 0-3 (por defecto, su parte)")
+    start.add_argument("--profile", choices=list(JvmProfiles.PROFILES),
+                       help="perfil de JVM (por defecto, el guardado en el servidor)")
+    start.add_argument("--tunnel", choices=["Cloudflare", "Ngrok", "Playit", "propio", "Varios", "ninguno"],
+                       default="Cloudflare", help="túnel (por defecto Cloudflare)")
+    start.add_argument("--detach", action="store_true", help="arranca en segundo plano y vuelve")
     
-    action = answer['a']
+    stop = commands.add_parser("stop", parents=[as_json], help="detiene un servidor arrancado con start o el menú")
+    stop.add_argument("server")
+    stop.add_argument("--timeout", type=float, default=120, help="segundos antes de forzar la parada")
     
-    if action == "" or action.startswith("─"):
-        return main()
-    elif action == "❌  Salir":
-        print()
-        Log.info("¡Hasta pronto! 👋")
-    elif action == "📦  Crear nuevo servidor":
-        server = create_server()
-        if server:
-            print()
-            start = inquirer.prompt([inquirer.Confirm('start', message="¿Iniciar servidor ahora?", default=True)])
-            if start and start['start']:
-                run_server(server)
+    commands.add_parser("list", parents=[as_json], help="lista los servidores")
+    
+    delete = commands.add_parser("delete", parents=[as_json], help="elimina un servidor")
+    delete.add_argument("server")
+    delete.add_argument("--yes", action="store_true", help="confirma el borrado (obligatorio)")
+    delete.add_argument("--backup", action="store_true", help="guarda antes una copia del mundo")
+    
+    bench = commands.add_parser("bench", help="mediciones de rendimiento")
+    bench_cmds = bench.add_subparsers(dest="bench_command", required=True)
+    boot = bench_cmds.add_parser("boot", help="arranca el servidor N veces sin interfaz y muestra percentiles")
+    boot.add_argument("server")
+    boot.add_argument("-n", "--runs", type=int, default=5)
+    boot.add_argument("--mode", choices=["cold", "warm", "both"], default="both")
+    boot.add_argument("--ram", type=float, help="GB de heap (por defecto, el sugerido para el contenedor)")
+    boot.add_argument("--profile", choices=list(JvmProfiles.PROFILES),
+                      help="perfil de JVM (por defecto, el guardado en el servidor)")
+    boot.add_argument("--timeout", type=float, default=600, help="segundos máximos por arranque")
+    history = bench_cmds.add_parser("history", help="estadísticas del historial de arranques")
+    history.add_argument("server")
+    
+    backup = commands.add_parser("backup", help="copias de seguridad incrementales")
+    backup.add_argument("server")
+    backup.add_argument("--list", action="store_true", help="lista las copias")
+    backup.add_argument("--restore", metavar="ID", help="restaura la copia indicada")
+    
+    world = commands.add_parser("world", help="analiza las regiones del mundo y poda chunks")
+    world.add_argument("server")
+    world.add_argument("--prune", type=float, metavar="SEGUNDOS",
+                       help="poda los chunks habitados menos de SEGUNDOS (también los pregenerados sin visitar) y compacta")
+    
+    mods = commands.add_parser("mods", help="instala mods/plugins y busca actualizaciones")
+    mods_cmds = mods.add_subparsers(dest="mods_command", required=True)
+    add = mods_cmds.add_parser("add", help="instala proyectos y sus dependencias")
+    add.add_argument("server")
+    add.add_argument("projects", nargs="+", help="slug o id de Modrinth")
+    updates = mods_cmds.add_parser("updates", help="actualizaciones de todos los servidores")
+    updates.add_argument("--apply", action="store_true", help="instalarlas")
+    
+    bisect = commands.add_parser("bisect", help="busca el mod o la pareja de mods que impide arrancar")
+    bisect.add_argument("server")
+    bisect.add_argument("--timeout", type=int, default=Bisect.TIMEOUT, help="segundos hasta dar un arranque por colgado")
+    bisect.add_argument("--parallel", type=int, help="arranques simultáneos (por defecto, los que quepan en RAM)")
+    bisect.add_argument("--ram", type=float, default=Bisect.HEAP_MB / 1024, help="GB de heap por arranque")
+    
+    pregen = commands.add_parser("pregen", help="pregenera el mundo sin interfaz ni túnel")
+    pregen.add_argument("server")
+    pregen.add_argument("--radius", type=int, default=1000, help="radio en bloques (por defecto 1000)")
+    pregen.add_argument("--center", default="0,0", help="centro x,z en bloques (por defecto 0,0)")
+    pregen.add_argument("--ram", type=float, help="GB de heap (por defecto, el sugerido)")
+    return parser.parse_args(argv)
+
+def emit(args, data: dict):
+    """Resultado de un subcomando como una línea JSON (solo con --json)."""
+    if getattr(args, "json", False):
+        print(json.dumps(data, ensure_ascii=False, default=str), flush=True)
+
+def fail(args, message: str, **data) -> int:
+    """Informa de un error (en JSON con --json) y devuelve el código de salida 1."""
+    if getattr(args, "json", False):
+        emit(args, dict(data, ok=False, error=message))
+    else:
+        Log.error(message)
+    return 1
+
+def run_create(args) -> int:
+    if args.manifest:
+        try:
+            manifest = Batch.load(args.manifest)
+        except Exception as e:
+            return fail(args, f"Manifiesto no válido: {e}")
+        
+        def _done(result):
+            if args.json:
+                emit(args, result)
+            elif result["ok"]:
+                Log.success(f"{result['name']}: {result['type']} {result['version']} ({result['seconds']:.1f}s)")
             else:
-                main()
-        else:
-            main()
-    elif action == "🗑️   Eliminar servidor":
-        delete_server()
-        main()
+                Log.error(f"{result['name']}: {result['error']}")
+        
+        results = Batch.run(manifest["servers"], args.workers or manifest["workers"], _done)
+        failed = sum(1 for r in results if not r["ok"])
+        if not args.json:
+            Log.info(f"{len(results) - failed} creados · {failed} con error")
+        return 1 if failed else 0
+    
+    if not args.server or not args.type:
+        return fail(args, "Indica el nombre y --type (o --from MANIFIESTO)")
+    properties = {}
+    for item in args.property:
+        key, sep, value = item.partition("=")
+        if not sep:
+            return fail(args, f"--property debe tener la forma clave=valor: '{item}'")
+        properties[key.strip()] = value.strip()
+    result = install_server(args.server, args.type, args.version, properties, quiet=args.json)
+    if args.json:
+        emit(args, result)
+    elif result["ok"]:
+        Log.success(f"Servidor '{result['name']}' creado: {result['type']} {result['version']}")
+    else:
+        Log.error(result["error"])
+    return 0 if result["ok"] else 1
+
+def run_start(args) -> int:
+    names = args.server
+    for name in names:
+        if Server.running_pid(name):
+            return fail(args, f"'{name}' ya está en marcha", name=name)
+    try:
+        cpus = Instances.parse_cpus(args.cpus) if args.cpus else None
+    except ValueError:
+        return fail(args, f"--cpus no válido: '{args.cpus}'")
+    
+    if args.detach or len(names) > 1:
+        # Se planifica aquí, de una vez, para que los puertos y las CPUs no se pisen entre sí
+        plans = Instances.plan(names)
+        for plan in plans:
+            if plan["too_small"]:
+                return fail(args, Instances.no_room(plan), name=plan["name"])
+        if not args.json:
+            for other in plans[0]["resize"]:
+                Log.warn(f"'{other}' tiene ahora menos CPUs: reinícialo (!restart) para ajustar sus hilos de GC/JIT")
+        for plan in plans:
+            name = plan["name"]
+            cmd = [sys.executable, os.path.abspath(__file__), "start", name, "--tunnel", args.tunnel,
+                   "--ram", str(args.ram or plan["heap_mb"] / 1024)]
+            if cpus or plan["cpus"]:
+                cmd += ["--cpus", Instances.format_cpus(cpus or plan["cpus"])]
+            if args.profile:
+                cmd += ["--profile", args.profile]
+            log_path = os.path.join(Server.path(name), Server.META_DIR, "detached.log")
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            with open(log_path, "ab") as log:
+                proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                        start_new_session=True)
+            emit(args, {"name": name, "pid": proc.pid, "port": plan["port"], "cpus": cpus or plan["cpus"],
+                        "heap_mb": int(args.ram * 1024) if args.ram else plan["heap_mb"], "log": log_path})
+            if not args.json:
+                pinned = f" · CPUs {Instances.format_cpus(cpus or plan['cpus'])}" if cpus or plan["cpus"] else ""
+                Log.success(f"'{name}' arrancando en segundo plano (PID {proc.pid}) · puerto {plan['port']}{pinned}")
+                Log.info(f"Salida en {log_path}")
+        return 0
+    
+    name = names[0]
+    mods = Server.get_info(name)["mods"]
+    if cpus:
+        # Lanzado con su parte ya decidida (varios a la vez, o a mano)
+        others = Instances.running(exclude=(name,))
+        # La RAM sale de lo que no reservan los demás, como en `Instances.plan`
+        budget = Resources.suggest(mods, Instances.free_mb(others), min(float(len(cpus)), Resources.cpu_limit()))
+        heap_mb = int(args.ram * 1024) if args.ram else budget["heap_mb"]
+        if heap_mb < Resources.MIN_HEAP_MB:
+            return fail(args, Instances.no_room({"name": name, "budget": budget}), name=name)
+        if heap_mb + sum(budget["overhead_mb"].values()) > budget["limit_mb"]:
+            return fail(args, f"'{name}' pide {heap_mb}MB de heap y solo quedan {budget['limit_mb']}MB "
+                              f"libres (contando la memoria fuera del heap)", name=name)
+        port = Instances.assign_port(name, {o["port"] for o in others.values() if o.get("port")})
+        shared = True
     else:
-        run_server(action)
+        plan = Instances.plan([name])[0]
+        if plan["too_small"]:
+            return fail(args, Instances.no_room(plan), name=name)
+        port, cpus, budget, shared = plan["port"], plan["cpus"], plan["budget"], bool(plan["others"])
+        for other in plan["resize"]:
+            Log.warn(f"'{other}' tiene ahora menos CPUs: reinícialo (!restart) para ajustar sus hilos de GC/JIT")
+    heap_mb = int(args.ram * 1024) if args.ram else budget["heap_mb"]
+    profile = args.profile or Launch.profile_for(Server.path(name))
+    os.chdir(Server.path(name))
+    tunnel = None if args.tunnel == "ninguno" else Tunnel.start(args.tunnel, port, shared)
+    serve(name, heap_mb, profile, budget, tunnel, port, cpus)
+    return 0
+
+def run_stop(args) -> int:
+    pid = Server.running_pid(args.server)
+    if not pid:
+        return fail(args, "El servidor no está en marcha", name=args.server, stopped=False)
+    # SIGTERM equivale a Ctrl+C en el gestor: `stop` en la consola, guardado y salida
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + args.timeout
+    forced = False
+    while Server.running_pid(args.server) == pid:
+        if time.monotonic() >= deadline and not forced:
+            os.kill(pid, signal.SIGTERM)  # Segundo aviso: el gestor mata la JVM
+            deadline = time.monotonic() + 15
+            forced = True
+        elif time.monotonic() >= deadline:
+            break
+        time.sleep(0.2)
+    stopped = Server.running_pid(args.server) != pid
+    emit(args, {"name": args.server, "stopped": stopped, "forced": forced})
+    if not args.json:
+        if stopped:
+            Log.success(f"Servidor '{args.server}' detenido" + (" (forzado)" if forced else ""))
+        else:
+            Log.error("El gestor no responde")
+    return 0 if stopped else 1
+
+def run_command(args) -> int:
+    """Ejecuta un subcomando sin menús. Devuelve el código de salida."""
+    if args.command == "create":
+        return run_create(args)
+    names = getattr(args, "server", None) or []
+    for name in names if isinstance(names, list) else [names]:
+        if name not in Server.get_all():
+            return fail(args, f"No existe el servidor '{name}'", name=name)
+    if args.command == "start":
+        return run_start(args)
+    if args.command == "stop":
+        return run_stop(args)
+    if args.command == "list":
+        if not args.json:
+            Server.display_list()
+            return 0
+        entries = ServerIndex.entries()
+        live = Server.live_status([e["name"] for e in entries])
+        running = Instances.running()
+        for entry in entries:
+            entry.pop("sig", None)
+            emit(args, dict(entry, port=Server.port(entry["name"]), pid=Server.running_pid(entry["name"]),
+                            instance=running.get(entry["name"]), status=live.get(entry["name"])))
+        return 0
+    if args.command == "delete":
+        if not args.yes:
+            return fail(args, "Borrar es irreversible: repite con --yes", name=args.server)
+        if Server.running_pid(args.server):
+            return fail(args, "El servidor está en marcha; detenlo antes de eliminarlo", name=args.server)
+        result = remove_server(args.server, args.backup)
+        emit(args, result)
+        if not args.json:
+            Log.success(f"Servidor '{args.server}' eliminado")
+        return 0
+    if args.command == "backup":
+        if args.list:
+            for m in Backup.list(args.server):
+                print(f"  {m['id']}  {m['reason']:<16} {format_size(m['size']):>10}  {C.DIM}{Backup.summary(m)}{C.RESET}")
+        elif args.restore:
+            try:
+                result = Backup.restore(args.server, args.restore)
+            except KeyError:
+                Log.error(f"No existe la copia '{args.restore}'")
+                return 1
+            except BackupError as e:
+                Log.error(str(e))
+                return 1
+            Log.success(f"Restaurada: {result['restored']} ficheros reescritos, {result['unchanged']} intactos")
+        else:
+            try:
+                manifest = Backup.take(args.server)
+            except BackupError as e:
+                Log.error(str(e))
+                return 1
+            Log.success(f"Copia {manifest['id']}: {Backup.summary(manifest)}")
+        return 0
+    if args.command == "mods":
+        try:
+            if args.mods_command == "add":
+                target = Mods.target(args.server)
+                if not target:
+                    Log.error("Este tipo de servidor no admite mods ni plugins")
+                    return 1
+                versions, missing = [], []
+                for project in args.projects:
+                    plan = Mods.resolve(project, target)
+                    versions += [v for v in plan["versions"] if v["project_id"] not in {x["project_id"] for x in versions}]
+                    missing += plan["missing"]
+                if missing:
+                    Log.error(f"Sin versión compatible para: {', '.join(missing)}")
+                    return 1
+                for entry in Mods.install(args.server, versions):
+                    Log.success(f"{entry['file']} ({entry['version']})")
+                return 0
+            updates = Mods.check_updates()
+            for u in updates:
+                print(f"  {u['server']:<16} {u['file']} → {u['new_file']}")
+            if not updates:
+                Log.success("Todo está al día")
+            elif args.apply:
+                Log.success(f"{Mods.apply_updates(updates)} fichero(s) actualizados")
+            return 0
+        except ModError as e:
+            return fail(args, str(e))
+    if args.command == "bisect":
+        bisect = Bisect(args.server, args.timeout, args.parallel, int(args.ram * 1024),
+                        on_result=lambda r: print(f"  {r['mods']:>4} mods · {r['state']:<5} {r['seconds']:.0f}s"))
+        try:
+            result = bisect.run()
+        except ModError as e:
+            return fail(args, str(e))
+        describe_bisect(result)
+        return 0 if result["verdict"] == "ok" else 1
+    if args.command == "world":
+        report = World.analyze(args.server, args.prune)
+        World.print_report(report)
+        if args.prune is not None:
+            if World.in_use(args.server):
+                Log.error("El mundo está abierto por un servidor en marcha")
+                return 1
+            warning = World.pregen_warning(args.server)
+            if warning and any(d["prunable"] for d in report):
+                Log.warn(warning)
+            result = World.prune(report)
+            Log.success(f"{result['chunks_removed']} chunks podados · {format_size(result['freed'])} liberados")
+        return 0
+    if args.command == "pregen":
+        try:
+            center = tuple(int(v) for v in args.center.split(","))
+        except ValueError:
+            Log.error("--center debe tener la forma x,z")
+            return 1
+        heap_mb = int(args.ram * 1024) if args.ram else None
+        return 0 if Pregen.run(args.server, args.radius, center, heap_mb) else 1
+    if args.command == "bench":
+        if args.bench_command == "boot":
+            budget = Resources.suggest(Server.get_info(args.server)["mods"])
+            if not args.ram and budget["too_small"]:
+                return fail(args, Resources.no_room(budget))
+            heap_mb = int(args.ram * 1024) if args.ram else budget["heap_mb"]
+            results = Bench.boot(args.server, args.runs, args.mode, heap_mb, args.timeout, args.profile)
+            return 0 if all(r["ok"] for r in results) else 1
+        records = BootHistory.load(args.server)
+        if not records:
+            Log.warn("Todavía no hay arranques registrados")
+            return 0
+        Bench.print_stats(records)
+    return 0
+
+Startup.record("carga del módulo", time.perf_counter() - _T0)
 
 if __name__ == "__main__":
+    args = parse_args()
+    startup()
+    if args.profile_startup:
+        sys.exit(0 if profile_startup(args.budget_ms) else 1)
+    if args.command:
+        sys.exit(run_command(args))
+    Provisioner.start()
     try:
         main()
     except KeyboardInterrupt:
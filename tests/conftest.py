@@ -0,0 +1,20 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "create-codespaces-minecraft-server.py")
+
+
+@pytest.fixture
+def mcsm(tmp_path, monkeypatch):
+    """El script cargado como módulo, con Minecraft-servers/ dentro de tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    loader = importlib.machinery.SourceFileLoader("mcsm", SCRIPT)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader("mcsm", loader))
+    monkeypatch.setitem(sys.modules, "mcsm", module)
+    loader.exec_module(module)
+    return module
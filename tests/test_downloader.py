@@ -0,0 +1,86 @@
+"""Descargas por rangos contra un servidor HTTP local."""
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+DATA = bytes(range(256)) * 4096  # 1 MB
+
+
+class Files(BaseHTTPRequestHandler):
+    """Sirve DATA con Range y ETag; `cut_once` corta la primera respuesta tras N bytes."""
+    protocol_version = "HTTP/1.1"
+    served = 0
+    cut_once = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, len(DATA) - 1
+        m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), end) if m.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        body = DATA[start:end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        cut = type(self).cut_once
+        if cut is not None and len(body) > cut:
+            type(self).cut_once = None
+            body = body[:cut]
+            self.close_connection = True
+        type(self).served += len(body)
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def url(mcsm):
+    Files.served = 0
+    Files.cut_once = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Files)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/server.jar"
+    server.shutdown()
+
+
+def test_resumes_part_file(mcsm, url, tmp_path):
+    dest = str(tmp_path / "server.jar")
+    checksum = f"sha256:{hashlib.sha256(DATA).hexdigest()}"
+    assert mcsm.Downloader(url, dest, checksum, quiet=True).warm(300000) == 300000
+    with open(f"{dest}.part.json") as f:
+        assert json.load(f)["ranges"][0][2] == 300000
+
+    Files.served = 0
+    assert mcsm.Downloader(url, dest, checksum, quiet=True).run() == dest
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert Files.served == 1 + len(DATA) - 300000  # Sonda de 1 byte y lo que faltaba
+    assert not os.path.exists(f"{dest}.part") and not os.path.exists(f"{dest}.part.json")
+
+
+def test_retries_a_cut_connection(mcsm, url, tmp_path, monkeypatch):
+    monkeypatch.setattr(mcsm.time, "sleep", lambda seconds: None)
+    dest = str(tmp_path / "server.jar")
+    Files.cut_once = 100000
+    mcsm.Downloader(url, dest, f"sha1:{hashlib.sha1(DATA).hexdigest()}", segments=1, quiet=True).run()
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_checksum_mismatch(mcsm, url, tmp_path):
+    dest = str(tmp_path / "server.jar")
+    with pytest.raises(mcsm.DownloadError, match="sha256 no coincide"):
+        mcsm.Downloader(url, dest, "sha256:" + "0" * 64, quiet=True).run()
+    assert not any(os.path.exists(p) for p in (dest, f"{dest}.part", f"{dest}.part.json"))
@@ -0,0 +1,63 @@
+"""Detección del jar del servidor por su contenido."""
+import os
+import zipfile
+
+import pytest
+
+
+def make_jar(path, main=None, files=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = "Manifest-Version: 1.0\n" + (f"Main-Class: {main}\n" if main else "")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("META-INF/MANIFEST.MF", manifest)
+        for name, data in (files or {}).items():
+            z.writestr(name, data)
+
+
+def vanilla(path, version="1.20.4"):
+    make_jar(path, "net.minecraft.bundler.Main",
+             {"META-INF/versions.list": f"abc\t{version}\tversions/{version}/server-{version}.jar\n"})
+
+
+@pytest.fixture
+def server_dir(mcsm):
+    path = mcsm.Server.path("srv")
+    os.makedirs(path)
+    return path
+
+
+def test_forge_1_16_beats_its_vanilla_jar(mcsm, server_dir):
+    make_jar(os.path.join(server_dir, "minecraft_server.1.16.5.jar"), "net.minecraft.server.MinecraftServer",
+             {"version.json": '{"id": "1.16.5"}'})
+    make_jar(os.path.join(server_dir, "forge-1.16.5-36.2.39.jar"), "net.minecraftforge.server.ServerMain")
+    make_jar(os.path.join(server_dir, "libraries", "x.jar"))
+
+    assert mcsm.Launch.find_jar(server_dir) == "forge-1.16.5-36.2.39.jar"
+    assert mcsm.Server.get_info("srv")["type"] == "Forge"
+
+
+def test_fabric_launcher_beats_server_jar(mcsm, server_dir):
+    vanilla(os.path.join(server_dir, "server.jar"))
+    make_jar(os.path.join(server_dir, "fabric-server-launch.jar"), "net.fabricmc.installer.ServerLauncher",
+             {"install.properties": "fabric-loader-version=0.15.7\ngame-version=1.20.4\n"})
+
+    assert mcsm.Launch.find_jar(server_dir) == "fabric-server-launch.jar"
+    assert mcsm.Server.get_info("srv")["type"] == "Fabric"
+
+
+def test_paper(mcsm, server_dir):
+    make_jar(os.path.join(server_dir, "paper-1.20.4-496.jar"), "io.papermc.paperclip.Main",
+             {"META-INF/versions.list": "abc\t1.20.4\tpaper-1.20.4.jar\n"})
+    make_jar(os.path.join(server_dir, "plugins", "chunky.jar"))
+
+    assert mcsm.Launch.find_jar(server_dir) == "paper-1.20.4-496.jar"
+    info = mcsm.JarIndex.read(os.path.join(server_dir, "paper-1.20.4-496.jar"))
+    assert (info["type"], info["version"]) == ("Paper", "1.20.4")
+
+
+def test_vanilla(mcsm, server_dir):
+    vanilla(os.path.join(server_dir, "server.jar"))
+    make_jar(os.path.join(server_dir, "some-library.jar"))
+
+    assert mcsm.Launch.find_jar(server_dir) == "server.jar"
+    assert mcsm.Server.get_info("srv")["type"] == "Vanilla"
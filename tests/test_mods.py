@@ -0,0 +1,186 @@
+"""Actualización de mods contra un índice Modrinth local."""
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+
+def jar(project, number):
+    return f"PK {project} {number}".encode() * 64
+
+
+def version(base, project, number, data=None, dependencies=()):
+    data = data if data is not None else jar(project, number)
+    filename = f"{project}-{number}.jar"
+    return {
+        "id": f"{project}-{number}", "project_id": project, "version_number": number,
+        "loaders": ["fabric"], "game_versions": ["1.20.1"], "dependencies": list(dependencies),
+        "files": [{"url": f"{base}/files/{filename}", "filename": filename, "primary": True,
+                   "hashes": {"sha1": hashlib.sha1(data).hexdigest(),
+                              "sha512": hashlib.sha512(data).hexdigest()}}],
+    }
+
+
+class Index(BaseHTTPRequestHandler):
+    """Lo justo de la API v2: versiones, actualizaciones por hash y descarga de ficheros."""
+    versions = {}
+    files = {}
+    hits = []  # (método, ruta, cuerpo JSON)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, code: int = 200):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.hits.append(("GET", path, None))
+        match = re.match(r"/project/([^/]+)/version$", path)
+        if match:
+            return self._send(json.dumps(self.versions.get(match.group(1), [])).encode())
+        match = re.match(r"/version/([^/]+)$", path)
+        if match:
+            found = [v for vs in self.versions.values() for v in vs if v["id"] == match.group(1)]
+            return self._send(json.dumps(found[0]).encode() if found else b"{}", 200 if found else 404)
+        if path.startswith("/files/") and path[7:] in self.files:
+            return self._send(self.files[path[7:]])
+        self._send(b"{}", 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.hits.append(("POST", self.path, body))
+        if self.path != "/version_files/update":
+            return self._send(b"{}", 404)
+        latest = {}
+        for vs in self.versions.values():
+            for v in vs:
+                sha1 = v["files"][0]["hashes"]["sha1"]
+                if sha1 in body["hashes"]:
+                    latest[sha1] = vs[0]
+        self._send(json.dumps(latest).encode())
+
+
+@pytest.fixture
+def index(mcsm, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Index)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    mcsm.base = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setenv("MODRINTH_API", mcsm.base)
+    yield mcsm
+    server.shutdown()
+
+
+def publish(base, project, number, data=None, dependencies=()):
+    v = version(base, project, number, data, dependencies)
+    Index.versions.setdefault(project, []).insert(0, v)
+    Index.files[v["files"][0]["filename"]] = data if data is not None else jar(project, number)
+    return v
+
+
+def installed(mcsm, name):
+    return sorted(os.listdir(os.path.join(mcsm.Server.path(name), "mods")))
+
+
+def setup_server(mcsm, name, projects, game_version="1.20.1", clear=True):
+    if clear:
+        Index.versions.clear()
+        Index.files.clear()
+    mcsm.Server.save_meta(name, type="Fabric", version=game_version)
+    target = {"loaders": ["fabric"], "game_version": "1.20.1"}
+    for project in projects:
+        publish(mcsm.base, project, "1.0")
+    versions = [v for p in projects for v in mcsm.Mods.resolve(p, target)["versions"]]
+    mcsm.Mods.install(name, versions)
+    return [{"server": name, "file": f"mods/{p}-1.0.jar", "new_file": f"{p}-2.0.jar"} for p in projects]
+
+
+def test_apply_updates_replaces_old_jars(index):
+    mcsm = index
+    updates = setup_server(mcsm, "srv", ["sodium", "lithium"])
+    for u, project in zip(updates, ["sodium", "lithium"]):
+        u["version"] = publish(mcsm.base, project, "2.0")
+
+    assert mcsm.Mods.apply_updates(updates) == 2
+    assert installed(mcsm, "srv") == ["lithium-2.0.jar", "sodium-2.0.jar"]
+    meta = mcsm.Server.load_meta("srv")["installed_mods"]
+    assert {entry["version"] for entry in meta.values()} == {"2.0"}
+
+
+def test_apply_updates_leaves_server_untouched_on_bad_hash(index):
+    mcsm = index
+    updates = setup_server(mcsm, "srv", ["sodium", "lithium"])
+    updates[0]["version"] = publish(mcsm.base, "sodium", "2.0")
+    # El índice publica un hash que no corresponde al fichero servido
+    bad = publish(mcsm.base, "lithium", "2.0")
+    Index.files[bad["files"][0]["filename"]] = b"corrupto" * 64
+    updates[1]["version"] = bad
+
+    with pytest.raises(mcsm.ModError):
+        mcsm.Mods.apply_updates(updates)
+    assert installed(mcsm, "srv") == ["lithium-1.0.jar", "sodium-1.0.jar"]
+    meta = mcsm.Server.load_meta("srv")["installed_mods"]
+    assert {entry["version"] for entry in meta.values()} == {"1.0"}
+
+
+def test_resolve_walks_required_dependencies(index):
+    mcsm = index
+    Index.versions.clear()
+    Index.hits.clear()
+    cloth = publish(mcsm.base, "cloth", "1.1")
+    publish(mcsm.base, "fabric-api", "0.9", dependencies=[
+        {"version_id": cloth["id"], "dependency_type": "required"}])
+    publish(mcsm.base, "sodium", "2.0", dependencies=[
+        {"project_id": "fabric-api", "dependency_type": "required"},
+        {"project_id": "iris", "dependency_type": "optional"},
+        {"project_id": "gone", "dependency_type": "required"},
+    ])
+
+    plan = mcsm.Mods.resolve("sodium", {"loaders": ["fabric"], "game_version": "1.20.1"})
+    assert sorted(v["project_id"] for v in plan["versions"]) == ["cloth", "fabric-api", "sodium"]
+    assert plan["missing"] == ["gone"]
+    # La opcional no se consulta; la fijada por version_id va a /version/{id}
+    paths = [path for _, path, _ in Index.hits]
+    assert "/project/iris/version" not in paths
+    assert f"/version/{cloth['id']}" in paths
+
+
+def test_check_updates_batches_by_loader_and_version(index):
+    mcsm = index
+    setup_server(mcsm, "a", ["sodium", "lithium"])
+    setup_server(mcsm, "b", ["sodium"], clear=False)
+    mcsm.Server.save_meta("c", type="Fabric", version="1.19.4")
+    os.makedirs(os.path.join(mcsm.Server.path("c"), "mods"))
+    with open(os.path.join(mcsm.Server.path("c"), "mods", "lithium-1.0.jar"), "wb") as f:
+        f.write(jar("lithium", "1.0"))
+    for name in ("a", "b"):
+        with open(os.path.join(mcsm.Server.path(name), "mods", "unknown.jar"), "wb") as f:
+            f.write(b"no publicado")
+    new_sodium = publish(mcsm.base, "sodium", "2.0")
+    Index.hits.clear()
+
+    updates = mcsm.Mods.check_updates()
+
+    posts = [body for method, path, body in Index.hits if method == "POST"]
+    assert len(posts) == 2  # 1.20.1 (a y b juntos) y 1.19.4
+    by_version = {p["game_versions"][0]: p for p in posts}
+    assert sorted(by_version) == ["1.19.4", "1.20.1"]
+    assert len(by_version["1.20.1"]["hashes"]) == 3  # sodium (de a y b, una vez), lithium, unknown
+    assert sorted((u["server"], u["file"], u["new_file"]) for u in updates) == [
+        ("a", "mods/sodium-1.0.jar", "sodium-2.0.jar"),
+        ("b", "mods/sodium-1.0.jar", "sodium-2.0.jar"),
+    ]
+    assert all(u["version"]["id"] == new_sodium["id"] for u in updates)